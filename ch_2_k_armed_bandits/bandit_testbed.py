@@ -0,0 +1,196 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+# Softmax along axis, shifted by the max first (log-sum-exp trick) so large preferences can't overflow
+def softmax(H, axis=-1):
+	exp_H = np.exp(H - np.max(H, axis=axis, keepdims=True))
+	return exp_H / np.sum(exp_H, axis=axis, keepdims=True)
+
+# Runs the k-armed bandit testbed for every run at once
+# Q, N and the bandit means are (params, runs, K) arrays, and each iteration advances all runs in one vectorized step
+# The update rules follow the scalar scripts (k-bandits.py, k_bandit_non_stationary.py,
+# k_bandits_upper_bound_confidence.py and k_bandits_gradient_ascent.py)
+#
+# A sweep over one hyperparameter, eg. sweep=("eps", [0, 0.01, 0.1, 0.5]), adds the leading params axis
+# so every setting advances together. With common_random set, every setting sees the same bandits,
+# random walks, reward noise and exploration draws, which cuts the variance between their curves
+class BanditTestbed:
+
+	EPSILON_GREEDY = 0	# greedy when eps = 0
+	UCB = 1
+	GRADIENT = 2
+	METHODS = (EPSILON_GREEDY, UCB, GRADIENT)
+
+	# Hyperparameters and their defaults, any of these can be swept
+	DEFAULTS = {
+		"eps": 0,				# exploration rate for EPSILON_GREEDY
+		"c": 2,					# confidence level for UCB
+		"alpha": 0,				# step size, 0 means 1/(iter+1) like the scripts
+		"initial_Q": 0,			# initial estimate (or preference for GRADIENT)
+		"bandit_mean": 0,		# mean of the true action values
+		"reward_var": 1,		# scale of the reward noise
+		"walk_var": 0,			# scale of the random walk, 0 for a stationary bandit
+	}
+
+	def __init__(self, runs, k, method=EPSILON_GREEDY, sweep=None, common_random=True, **kwargs):
+
+		if method not in BanditTestbed.METHODS:
+			raise ValueError(f"method must be one of {BanditTestbed.METHODS}, got {method}")
+
+		self.runs = runs
+		self.k = k
+		self.method = method
+		self.sweep = sweep
+		self.common_random = common_random
+		self.sample_average = kwargs.pop("sample_average", False)	# use 1/N(a) as the step size instead
+		self.rng = np.random.default_rng(kwargs.pop("seed", None))
+
+		# Every hyperparameter is stored as a (params,) array, so it broadcasts over the params axis
+		params = { name: kwargs.pop(name, default) for name, default in BanditTestbed.DEFAULTS.items() }
+
+		if len(kwargs) > 0:
+			raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+		if sweep is None:
+			self.params = 1
+		else:
+			name, values = sweep
+			if name not in BanditTestbed.DEFAULTS:
+				raise KeyError(f"Can only sweep one of {list(BanditTestbed.DEFAULTS)}, got {name}")
+			self.params = len(values)
+			params[name] = values
+
+		for name, value in params.items():
+			setattr(self, name, np.broadcast_to(np.asarray(value, dtype=float), (self.params,)).copy())
+
+		# Random draws are shared over the params axis with common random numbers
+		self._draws = 1 if common_random else self.params
+
+		self.reset()
+
+	# Draws new bandits and resets every estimate
+	def reset(self):
+		z = self.rng.normal(loc=0, scale=1, size=(self._draws, self.runs, self.k))
+		self.bandit = self.bandit_mean[:, np.newaxis, np.newaxis] + z
+		self.Q = np.broadcast_to(self.initial_Q[:, np.newaxis, np.newaxis], (self.params, self.runs, self.k)).copy()
+		self.N = np.zeros((self.params, self.runs, self.k))
+		self.avg_reward = np.zeros((self.params, self.runs))	# reward baseline for GRADIENT
+		self.probs = None	# softmax of Q for GRADIENT, cached from get_actions for update
+		self.iter = 0
+
+	# Returns the action for every run of every setting, shape (params, runs)
+	def get_actions(self):
+
+		if self.method == BanditTestbed.EPSILON_GREEDY:
+			actions = np.argmax(self.Q, axis=2)
+			explore = self.rng.random((self._draws, self.runs)) < self.eps[:, np.newaxis]
+			random_actions = self.rng.integers(self.k, size=(self._draws, self.runs))
+			return np.where(explore, random_actions, actions)
+
+		if self.method == BanditTestbed.UCB:
+			# Counts start at 1 like the scalar script, and log(0) is avoided on the first iteration
+			bound = self.Q + self.c[:, np.newaxis, np.newaxis] * np.sqrt( np.log(max(self.iter, 1)) / (self.N + 1) )
+			return np.argmax(bound, axis=2)
+
+		# Sample each run's action from the softmax over its preferences, update reuses the probs
+		self.probs = softmax(self.Q, axis=2)
+		u = self.rng.random((self._draws, self.runs, 1))
+		return np.minimum( np.argmax(u < np.cumsum(self.probs, axis=2), axis=2), self.k - 1 )
+
+	# Samples a reward for every run from the bandit arm it pulled
+	def get_rewards(self, actions):
+		means = np.take_along_axis(self.bandit, actions[:, :, np.newaxis], axis=2)[:, :, 0]
+		noise = self.rng.normal(loc=0, scale=1, size=(self._draws, self.runs))
+		return means + self.reward_var[:, np.newaxis] * noise
+
+	# Returns the step size for every run, shape (params, runs)
+	def _get_step(self, actions):
+		if self.sample_average:
+			return 1 / np.take_along_axis(self.N, actions[:, :, np.newaxis], axis=2)[:, :, 0]
+
+		alpha = np.where(self.alpha == 0, 1 / (self.iter + 1), self.alpha)
+		return np.broadcast_to(alpha[:, np.newaxis], (self.params, self.runs))
+
+	# Updates every run's estimates from the action it took and the reward it got
+	def update(self, actions, rewards):
+		idx = actions[:, :, np.newaxis]
+		np.put_along_axis(self.N, idx, np.take_along_axis(self.N, idx, axis=2) + 1, axis=2)
+		step = self._get_step(actions)
+
+		if self.method == BanditTestbed.GRADIENT:
+			self.avg_reward += 1 / (self.iter + 1) * (rewards - self.avg_reward)
+
+			# Q hasn't changed since get_actions, so its softmax is still valid
+			if self.probs is None:
+				self.probs = softmax(self.Q, axis=2)
+
+			# Raise the preference of the action taken if the reward beat the baseline, lower the rest
+			delta = step * (rewards - self.avg_reward)
+			self.Q -= delta[:, :, np.newaxis] * self.probs
+			np.put_along_axis(self.Q, idx, np.take_along_axis(self.Q, idx, axis=2) + delta[:, :, np.newaxis], axis=2)
+			self.probs = None
+
+		else:
+			Q_a = np.take_along_axis(self.Q, idx, axis=2)[:, :, 0]
+			np.put_along_axis(self.Q, idx, (Q_a + step * (rewards - Q_a))[:, :, np.newaxis], axis=2)
+
+	# Performs a random walk on the bandits of every run
+	def update_bandits(self):
+		if np.any(self.walk_var > 0):
+			walk = self.rng.normal(loc=0, scale=1, size=(self._draws, self.runs, self.k))
+			self.bandit = self.bandit + self.walk_var[:, np.newaxis, np.newaxis] * walk
+
+	# Advances every run by one iteration, returns the rewards and whether the best arm was pulled
+	def step(self):
+		actions = self.get_actions()
+		rewards = self.get_rewards(actions)
+		optimal = actions == np.argmax(self.bandit, axis=2)
+
+		self.update(actions, rewards)
+		self.update_bandits()
+		self.iter += 1
+
+		return rewards, optimal
+
+	# Runs every run for the given iterations, returns the avg reward and optimal action rate per iteration
+	# Results are (params, iterations) for a sweep, (iterations,) otherwise
+	def run(self, iterations, print_every=None):
+
+		avg_rewards = np.zeros((self.params, iterations))
+		optimal_rate = np.zeros((self.params, iterations))
+
+		for iter in range(iterations):
+
+			if print_every and iter % print_every == 0:
+				print(f"Iteration {iter+1} of {iterations}")
+
+			rewards, optimal = self.step()
+			avg_rewards[:, iter] = np.mean(rewards, axis=1)
+			optimal_rate[:, iter] = np.mean(optimal, axis=1)
+
+		if self.sweep is None:
+			return avg_rewards[0], optimal_rate[0]
+
+		return avg_rewards, optimal_rate
+
+# Reproduces the epsilon comparison of k-bandits.py, with every epsilon swept in one pass
+def main():
+
+	NUM_BANDITS = 2000
+	NUM_ITERATIONS = 1000
+	K = 10
+	EPSILON = [0, 0.01, 0.1, 0.5]
+	WALK_VAR = 0.01
+
+	testbed = BanditTestbed(NUM_BANDITS, K, BanditTestbed.EPSILON_GREEDY, sweep=("eps", EPSILON), walk_var=WALK_VAR)
+	avg_rewards, _ = testbed.run(NUM_ITERATIONS, print_every=100)
+
+	for eps, curve in zip(EPSILON, avg_rewards):
+		plt.plot(curve, label=str(eps))
+
+	plt.legend()
+	plt.show()
+
+if __name__ == "__main__":
+
+	main()
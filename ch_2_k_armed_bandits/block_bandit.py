@@ -0,0 +1,69 @@
+import numpy as np
+
+# A k-armed bandit whose randomness is drawn in blocks instead of one call per step
+#
+# Every block_size steps, one numpy Generator call each draws the random walk of every arm
+# (cumsum'd into the means at every step of the block), the reward noise, and the uniforms and
+# random arms used for exploration. A step then costs an array index instead of an RNG call.
+# Each bandit owns its Generator, so runs are reproducible from their seed and can be simulated
+# in parallel without sharing a stream
+class BlockBandit:
+
+	def __init__(self, k, seed=None, mean=0, reward_var=1, walk_var=0, block_size=4096):
+
+		self.k = k
+		self.reward_var = reward_var	# scale of the reward noise
+		self.walk_var = walk_var		# scale of the random walk, 0 for a stationary bandit
+		self.block_size = block_size
+		self.rng = np.random.default_rng(seed)
+
+		self.bandit = mean + self.rng.normal(loc=0, scale=1, size=k)
+		self._fill()
+
+	# Draws the next block, row ii of _means holds the bandit means ii steps from now
+	def _fill(self):
+
+		if self.walk_var > 0:
+			walk = np.cumsum(self.rng.normal(loc=0, scale=self.walk_var, size=(self.block_size, self.k)), axis=0)
+			self._means = np.vstack([ self.bandit, self.bandit + walk[:-1] ])
+			self._next_bandit = self.bandit + walk[-1]
+		else:
+			self._means = np.broadcast_to(self.bandit, (self.block_size, self.k))
+			self._next_bandit = self.bandit
+
+		self._noise = self.rng.normal(loc=0, scale=self.reward_var, size=self.block_size)
+		self._uniform = self.rng.random(self.block_size)
+		self._random_action = self.rng.integers(self.k, size=self.block_size)
+		self._ii = 0
+
+	# Returns the current mean of every arm
+	def get_means(self):
+		return self._means[self._ii]
+
+	def get_optimal_action(self):
+		return np.argmax(self._means[self._ii])
+
+	# Samples this step's reward for the arm pulled
+	def get_reward(self, action):
+		return self._means[self._ii, action] + self._noise[self._ii]
+
+	# This step's uniform draw in [0,1), for exploration or sampling from a distribution
+	def get_uniform(self):
+		return self._uniform[self._ii]
+
+	# This step's uniformly random arm, for exploration
+	def get_random_action(self):
+		return self._random_action[self._ii]
+
+	# Advances to the next step, with the random walk applied, and draws a new block when this one runs out
+	def step(self):
+		self._ii += 1
+		if self._ii == self.block_size:
+			self.bandit = self._next_bandit
+			self._fill()
+
+# Yields a BlockBandit per run, each with its own stream spawned from seed
+# They're made lazily, so only the current run's block is held in memory
+def make_bandits(runs, k, seed=None, **kwargs):
+	for run_seed in np.random.SeedSequence(seed).spawn(runs):
+		yield BlockBandit(k, seed=run_seed, **kwargs)
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+from CurveAggregator import CurveAggregator
+
+# Contextual bandits with a linear model per arm (disjoint LinUCB / linear Thompson sampling)
+#
+# Each request comes with a context x of d features, and arm a's expected reward is x . theta_a.
+# Each arm keeps the inverse of its design matrix A_a = lam*I + sum(x x^T) and b_a = sum(r x),
+# so theta_a = A_a^-1 b_a. A_a^-1 is updated in place: Sherman-Morrison for a single context,
+# Woodbury for a batch of contexts on the same arm, so it's never inverted from scratch.
+# A batch of n contexts is scored against every arm at once, (n, d) x (d, K)
+class LinearBandit:
+
+	def __init__(self, k, d, lam=1, seed=None):
+		self.k = k
+		self.d = d
+		self.lam = lam						# ridge regularization, the prior precision of theta
+		self.rng = np.random.default_rng(seed)
+
+		self.A_inv = np.tile(np.eye(d) / lam, (k, 1, 1))	# (K, d, d)
+		self.b = np.zeros((k, d))
+		self.theta = np.zeros((k, d))
+		self.N = np.zeros(k)
+
+	# Returns the score of every arm for every context, shape (n, K)
+	def get_scores(self, X):
+		raise NotImplementedError(f'get_scores must be implemented by derived class of class: {self.__class__.__name__}')
+
+	# Returns the chosen arm for every context in X, shape (n,)
+	def get_actions(self, X):
+		return np.argmax(self.get_scores(np.atleast_2d(X)), axis=1)
+
+	# Updates every arm from the contexts it was pulled for and the rewards it got
+	def update(self, X, actions, rewards):
+		X = np.atleast_2d(X)
+		actions = np.atleast_1d(actions)
+		rewards = np.atleast_1d(rewards)
+
+		for a in np.unique(actions):
+			pulled = actions == a
+			X_a = X[pulled]
+
+			if len(X_a) == 1:
+				# Sherman-Morrison, A^-1 -= (A^-1 x)(A^-1 x)^T / (1 + x^T A^-1 x)
+				Ax = self.A_inv[a] @ X_a[0]
+				self.A_inv[a] -= np.outer(Ax, Ax) / (1 + X_a[0] @ Ax)
+			else:
+				# Woodbury, A^-1 -= A^-1 X^T (I + X A^-1 X^T)^-1 X A^-1
+				AX = self.A_inv[a] @ X_a.T
+				S = np.eye(len(X_a)) + X_a @ AX
+				self.A_inv[a] -= AX @ np.linalg.solve(S, AX.T)
+
+			self.b[a] += rewards[pulled] @ X_a
+			self.theta[a] = self.A_inv[a] @ self.b[a]
+			self.N[a] += len(X_a)
+
+# Scores each arm by its estimated reward plus alpha times the std of that estimate
+class LinUCB(LinearBandit):
+
+	def __init__(self, k, d, alpha=1, lam=1, seed=None):
+		LinearBandit.__init__(self, k, d, lam=lam, seed=seed)
+		self.alpha = alpha
+
+	def get_scores(self, X):
+		means = X @ self.theta.T
+		# x^T A_a^-1 x for every context and arm, shape (n, K)
+		variance = np.einsum("nd,kde,ne->nk", X, self.A_inv, X, optimize=True)
+		return means + self.alpha * np.sqrt(np.maximum(variance, 0))
+
+# Scores each arm with a theta sampled from its posterior N(theta_a, v^2 A_a^-1), one sample per context
+class LinearThompson(LinearBandit):
+
+	def __init__(self, k, d, v=1, lam=1, seed=None):
+		LinearBandit.__init__(self, k, d, lam=lam, seed=seed)
+		self.v = v
+
+	def get_scores(self, X):
+		L = np.linalg.cholesky(self.A_inv)		# (K, d, d)
+		z = self.rng.standard_normal((len(X), self.k, self.d))
+		# x . (theta_a + v L_a z) = x . theta_a + v (L_a^T x) . z
+		LX = np.einsum("kde,nd->nke", L, X, optimize=True)
+		return X @ self.theta.T + self.v * np.einsum("nke,nke->nk", LX, z)
+
+# A linear contextual environment, request contexts are unit vectors and rewards are x . theta_a + noise
+class LinearEnvironment:
+
+	def __init__(self, k, d, noise=0.1, seed=None):
+		self.k = k
+		self.d = d
+		self.noise = noise
+		self.rng = np.random.default_rng(seed)
+		self.theta = self.rng.normal(loc=0, scale=1, size=(k, d))
+
+	def get_contexts(self, n):
+		X = self.rng.normal(loc=0, scale=1, size=(n, self.d))
+		return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+	# Returns the reward of each action, and its expected regret against the best action, for every context
+	def get_rewards(self, X, actions):
+		means = X @ self.theta.T
+		chosen = means[np.arange(len(X)), actions]
+		rewards = chosen + self.rng.normal(loc=0, scale=self.noise, size=len(X))
+		return rewards, np.max(means, axis=1) - chosen
+
+# Runs the agent for the given batches of requests, returns the regret curve and decisions per second
+def run_agent(agent, env, batches, batch_size):
+
+	curve = CurveAggregator()
+	elapsed = 0
+
+	for iter in range(batches):
+		X = env.get_contexts(batch_size)
+
+		start = time.perf_counter()
+		actions = agent.get_actions(X)
+		elapsed += time.perf_counter() - start
+
+		rewards, regret = env.get_rewards(X, actions)
+
+		start = time.perf_counter()
+		agent.update(X, actions, rewards)
+		elapsed += time.perf_counter() - start
+
+		curve.Add(iter, regret)
+
+	return curve, batches * batch_size / elapsed
+
+def main():
+
+	K = 20
+	D = 16
+	BATCHES = 500
+	BATCH_SIZE = 32
+	SEED = 0
+
+	agents = {
+		"LinUCB": LinUCB(K, D, alpha=1, seed=SEED),
+		"Thompson": LinearThompson(K, D, v=0.3, seed=SEED),
+	}
+
+	for name, agent in agents.items():
+		env = LinearEnvironment(K, D, seed=SEED)	# every agent sees the same requests
+		curve, rate = run_agent(agent, env, BATCHES, BATCH_SIZE)
+		print(f"{name}: {rate:.0f} decisions/s, final regret {np.mean(curve.GetMean()[-50:]):.3f}")
+		plt.plot(curve.GetSteps(), curve.GetMean(), label=name)
+
+	plt.xlabel(f"Batch of {BATCH_SIZE} requests")
+	plt.ylabel("Average regret")
+	plt.legend()
+	plt.show()
+
+if __name__ == "__main__":
+
+	main()
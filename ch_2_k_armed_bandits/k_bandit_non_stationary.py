@@ -1,17 +1,12 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
-def generate_bandit(k):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+from CurveAggregator import CurveAggregator
 
-	return np.random.normal(loc=0, scale=1, size=(k))
-
-def update_bandit(bandit, mean=0, var=0.01):
-	
-	return bandit + np.random.normal(loc=mean, scale=var, size=(len(bandit)))
-
-def get_reward(mean, var=1):
-	
-	return np.random.normal(loc=mean, scale=var)
+from block_bandit import make_bandits
 
 def update_Q(iter, reward, q_i, alpha=0):
 
@@ -20,10 +15,11 @@ def update_Q(iter, reward, q_i, alpha=0):
 	else:
 		return q_i + alpha * (reward - q_i)
 	
-def get_action(Q, epsilon=0):	
+# Exploration draws come from the bandit's pregenerated block
+def get_action(Q, bandit, epsilon=0):	
 	
-	if np.random.rand() < epsilon:
-		return np.random.randint(len(Q))
+	if bandit.get_uniform() < epsilon:
+		return bandit.get_random_action()
 	else:
 		return np.argmax(Q)
 		
@@ -33,41 +29,45 @@ def main():
 	NUM_ITERATIONS = 10000
 	PRINT_EVERY = 10
 	K = 10
+	SEED = 0
 	EPSILON = 0.1
 	ALPHA = [0, 0.1]
 	
-	avg_rewards = np.zeros(NUM_ITERATIONS)
-	
 	for step in ALPHA:
 	
-		for run in range(NUM_BANDITS):
-
-			rewards = np.zeros(NUM_ITERATIONS)
+		# Streams each step's reward and optimal action rate across runs
+		curve = CurveAggregator()
+		
+		# Every setting sees the same bandits, each run with its own random stream
+		for run, bandit in enumerate(make_bandits(NUM_BANDITS, K, seed=SEED, walk_var=0.01)):
 		
 			if run % PRINT_EVERY == 0:
 				print(f"Run {run+1} of {NUM_BANDITS}")
 				
-			bandit = generate_bandit(K)
 			Q = np.zeros(K)
 			actions_taken = np.zeros_like(Q)
 			rewards_gotten = np.zeros_like(Q)
 			
-			# print(f"Bandit means: {np.around(bandit, 3)}\n")
+			# print(f"Bandit means: {np.around(bandit.get_means(), 3)}\n")
 		
+			# This run's curve, added to the aggregate once the run is done
+			rewards = np.zeros(NUM_ITERATIONS)
+			optimal = np.zeros(NUM_ITERATIONS, dtype=bool)
+			
 			for iter in range(NUM_ITERATIONS):
 				
-				this_action = get_action(Q, EPSILON)
-				this_reward = get_reward(bandit[this_action])
+				this_action = get_action(Q, bandit, EPSILON)
+				this_reward = bandit.get_reward(this_action)
 				
 				Q[this_action] = update_Q(iter, this_reward, Q[this_action], alpha=step)
 				
-				rewards[iter] = this_reward
+				rewards[iter], optimal[iter] = this_reward, this_action == bandit.get_optimal_action()
 				
-				bandit = update_bandit(bandit, mean=0, var=0.01)
+				bandit.step()
 
-			avg_rewards += 1/(run+1) * (rewards - avg_rewards)
+			curve.AddCurve(rewards, optimal)
 
-		plt.plot(avg_rewards, label=str(step))
+		plt.plot(curve.GetSteps(), curve.GetMean(), label=str(step))
 		
 	plt.legend()
 	plt.show()
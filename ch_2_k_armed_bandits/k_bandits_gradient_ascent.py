@@ -1,20 +1,21 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
-# Creates an array of means of size k
-def generate_bandit(k, mean=0):
-	return np.random.normal(loc=mean, scale=1, size=(k))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+from CurveAggregator import CurveAggregator
 
-# Performs a random walk on the bandits with mean 0 and var provided
-def update_bandit(bandit, mean=0, var=0.01):
-	return bandit + np.random.normal(loc=mean, scale=var, size=(len(bandit)))
+from block_bandit import make_bandits
 
-# Samples from a gaussian around the provided mean and var to generate reward
-def get_reward(mean, var=1):
-	return np.random.normal(loc=mean, scale=var)
+# Softmax of the preferences, shifted by the max first (log-sum-exp trick) so large preferences can't overflow
+def softmax(Q):
+	exp_Q = np.exp(Q - np.max(Q))
+	return exp_Q / np.sum(exp_Q)
 
 # Gradient based approach for updating Q
-def update_Q_gradient_ascent(iter, reward, avg_reward, Q, action, alpha=0):
+# pi is the softmax of Q that the action was sampled from, so it isn't recomputed here
+def update_Q_gradient_ascent(iter, reward, avg_reward, Q, action, pi, alpha=0):
 
 	# Either uses a weight decaying avg or true avg based on ALPHA
 	if alpha == 0:
@@ -22,27 +23,23 @@ def update_Q_gradient_ascent(iter, reward, avg_reward, Q, action, alpha=0):
 	else:
 		step = alpha
 	
-	# calculated the softmax distribution - P(a_i) = e^a_i / sum(e^A)
-	pi_A = np.exp(Q[action]) / np.sum(np.exp(Q))
-	
-	# Gradient update based delta reward and current probability of not choosing it
+	# Gradient update based delta reward and current probability of choosing each action
 	# If the delta is positive, and the chance of choosing it is low, Q_a goes up
 	# If delta is negative and chance of choosing it is high, Q_a goes down
 	# 1 - P(A = a_i) amplifies the delta, and is always > 0 by def'n
-	Q[action] = Q[action] + step * (reward - avg_reward) * (1 - pi_A)
-	
-	# Perform gradient descent for the other elements of Q using similar rationale
-	mask = np.ones_like(Q, dtype=int)
-	mask[action] = 0
-	
-	Q[mask] = Q[mask] - step * (reward - avg_reward) * pi_A
+	# Every other action moves the opposite way, scaled by its own probability P(A = a_j)
+	delta = step * (reward - avg_reward)
+	Q -= delta * pi
+	Q[action] += delta
 	
 	return Q
 	
-# Randomly samples from the softmax distribution and returns an action
-def get_action(Q):	
-	probs = np.exp(Q) / np.sum(np.exp(Q))
-	return np.random.choice(len(Q), p=probs)
+# Randomly samples from the softmax distribution, returns the action and the distribution
+# The uniform draw comes from the bandit's pregenerated block
+def get_action(Q, bandit):	
+	probs = softmax(Q)
+	action = np.searchsorted(np.cumsum(probs), bandit.get_uniform(), side='right')
+	return min(action, len(Q) - 1), probs
 	
 def main():
 
@@ -51,51 +48,54 @@ def main():
 	NUM_ITERATIONS = 2000
 	PRINT_EVERY = 25
 	K = 10
+	SEED = 0
 	ALPHA = 0.1
 	DO_RANDOM_WALK = True
 	WALK_VAR = 0.1
 	
-	# Keeps track of how we're performing in each run, for plotting purposes
-	avg_rewards = np.zeros(NUM_ITERATIONS)
+	# Keeps track of how we're performing at each step across runs, for plotting purposes
+	curve = CurveAggregator()
 	
-	# Repeat training multiple times
-	for run in range(NUM_BANDITS):
+	# Repeat training multiple times, with our bandits (q_star) drawn from each run's own random stream
+	bandits = make_bandits(NUM_BANDITS, K, seed=SEED, mean=4, walk_var=WALK_VAR if DO_RANDOM_WALK else 0)
+	for run, bandit in enumerate(bandits):
 
 		# Reset our rewards
-		rewards = np.zeros(NUM_ITERATIONS)
 		avg_reward = 0
 	
 		if run % PRINT_EVERY == 0:
 			print(f"Run {run+1} of {NUM_BANDITS}")
 			
-		# Initialize our bandits (q_star) and Q (our guess for q_star)
-		bandit = generate_bandit(K, mean=4)
+		# Initialize Q (our guess for q_star)
 		Q = np.ones(K) / K
 		
+		# This run's curve, added to the aggregate once the run is done
+		rewards = np.zeros(NUM_ITERATIONS)
+		optimal = np.zeros(NUM_ITERATIONS, dtype=bool)
+		
 		# Go through multiple iterations, trying to max reward at each instance
 		for iter in range(NUM_ITERATIONS):
 			
 			# Get the action based on our Q and the corresponding reward (sampled from bandits)
-			this_action = get_action(Q)
-			this_reward = get_reward(bandit[this_action])
+			this_action, pi = get_action(Q, bandit)
+			this_reward = bandit.get_reward(this_action)
 			
 			# incorporate this into our average rewards
 			avg_reward += 1/(iter+1) * (this_reward - avg_reward)
 			
 			# Perform gradient ascent / descent on Q
-			Q = update_Q_gradient_ascent(iter, this_reward, avg_reward, Q, this_action, alpha=ALPHA)
+			Q = update_Q_gradient_ascent(iter, this_reward, avg_reward, Q, this_action, pi, alpha=ALPHA)
 			
 			# Save this value for plotting
-			rewards[iter] = this_reward
+			rewards[iter], optimal[iter] = this_reward, this_action == bandit.get_optimal_action()
 			
-			# Perform a random walk on our bandits if flag is set
-			if DO_RANDOM_WALK:				
-				bandit = update_bandit(bandit, mean=0, var=WALK_VAR)
+			# Move on to the next step, our bandits take their random walk if DO_RANDOM_WALK is set
+			bandit.step()
 
-		avg_rewards += 1/(run+1) * (rewards - avg_rewards)
+		curve.AddCurve(rewards, optimal)
 
 	name = f"Alpha: {ALPHA}"
-	plt.plot(avg_rewards, label=name)
+	plt.plot(curve.GetSteps(), curve.GetMean(), label=name)
 		
 	plt.legend()
 	plt.show()
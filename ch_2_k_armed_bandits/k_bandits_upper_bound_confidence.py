@@ -1,17 +1,12 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
-def generate_bandit(k):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+from CurveAggregator import CurveAggregator
 
-	return np.random.normal(loc=0, scale=1, size=(k))
-
-def update_bandit(bandit, mean=0, var=0.01):
-	
-	return bandit + np.random.normal(loc=mean, scale=var, size=(len(bandit)))
-
-def get_reward(mean, var=1):
-	
-	return np.random.normal(loc=mean, scale=var)
+from block_bandit import make_bandits
 
 def update_Q(iter, reward, q_i, alpha=0):
 
@@ -22,7 +17,8 @@ def update_Q(iter, reward, q_i, alpha=0):
 	
 def get_action(Q, c, N, iter):	
 	
-	return np.argmax(Q + c * np.sqrt( np.log(iter)/N ))
+	# log(0) is avoided on the first iteration
+	return np.argmax(Q + c * np.sqrt( np.log(max(iter, 1))/N ))
 		
 def main():
 
@@ -30,45 +26,49 @@ def main():
 	NUM_ITERATIONS = 10000
 	PRINT_EVERY = 50
 	K = 10
+	SEED = 0
 	EPSILON = 0.1
 	ALPHA = 0
 	C = [1, 1.5, 2, 5]
 	
-	avg_rewards = np.zeros(NUM_ITERATIONS)
-	
 	for c in C:
 	
-		for run in range(NUM_BANDITS):
-
-			rewards = np.zeros(NUM_ITERATIONS)
+		# Streams each step's reward and optimal action rate across runs
+		curve = CurveAggregator()
+		
+		# Every setting sees the same bandits, each run with its own random stream
+		for run, bandit in enumerate(make_bandits(NUM_BANDITS, K, seed=SEED, walk_var=0.01)):
 		
 			if run % PRINT_EVERY == 0:
 				print(f"Run {run+1} of {NUM_BANDITS}")
 				
-			bandit = generate_bandit(K)
 			Q = np.zeros(K)
 			N = np.ones(K)
 			actions_taken = np.zeros_like(Q)
 			rewards_gotten = np.zeros_like(Q)
 			
-			# print(f"Bandit means: {np.around(bandit, 3)}\n")
+			# print(f"Bandit means: {np.around(bandit.get_means(), 3)}\n")
 		
+			# This run's curve, added to the aggregate once the run is done
+			rewards = np.zeros(NUM_ITERATIONS)
+			optimal = np.zeros(NUM_ITERATIONS, dtype=bool)
+			
 			for iter in range(NUM_ITERATIONS):
 				
 				this_action = get_action(Q, c, N, iter)
-				this_reward = get_reward(bandit[this_action])
+				this_reward = bandit.get_reward(this_action)
 				
 				Q[this_action] = update_Q(iter, this_reward, Q[this_action], alpha=ALPHA)
 				N[this_action] += 1
 				
-				rewards[iter] = this_reward
+				rewards[iter], optimal[iter] = this_reward, this_action == bandit.get_optimal_action()
 				
-				bandit = update_bandit(bandit, mean=0, var=0.01)
+				bandit.step()
 
-			avg_rewards += 1/(run+1) * (rewards - avg_rewards)
+			curve.AddCurve(rewards, optimal)
 
 		name = f"C: {c}"
-		plt.plot(avg_rewards, label=name)
+		plt.plot(curve.GetSteps(), curve.GetMean(), label=name)
 		
 	plt.legend()
 	plt.show()
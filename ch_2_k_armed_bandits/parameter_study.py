@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from bandit_testbed import BanditTestbed
+
+# Reproduces the Chapter 2 parameter study (avg reward vs hyperparameter for each bandit algorithm)
+# Every (algorithm, parameter, seed block) cell is a job run on a process pool, and its result is
+# cached on disk under a hash of the cell's config and the testbed's code, so an interrupted
+# sweep resumes where it stopped and unchanged cells are never recomputed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(HERE, ".study_cache")
+
+# The swept hyperparameter of each algorithm, its values, and any fixed testbed settings
+ALGORITHMS = {
+	"eps-greedy":			(BanditTestbed.EPSILON_GREEDY, "eps", 2.0 ** np.arange(-7, -1), {"sample_average": True}),
+	"ucb":					(BanditTestbed.UCB, "c", 2.0 ** np.arange(-4, 3), {"sample_average": True}),
+	"gradient":				(BanditTestbed.GRADIENT, "alpha", 2.0 ** np.arange(-5, 3), {}),
+	"optimistic-greedy":	(BanditTestbed.EPSILON_GREEDY, "initial_Q", 2.0 ** np.arange(-2, 3), {"alpha": 0.1}),
+}
+
+# Hashes the source of the testbed and this file, so cached cells are dropped when the code changes
+def get_code_version():
+	digest = hashlib.sha256()
+	for name in ("bandit_testbed.py", "parameter_study.py"):
+		with open(os.path.join(HERE, name), "rb") as f:
+			digest.update(f.read())
+	return digest.hexdigest()[:16]
+
+# Returns the config of every job in the study
+def make_jobs(algorithms, runs, blocks, iterations, k, walk_var, seed):
+	jobs = []
+	for name in algorithms:
+		method, param, values, fixed = ALGORITHMS[name]
+		for value in values:
+			for block in range(blocks):
+				jobs.append({
+					"algorithm": name, "method": method, "param": param, "value": float(value),
+					"fixed": fixed, "block": block, "runs": runs, "iterations": iterations,
+					"k": k, "walk_var": walk_var, "seed": seed,
+				})
+	return jobs
+
+# Returns the cache file for a job, keyed on its config and the code version
+def get_cache_path(job, cache_dir, code_version):
+	key = json.dumps(job, sort_keys=True) + code_version
+	return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".npz")
+
+# Runs a single job and writes its curves to the cache (in a worker process)
+def run_job(job, cache_path):
+
+	# Blocks share seeds across parameter values, so every value sees the same bandits
+	seed = np.random.SeedSequence([job["seed"], job["block"]])
+	kwargs = dict(job["fixed"])
+	kwargs[job["param"]] = job["value"]
+
+	testbed = BanditTestbed(job["runs"], job["k"], job["method"], walk_var=job["walk_var"], seed=seed, **kwargs)
+	avg_rewards, optimal_rate = testbed.run(job["iterations"])
+
+	# Write to a temp file first, so an interrupted job never leaves a partial cell behind
+	tmp_path = cache_path + ".tmp.npz"
+	np.savez(tmp_path, avg_rewards=avg_rewards, optimal_rate=optimal_rate)
+	os.replace(tmp_path, cache_path)
+
+	return cache_path
+
+# Runs every job that isn't cached yet, then returns the curves of every job
+def run_study(jobs, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+
+	os.makedirs(cache_dir, exist_ok=True)
+	code_version = get_code_version()
+	paths = [ get_cache_path(job, cache_dir, code_version) for job in jobs ]
+
+	todo = [ (job, path) for job, path in zip(jobs, paths) if not os.path.exists(path) ]
+	print(f"{len(jobs) - len(todo)} of {len(jobs)} cells cached, running {len(todo)} on the pool")
+
+	start = time.time()
+	if len(todo) > 0:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			futures = [ pool.submit(run_job, job, path) for job, path in todo ]
+			for done, future in enumerate(as_completed(futures)):
+				future.result()
+				print(f"Finished cell {done+1} of {len(todo)}, {time.time() - start:.1f}s elapsed")
+
+	results = []
+	for path in paths:
+		with np.load(path) as data:
+			results.append( (data["avg_rewards"], data["optimal_rate"]) )
+	return results
+
+# Averages the curves over seed blocks, returns {algorithm: (values, summary reward per value)}
+# summary_from is the first iteration included in the summary (eg. half way for non-stationary bandits)
+def summarize(jobs, results, summary_from=0):
+	curves = {}
+	for job, (avg_rewards, _) in zip(jobs, results):
+		curves.setdefault(job["algorithm"], {}).setdefault(job["value"], []).append(avg_rewards)
+
+	summary = {}
+	for name, by_value in curves.items():
+		values = sorted(by_value)
+		rewards = [ np.mean(np.mean(by_value[v], axis=0)[summary_from:]) for v in values ]
+		summary[name] = (np.array(values), np.array(rewards))
+	return summary
+
+# Plots the parameter study on a log2 axis and saves it to out_path
+def plot_summary(summary, out_path, show=False):
+
+	import matplotlib
+	if not show:
+		matplotlib.use("Agg")
+	import matplotlib.pyplot as plt
+
+	fig, ax = plt.subplots()
+	for name, (values, rewards) in summary.items():
+		ax.plot(np.log2(values), rewards, label=f"{name} ({ALGORITHMS[name][1]})")
+
+	ax.set_xlabel("log2 of parameter")
+	ax.set_ylabel("Average reward")
+	ax.legend()
+	fig.savefig(out_path)
+	print(f"Saved parameter study to {out_path}")
+
+	if show:
+		plt.show()
+
+def main():
+
+	parser = argparse.ArgumentParser(description="Chapter 2 bandit parameter study")
+	parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=list(ALGORITHMS))
+	parser.add_argument("--runs", type=int, default=500, help="runs per seed block")
+	parser.add_argument("--blocks", type=int, default=4, help="seed blocks per parameter value")
+	parser.add_argument("--iterations", type=int, default=1000)
+	parser.add_argument("--k", type=int, default=10)
+	parser.add_argument("--walk-var", type=float, default=0, help="random walk scale, > 0 for non-stationary bandits")
+	parser.add_argument("--summary-from", type=int, default=0, help="first iteration included in the avg reward")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--workers", type=int, default=None)
+	parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+	parser.add_argument("--out", default=os.path.join(HERE, "Images", "k_bandits_parameter_study.png"))
+	parser.add_argument("--show", action="store_true", help="show the plot as well as saving it")
+	args = parser.parse_args()
+
+	jobs = make_jobs(args.algorithms, args.runs, args.blocks, args.iterations, args.k, args.walk_var, args.seed)
+	results = run_study(jobs, cache_dir=args.cache_dir, workers=args.workers)
+	summary = summarize(jobs, results, summary_from=args.summary_from)
+
+	for name, (values, rewards) in summary.items():
+		print(f"{name}: " + ", ".join(f"{v:g}: {r:.3f}" for v, r in zip(values, rewards)))
+
+	plot_summary(summary, args.out, show=args.show)
+
+if __name__ == "__main__":
+
+	main()
@@ -0,0 +1,160 @@
+import math
+import time
+import heapq
+
+import numpy as np
+
+# UCB action selection for bandits with a very large number of arms
+#
+# The dense rule in k_bandits_upper_bound_confidence.py recomputes Q + c*sqrt(log(t)/N) for every arm
+# on every pull, which is O(K). Only the pulled arm's Q and N change between pulls, everything else
+# moves only through log(t), which grows very slowly. So log(t) is frozen between refreshes, and the
+# bounds are kept in a max heap where each pull pushes one new bound for the pulled arm, O(log K).
+# Every time t grows by a factor of refresh, log(t) is refreshed and the heap is rebuilt in O(K),
+# which amortizes to O(K/t) per pull
+#
+# Counts start at 1 like the scalar script, so unpulled arms get a finite bound
+class HeapUCB:
+
+	def __init__(self, k, c, initial_Q=0, alpha=0, sample_average=False, refresh=2):
+
+		if refresh <= 1:
+			raise ValueError(f"refresh must be > 1, got {refresh}")
+
+		self.k = k
+		self.c = c
+		self.alpha = alpha					# step size, 0 means 1/(iter+1) like the script
+		self.sample_average = sample_average	# use 1/N(a) as the step size instead
+		self.refresh = refresh				# factor t must grow by before log(t) is refreshed
+
+		self.Q = [float(initial_Q)] * k
+		self.N = [1] * k
+		self.iter = 0
+
+		# Heap entries are (-bound, arm, version), entries with an old version are skipped
+		self._version = [0] * k
+		self._heap = []
+		self._log_t = 0
+		self._next_refresh = 0
+		self.rebuilds = 0
+
+	def _get_bound(self, action):
+		return self.Q[action] + self.c * math.sqrt(self._log_t / self.N[action])
+
+	# Recomputes every bound at once, refreshing log(t) first unless only dropping stale entries
+	def _rebuild(self, refresh_log=True):
+		if refresh_log:
+			t = max(self.iter, 1)
+			self._log_t = math.log(t)
+			self._next_refresh = math.ceil(t * self.refresh)
+
+		bounds = np.array(self.Q) + self.c * np.sqrt(self._log_t / np.array(self.N))
+		self._heap = list(zip((-bounds).tolist(), range(self.k), self._version))
+		heapq.heapify(self._heap)
+		self.rebuilds += 1
+
+	# Returns the arm with the largest bound, ties go to the lowest arm like np.argmax
+	def get_action(self):
+
+		if self.iter >= self._next_refresh:
+			self._rebuild()
+		elif len(self._heap) > 2 * self.k:
+			self._rebuild(refresh_log=False)
+
+		while self._heap[0][2] != self._version[self._heap[0][1]]:
+			heapq.heappop(self._heap)
+
+		return self._heap[0][1]
+
+	# Updates the pulled arm's estimate and pushes its new bound
+	def update(self, action, reward):
+
+		if self.sample_average:
+			step = 1 / self.N[action]
+		elif self.alpha == 0:
+			step = 1 / (self.iter + 1)
+		else:
+			step = self.alpha
+
+		self.Q[action] += step * (reward - self.Q[action])
+		self.N[action] += 1
+		self.iter += 1
+
+		self._version[action] += 1
+		heapq.heappush(self._heap, (-self._get_bound(action), action, self._version[action]))
+
+# The dense O(K) rule from k_bandits_upper_bound_confidence.py, with log(0) avoided on the first pull
+class DenseUCB:
+
+	def __init__(self, k, c, initial_Q=0, alpha=0, sample_average=False):
+		self.k = k
+		self.c = c
+		self.alpha = alpha
+		self.sample_average = sample_average
+
+		self.Q = np.full(k, float(initial_Q))
+		self.N = np.ones(k)
+		self.iter = 0
+
+	def get_action(self):
+		return np.argmax(self.Q + self.c * np.sqrt( np.log(max(self.iter, 1)) / self.N ))
+
+	def update(self, action, reward):
+
+		if self.sample_average:
+			step = 1 / self.N[action]
+		elif self.alpha == 0:
+			step = 1 / (self.iter + 1)
+		else:
+			step = self.alpha
+
+		self.Q[action] += step * (reward - self.Q[action])
+		self.N[action] += 1
+		self.iter += 1
+
+# Runs an agent on a stationary bandit, returns (seconds per pull, avg reward, optimal action rate)
+# Every agent run with the same seed sees the same bandit and the same reward noise per pull
+def run_agent(agent, iterations, seed=0):
+
+	rng = np.random.default_rng(seed)
+	bandit = rng.normal(loc=0, scale=1, size=agent.k)
+	noise = rng.normal(loc=0, scale=1, size=iterations)
+	best = np.argmax(bandit)
+
+	total_reward = 0
+	optimal = 0
+
+	start = time.perf_counter()
+	for iter in range(iterations):
+		action = agent.get_action()
+		reward = bandit[action] + noise[iter]
+		agent.update(action, reward)
+
+		total_reward += reward
+		optimal += action == best
+
+	elapsed = time.perf_counter() - start
+	return elapsed / iterations, total_reward / iterations, optimal / iterations
+
+# Times the dense and heap agents for each number of arms, and prints their cost per pull and results
+def benchmark(K_list=(10, 1000, 100000), iterations=20000, c=2, seed=0):
+
+	results = []
+	for k in K_list:
+		dense = run_agent(DenseUCB(k, c, sample_average=True), iterations, seed)
+		heap = run_agent(HeapUCB(k, c, sample_average=True), iterations, seed)
+		results.append( (k, dense, heap) )
+
+		print(f"K = {k:>7}: dense {1e6 * dense[0]:8.1f} us/pull (avg reward {dense[1]:.3f}, optimal {dense[2]:.3f}), "
+			f"heap {1e6 * heap[0]:8.1f} us/pull (avg reward {heap[1]:.3f}, optimal {heap[2]:.3f}), "
+			f"speedup {dense[0] / heap[0]:.1f}x")
+
+	return results
+
+def main():
+
+	benchmark()
+
+if __name__ == "__main__":
+
+	main()
@@ -1,5 +1,13 @@
+import os
+import sys
+import time
 import numpy as np
+import scipy.sparse
 import matplotlib.pyplot as plt
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+from TabularDP import TabularMDP, BenchmarkBackups
 
 np.set_printoptions(precision=3)
 
@@ -10,75 +18,226 @@ DISCOUNT = 1
 
 WIN_AMOUNT = 100
 
+# Value iteration sweeps states in chunks of (states, stakes) at most this many elements
+CHUNK_ELEMENTS = 2**22
+
+SYNCHRONOUS = 0	# every state is updated from the values of the last sweep
+IN_PLACE = 1	# each chunk of states is updated from the values the earlier chunks just wrote
+SWEEP_MODES = (SYNCHRONOUS, IN_PLACE)
+
 # Returns True if heads, False otherwise, with probability P
 def flip_coin(P):
 	return np.random.rand() < P
-	
+
 def get_action(V):
 	return np.argmax(V)
 
-	
-def main():
+# The values of every capital live in one buffer, so the next capital for every (state, stake) pair is a strided view
+#
+# buf[W + s] is V[s] for capital s in [0, W], buf[:W] holds losses past 0 (-inf, never the best stake),
+# and buf[2W+1:] holds wins past W, worth V[W] (or -inf when stakes are capped so they can't overshoot)
+class GamblerValues:
+
+	def __init__(self, win_amount, cap_stakes=False, num_candidates=8, seed=None):
+
+		W = win_amount
+		self.W = win_amount
+		self.cap_stakes = cap_stakes			# stakes are at most W - s, like the textbook, instead of at most s
+		self.num_candidates = num_candidates	# best stakes per state kept by full sweeps, 0 to only run full sweeps
+		self.candidates = None					# (W-1, num_candidates) stakes of states 1 to W-1
+
+		self.buf = np.full(3*W + 1, -np.inf)
+		self.V = self.buf[W:2*W + 1]	# view, writes to V land in buf
+
+		rng = np.random.default_rng(seed)
+		self.V[:] = 0.001 * rng.random(W + 1)
+		self.V[0] = 0
+		self.V[W] = 1
+
+		if not cap_stakes:
+			self.buf[2*W + 1:] = self.V[W]
+
+	# Largest stake any state in [lo, hi) may place
+	def get_max_stake(self, lo, hi):
+		return min(hi - 1, self.W - lo) if self.cap_stakes else hi - 1
+
+	# Returns the (hi-lo, max stake) values of staking 1, 2, ... from every state in [lo, hi), read from buf
+	# Stakes a state can't place come out as -inf
+	def get_stake_values(self, buf, lo, hi, p_win=P_WIN, discount=DISCOUNT):
+
+		W = self.W
+		A = self.get_max_stake(lo, hi)
+
+		# win[i, a-1] = V[lo+i+a], lose[i, a-1] = V[lo+i-a] (read backwards through the reversed buffer)
+		win = sliding_window_view(buf, A)[W + lo + 1 : W + hi + 1]
+		lose = sliding_window_view(buf[::-1], A)[2*W - hi + 2 : 2*W - lo + 2][::-1]
+
+		Q = np.multiply(win, discount * p_win)
+		Q += discount * (1 - p_win) * lose
+		return self._mask_impossible(Q, p_win)
+
+	# Returns the values of the given (hi-lo, m) stakes from every state in [lo, hi), read from buf
+	def get_candidate_values(self, buf, lo, hi, stakes, p_win=P_WIN, discount=DISCOUNT):
+
+		S = self.W + np.arange(lo, hi)[:, np.newaxis]
+
+		Q = np.multiply(buf[S + stakes], discount * p_win)
+		Q += discount * (1 - p_win) * buf[S - stakes]
+		return self._mask_impossible(Q, p_win)
+
+	# With p_win at 0 or 1 an impossible stake comes out as 0 * -inf, it's still impossible
+	@staticmethod
+	def _mask_impossible(Q, p_win):
+		if not 0 < p_win < 1:
+			Q[np.isnan(Q)] = -np.inf
+		return Q
+
+	# Yields the [lo, hi) chunks of non terminal states, each small enough for chunk_elements
+	def get_chunks(self, chunk_elements=CHUNK_ELEMENTS, width=None):
+		if width is None:
+			width = self.get_max_stake(1, self.W)
+		size = max(1, chunk_elements // max(width, 1))
+		for lo in range(1, self.W, size):
+			yield lo, min(lo + size, self.W)
+
+	# Runs one sweep of value iteration over every non terminal state, returns the max change in V
+	# In place sweeps work a chunk at a time, smaller chunk_elements get closer to updating one state at a time
+	#
+	# A full sweep tries every stake, and keeps the num_candidates best stakes of each state as its candidates.
+	# With use_candidates, only those are tried, which is O(W * num_candidates) instead of O(W^2)
+	def sweep(self, mode=IN_PLACE, p_win=P_WIN, discount=DISCOUNT, chunk_elements=CHUNK_ELEMENTS, use_candidates=False):
+
+		if mode not in SWEEP_MODES:
+			raise ValueError(f"mode must be one of {SWEEP_MODES}, got {mode}")
+
+		if use_candidates and self.candidates is None:
+			raise ValueError("No candidate stakes yet, run a full sweep first")
+
+		# Synchronous sweeps read every chunk from a snapshot, in place sweeps read buf as it's written
+		src = self.buf.copy() if mode == SYNCHRONOUS else self.buf
+
+		width = self.candidates.shape[1] if use_candidates else None
+		keep = 0 if use_candidates else self.num_candidates
+
+		delta = 0
+		for lo, hi in self.get_chunks(chunk_elements, width):
+			if use_candidates:
+				Q = self.get_candidate_values(src, lo, hi, self.candidates[lo-1:hi-1], p_win, discount)
+			else:
+				Q = self.get_stake_values(src, lo, hi, p_win, discount)
+
+			v_max = np.max(Q, axis=1)
+			delta = max(delta, np.max(np.abs(self.V[lo:hi] - v_max)))
+			self.V[lo:hi] = v_max
+
+			# Stake 1 is always possible, so it pads states with fewer stakes than candidates
+			if keep > 0:
+				if self.candidates is None:
+					self.candidates = np.ones((self.W - 1, keep), dtype=int)
+				m = min(keep, Q.shape[1])
+				self.candidates[lo-1:hi-1, :m] = np.argpartition(-Q, m - 1, axis=1)[:, :m] + 1
+
+		return delta
+
+	# Returns every state's optimal stakes, those within tol of the best value
+	# best_min and best_max are the smallest and largest optimal stake, num_best how many stakes are optimal
+	def get_policy(self, p_win=P_WIN, discount=DISCOUNT, tol=1e-12):
+
+		best_min = np.zeros(self.W, dtype=int)
+		best_max = np.zeros(self.W, dtype=int)
+		num_best = np.zeros(self.W, dtype=int)
+
+		for lo, hi in self.get_chunks():
+			Q = self.get_stake_values(self.buf, lo, hi, p_win, discount)
+			is_best = Q >= np.max(Q, axis=1, keepdims=True) - tol
+
+			best_min[lo:hi] = np.argmax(is_best, axis=1) + 1
+			best_max[lo:hi] = Q.shape[1] - np.argmax(is_best[:, ::-1], axis=1)
+			num_best[lo:hi] = np.count_nonzero(is_best, axis=1)
+
+		return best_min, best_max, num_best
+
+	# Returns every optimal stake for a single state
+	def get_optimal_stakes(self, s, p_win=P_WIN, discount=DISCOUNT, tol=1e-12):
+		Q = self.get_stake_values(self.buf, s, s + 1, p_win, discount)[0]
+		return np.flatnonzero(Q >= np.max(Q) - tol) + 1
+
+# Runs value iteration until V changes by less than thres in a sweep, returns the values and the number of sweeps
+#
+# Between full sweeps, only each state's candidate stakes are swept until V settles, then a full sweep
+# checks every stake again (and picks new candidates). It only stops after a full sweep, so the result
+# is the same as sweeping every stake every time
+def value_iteration(win_amount=WIN_AMOUNT, mode=IN_PLACE, thres=THRES, max_sweeps=None, cap_stakes=False, num_candidates=8,
+	seed=None, chunk_elements=CHUNK_ELEMENTS):
+
+	values = GamblerValues(win_amount, cap_stakes=cap_stakes, num_candidates=num_candidates, seed=seed)
 
-	# State = amount of money the gambler has
-	V = 0.001*np.random.rand(WIN_AMOUNT+1)
-	V[WIN_AMOUNT] = 1
-	V[0] = 0
-	
-	policy = np.ones(WIN_AMOUNT, dtype=int)
-	
-	delta = THRES + 1
 	iteration = 0
-	
-	while delta > THRES:
-	
-		print(f"Value function not yet stable, running iteration {iteration}, delta: {delta}")
-	
+	full_sweeps = 0
+
+	while max_sweeps is None or iteration < max_sweeps:
+
+		delta = values.sweep(mode, chunk_elements=chunk_elements)
 		iteration += 1
-		delta = 0 # Reset our marker for how much V[s] is changing
-		
-		# For every possible state 
-		for s, v_s in enumerate(V):
-			
-			if s == WIN_AMOUNT:
-				continue
-			
-			if s == 0:
-				V[s] = 0
-				policy[s] = 0
-				continue
-			
-			v_max = 0	# keeps track of value with best action
-			a_max = 0	# keeps track of best action
-			
-			# For every possible action from this state
-			for a in range(1,s+1):
-				
-				v_next = P_WIN if s+a > WIN_AMOUNT else P_WIN * (DISCOUNT * V[s+a])	# Discounted value of s' if win
-				
-				v_next += P_LOSE * (DISCOUNT * V[s-a])		# Discounted value of s' if lose
-				
-				# If this action produced a better value, store it and the action
-				if v_next > v_max:
-					v_max = v_next
-					a_max = a
-				
-			# Replace value of current state with value calculated from best action for this state
-			V[s] = v_max
-			
-			# Store best action in our policy for this state
-			policy[s] = a_max
-			
-			# Keep track of our max deviation from previous V[s]
-			delta = np.maximum(delta, np.abs(v_s - v_max))
-			
-	
+		full_sweeps += 1
+		print(f"Full sweep {full_sweeps}, delta: {delta}")
+
+		if delta <= thres:
+			break
+
+		while values.candidates is not None and delta > thres and (max_sweeps is None or iteration < max_sweeps):
+			delta = values.sweep(mode, chunk_elements=chunk_elements, use_candidates=True)
+			iteration += 1
+
+		print(f"Candidate stakes settled after {iteration} sweeps")
+
+	return values, iteration
+
+# Returns the problem as a TabularMDP for the generic planners, states are capital 0 to W and action a stakes a+1
+# Reaching W pays 1 (instead of V[W] being 1), 0 and W are terminal, stakes a state can't place have R = -inf
+def build_mdp(win_amount=WIN_AMOUNT, p_win=P_WIN, cap_stakes=False):
+
+	W = win_amount
+	states, stakes = np.meshgrid(np.arange(W + 1), np.arange(1, W), indexing="ij")
+	max_stake = np.minimum(states, W - states) if cap_stakes else states
+	valid = (stakes <= max_stake) & (states > 0) & (states < W)
+
+	s_idx, a_idx = np.nonzero(valid)
+	rows = s_idx*(W - 1) + a_idx
+	win = np.minimum(s_idx + a_idx + 1, W)
+	lose = s_idx - a_idx - 1
+
+	R = np.full(valid.shape, -np.inf)
+	R[s_idx, a_idx] = p_win * (win == W)
+
+	P = scipy.sparse.csr_matrix(
+		(np.concatenate([ np.full(len(rows), p_win), np.full(len(rows), 1 - p_win) ]),
+		(np.concatenate([ rows, rows ]), np.concatenate([ win, lose ]))),
+		shape=(valid.size, W + 1))
+	P.eliminate_zeros()
+
+	terminal = np.zeros(W + 1, dtype=bool)
+	terminal[[0, W]] = True
+	return TabularMDP(P, R, terminal)
+
+def main():
+
+	# State = amount of money the gambler has
+	start = time.time()
+	values, iterations = value_iteration(WIN_AMOUNT, mode=IN_PLACE)
+	policy, _, num_best = values.get_policy()
+	print(f"Value function stable after {iterations} sweeps, {time.time() - start:.2f}s")
+	print(f"{np.count_nonzero(num_best > 1)} states have more than one optimal stake")
+
+	print("Backups to each residual, full sweeps against prioritized sweeping")
+	BenchmarkBackups(build_mdp(WIN_AMOUNT), [1e-3, 1e-6, 1e-9], discount_factor=DISCOUNT)
+
 	fig, ax = plt.subplots(1,2)
-	
+
 	ax[0].plot(policy)
-	ax[1].plot(V)
-	
+	ax[1].plot(values.V)
+
 	plt.show()
-	
+
 if __name__=="__main__":
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,183 @@
+"""
+Problem Description
+
+Jack's Car Rental with any number of locations
+
+Each location has its own Poisson rental requests and returns, and every night cars can be
+moved between any of them. An action is the net change in cars at every location (it sums to 0),
+and costs MOVE_COST per car moved, at most MAX_MOVE cars in total
+
+The locations are independent once the cars are moved, so the transition from the cars after
+the move to the cars at the end of the day is a product of per location matrices. The expected
+next value is contracted one location at a time, never building the joint transitions:
+a sweep costs about N * MAX_CARS^(N+1) instead of MAX_CARS^(2N)
+
+"""
+
+import time
+import itertools
+import numpy as np
+import matplotlib.pyplot as plt
+
+from Policy_Iteration import get_location_model
+
+LAMDA_REQ = [3, 4, 2]
+LAMDA_RET = [3, 2, 4]
+
+DISCOUNT = 0.9
+MOVE_COST = 2
+RENTAL_PRICE = 10
+
+MAX_CARS = 20 + 1
+MAX_MOVE = 5
+THRES = 1e-3
+
+# Returns every net change in cars, shape (actions, locations), that sums to 0 and moves at most max_move cars
+# With 2 locations they're the original ACTIONS, (-a, a) in order of a
+def get_moves(num_locations, max_move=MAX_MOVE):
+
+	rest = np.array(list(itertools.product(range(-max_move, max_move+1), repeat=num_locations-1)), dtype=int)
+	moves = np.hstack([ -rest.sum(axis=1, keepdims=True), rest ]).reshape(-1, num_locations)
+	moves = moves[get_moved(moves) <= max_move]
+
+	return moves[np.lexsort(moves.T)]
+
+# Cars moved by each net change, every car leaving a location goes straight to one that gains
+def get_moved(moves):
+	return np.maximum(moves, 0).sum(axis=-1)
+
+# Builds the model of the fleet, as a dict of
+#	T (locations, MAX_CARS, MAX_CARS): each location's transitions from cars after the move to cars at the end of the day
+#	R (states, actions): expected reward, -inf where the action leaves a location with too few or too many cars
+#	post (states, actions): raveled cars after the move, where the day starts from
+#	moves (actions, locations), s_dims
+def build_model(lamda_req=LAMDA_REQ, lamda_ret=LAMDA_RET, max_cars=MAX_CARS, max_move=MAX_MOVE,
+	rental_price=RENTAL_PRICE, move_cost=MOVE_COST):
+
+	if len(lamda_req) != len(lamda_ret):
+		raise ValueError(f"Need a request and return rate per location, got {len(lamda_req)} and {len(lamda_ret)}")
+
+	N = len(lamda_req)
+	s_dims = (max_cars,)*N
+	moves = get_moves(N, max_move)
+
+	revenue, T = zip(*[ get_location_model(req, ret, max_cars, rental_price) for req, ret in zip(lamda_req, lamda_ret) ])
+	revenue, T = np.array(revenue), np.array(T)
+
+	# Cars at each location after every (state, action), (states, actions, locations)
+	cars = np.stack(np.unravel_index(np.arange(np.prod(s_dims)), s_dims), axis=1)
+	after = cars[:, np.newaxis, :] + moves
+	valid = np.all((after >= 0) & (after < max_cars), axis=2)
+	after = np.clip(after, 0, max_cars-1)
+
+	R = revenue[np.arange(N), after].sum(axis=2) - move_cost*get_moved(moves)
+	R[~valid] = -np.inf
+	post = np.ravel_multi_index(tuple(np.moveaxis(after, 2, 0)), s_dims)
+
+	return dict(T=T, R=R, post=post, moves=moves, s_dims=s_dims)
+
+# Returns E[V(cars at the end of the day)] for every count of cars after the move, raveled
+# Contracts V with one location's T at a time, einsum keeps the intermediates at the size of V
+def get_expected_values(model, value):
+
+	T = model["T"]
+	N = len(T)
+	operands = [ value.reshape(model["s_dims"]), list(range(N)) ]
+	for ii in range(N):
+		operands += [ T[ii], [N + ii, ii] ]
+
+	return np.einsum(*operands, list(range(N, 2*N)), optimize="greedy").ravel()
+
+# Returns Q for every (state, action)
+def get_q(model, value, discount=DISCOUNT):
+	return model["R"] + discount * get_expected_values(model, value)[model["post"]]
+
+# Sweeps V = R_pi + DISCOUNT * E[V'] until V changes by at most thres, returns V and the number of sweeps
+def evaluate_policy(model, policy_idx, value, discount=DISCOUNT, thres=THRES):
+
+	states = np.arange(len(policy_idx))
+	R_pi = model["R"][states, policy_idx]
+	post_pi = model["post"][states, policy_idx]
+
+	sweep_count = 0
+	delta = thres+1
+	while delta > thres:
+		new_value = R_pi + discount * get_expected_values(model, value)[post_pi]
+		delta = np.max(np.abs(new_value - value))
+		value = new_value
+		sweep_count += 1
+
+	return value, sweep_count
+
+# Returns the greedy action index for every state, the current action is kept if it ties the best
+def improve_policy(model, value, policy_idx, discount=DISCOUNT, tol=1e-9):
+
+	Q = get_q(model, value, discount)
+	states = np.arange(len(policy_idx))
+
+	best = np.argmax(Q, axis=1)
+	keep = Q[states, policy_idx] >= Q[states, best] - tol
+	return np.where(keep, policy_idx, best)
+
+# Sweeps V = max_a Q until V changes by at most thres, returns V and the number of sweeps
+def value_iteration(model, value=None, discount=DISCOUNT, thres=THRES):
+
+	value = np.zeros(len(model["R"])) if value is None else value
+
+	sweep_count = 0
+	delta = thres+1
+	while delta > thres:
+		new_value = np.max(get_q(model, value, discount), axis=1)
+		delta = np.max(np.abs(new_value - value))
+		value = new_value
+		sweep_count += 1
+
+	return value, sweep_count
+
+def policy_iteration(model, discount=DISCOUNT, thres=THRES):
+
+	# Start by moving no cars
+	policy_idx = np.full(len(model["R"]), np.flatnonzero(np.all(model["moves"] == 0, axis=1))[0])
+	value = np.zeros(len(model["R"]))
+
+	not_stable = True
+	unstable_count = 0
+
+	while not_stable:
+
+		value, sweep_count = evaluate_policy(model, policy_idx, value, discount, thres)
+
+		new_policy_idx = improve_policy(model, value, policy_idx, discount)
+		policy_change_count = np.count_nonzero(new_policy_idx != policy_idx)
+		policy_idx = new_policy_idx
+
+		not_stable = policy_change_count > 0
+		unstable_count += 1
+		print(f"Policy update number {unstable_count}, {sweep_count} sweeps, {policy_change_count} changes made")
+
+	return value, policy_idx
+
+def main():
+
+	print(f"Building the model for {len(LAMDA_REQ)} locations")
+	start = time.time()
+	model = build_model()
+	num_s, num_a = model["R"].shape
+	print(f"Model built in {time.time() - start:.2f}s, {num_s} states and {num_a} moves")
+
+	start = time.time()
+	value, policy_idx = policy_iteration(model)
+	print(f"Policy stable after {time.time() - start:.2f}s")
+
+	# Net change at the first location, with the last locations' cars held at MAX_CARS // 2
+	moves = model["moves"][policy_idx].reshape(model["s_dims"] + (-1,))
+	middle = (MAX_CARS // 2,) * (len(LAMDA_REQ) - 2)
+
+	fig, ax = plt.subplots(1,2)
+	cax = ax[0].imshow(moves[(slice(None), slice(None)) + middle + (0,)])
+	fig.colorbar(cax, ax=ax[0])
+	ax[1].imshow(value.reshape(model["s_dims"])[(slice(None), slice(None)) + middle])
+	plt.show()
+
+if __name__=="__main__":
+	main()
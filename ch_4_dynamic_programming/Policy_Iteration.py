@@ -14,70 +14,83 @@ Determine an optimal policy which maps number of cars to move based on cars at e
 """
 
 
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
 import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
 from scipy.stats import poisson
 import math
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+from TabularDP import TabularMDP, BenchmarkBackups
+
 LAMDA_REQ = [3, 4]
 LAMDA_RET = [3, 2]
 
 DISCOUNT = 0.9
 MOVE_COST = 2
 
-MAX_CARS = 7 + 1
+MAX_CARS = 20 + 1
 THRES = MAX_CARS*MAX_CARS*0.5
 
-MAX_MOVE = 4
+MAX_MOVE = 5
+ACTIONS = np.arange(-MAX_MOVE, MAX_MOVE+1)	# cars moved from location 1 to location 2
 
 RENTAL_PRICE = 10
 
-def get_probs(lamda, max):
-	v1 = poisson.pmf(range(max), lamda[0])
-	v1[-1] = 1 - poisson.cdf( max-1, lamda[0] )
+# How policy evaluation finds V_pi
+SWEEP = 0		# repeated V = R_pi + DISCOUNT * P_pi V, until it changes by at most THRES
+DIRECT = 1		# solves (I - DISCOUNT * P_pi) V = R_pi with a sparse LU
+ITERATIVE = 2	# solves the same system with BiCGSTAB (it isn't symmetric, so no CG)
+EVAL_MODES = (SWEEP, DIRECT, ITERATIVE)
+
+EVAL_MODE = DIRECT
+DIRECT_MAX_STATES = 50000	# bigger state spaces fall back to sweeps instead of factorizing
+SOLVER_TOL = 1e-10			# relative residual the iterative solver stops at
 
-	v2 = poisson.pmf(range(max), lamda[1])
-	v1[-1] = 1 - poisson.cdf( max-1, lamda[1] )
-	
-	M = v1[:, np.newaxis] * v2
-	
-	return M
+# Built models are saved here, one directory per set of parameters, None to always rebuild
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_cache")
+
+# Poisson pmf over 0 to max-1, with the tail (max-1 and up) lumped into the last entry
+def get_pmf(lamda, max):
+	pmf = poisson.pmf(range(max), lamda)
+	pmf[-1] = poisson.sf(max-2, lamda)
+	return pmf
 
-PROBS_REQS = get_probs(LAMDA_REQ, MAX_CARS)
-PROBS_RETS = get_probs(LAMDA_RET, MAX_CARS)
-	
 def get_cars(lamda):
 	return np.minimum(np.random.poisson(lamda), MAX_CARS)
 
 def get_money(cars, requests):
 	return np.sum(np.minimum(request,cars)*10)
 
-def get_state_value(row, col, action, value):
-	
-	V = 0 # Initialize V
-	
-	# For every combination of requests that could arrive
-	for req1 in range(MAX_CARS):
-		for req2 in range(MAX_CARS):
-			
-			# Determine the reward
-			R = -MOVE_COST*np.abs(action) # Cost of moving cars	
-			R += np.minimum(row-action, req1) * RENTAL_PRICE # Reward from location 1
-			R += np.minimum(col+action, req2) * RENTAL_PRICE # Reward from location 2
-			
-			# For every combination of returns that could happen
-			for ret1 in range(MAX_CARS):
-				for ret2 in range(MAX_CARS):
-					
-					# Get the next states, given this combo of requests and returns
-					s1 = np.minimum(MAX_CARS-1, np.maximum(0, row-action-req1) + ret1)
-					s2 = np.minimum(MAX_CARS-1, np.maximum(0, col+action-req2) + ret2)
-	
-					# add weighted ( Reward + discounted (Reward-to-go) ) to value of this state
-					V += PROBS_REQS[req1, req2] * PROBS_RETS[ret1, ret2] * (R + DISCOUNT * value[s1, s2])
-					
-	return V
-	
+# Returns the model of one location, given the cars it has after the overnight move
+# revenue[m] is the expected rental income, and T[m, n] the probability of ending the day with n cars
+def get_location_model(lamda_req, lamda_ret, max_cars=MAX_CARS, rental_price=RENTAL_PRICE):
+
+	p_req = get_pmf(lamda_req, max_cars)
+	p_ret = get_pmf(lamda_ret, max_cars)
+
+	cars = np.arange(max_cars)
+	rented = np.minimum(cars[:, np.newaxis], cars)	# [m, req]
+	revenue = rental_price * rented @ p_req
+
+	# Cars at the end of the day for every (m, req, ret), capped at max_cars-1
+	left = cars[:, np.newaxis] - rented
+	end = np.minimum(max_cars-1, left[:, :, np.newaxis] + cars)
+	prob = p_req[:, np.newaxis] * p_ret	# [req, ret]
+
+	T = np.zeros((max_cars, max_cars))
+	for m in range(max_cars):
+		T[m] = np.bincount(end[m].ravel(), weights=prob.ravel(), minlength=max_cars)
+
+	return revenue, T
 
 def get_action_bounds(row, col):
 
@@ -87,96 +100,211 @@ def get_action_bounds(row, col):
 	max_action = np.minimum(max_action, MAX_CARS-1-col) # Can't have more than 20 in Loc 2
 
 	return min_action, max_action
-	
-def main():	
-		
-	print("Initializing policy and value functions to 0s")
 
-	# Initialize the policy and state-value functions
-	policy = np.zeros((MAX_CARS, MAX_CARS), dtype=int)
-	value = np.zeros((MAX_CARS, MAX_CARS))
+# Precomputes the whole MDP once, states are row*MAX_CARS + col and actions index ACTIONS
+#
+# R[s, a] is the expected reward (-inf where the action isn't allowed), and P is a sparse
+# (states*actions, states) matrix, row s*len(ACTIONS) + a holding P[s, a, s'] (empty where not allowed)
+# The locations are independent, so each row is the outer product of the two locations' transitions
+def build_model():
+
+	revenue_1, T_1 = get_location_model(LAMDA_REQ[0], LAMDA_RET[0])
+	revenue_2, T_2 = get_location_model(LAMDA_REQ[1], LAMDA_RET[1])
+
+	row, col = np.divmod(np.arange(MAX_CARS*MAX_CARS), MAX_CARS)
+	min_action, max_action = get_action_bounds(row, col)
+	valid = (ACTIONS >= min_action[:, np.newaxis]) & (ACTIONS <= max_action[:, np.newaxis])
+
+	# Cars at each location after the move, for every valid (s, a)
+	s_idx, a_idx = np.nonzero(valid)
+	m_1 = row[s_idx] - ACTIONS[a_idx]
+	m_2 = col[s_idx] + ACTIONS[a_idx]
+
+	R = np.full(valid.shape, -np.inf)
+	R[s_idx, a_idx] = revenue_1[m_1] + revenue_2[m_2] - MOVE_COST*np.abs(ACTIONS[a_idx])
+
+	probs = (T_1[m_1][:, :, np.newaxis] * T_2[m_2][:, np.newaxis, :]).reshape(len(s_idx), -1)
+	nonzero = probs > 0
+	P = scipy.sparse.csr_matrix(
+		(probs[nonzero], (np.repeat(s_idx*len(ACTIONS) + a_idx, np.count_nonzero(nonzero, axis=1)), np.nonzero(nonzero)[1])),
+		shape=(valid.size, MAX_CARS*MAX_CARS))
+
+	return R, P, valid
+
+# Hashes the source of this file, so a change to the code that builds the model (get_pmf,
+# get_location_model, build_model, ACTIONS, the Poisson truncation) never loads a stale cache
+def get_code_version():
+	with open(os.path.abspath(__file__), "rb") as f:
+		return hashlib.sha1(f.read()).hexdigest()[:16]
+
+# Everything the model depends on, so a change to any of them builds (and caches) a new model
+def get_model_params():
+	return dict(lamda_req=LAMDA_REQ, lamda_ret=LAMDA_RET, max_cars=MAX_CARS, max_move=MAX_MOVE,
+		rental_price=RENTAL_PRICE, move_cost=MOVE_COST, code_version=get_code_version())
+
+def get_cache_path(cache_dir=CACHE_DIR):
+	key = hashlib.sha1(json.dumps(get_model_params(), sort_keys=True).encode()).hexdigest()[:16]
+	return os.path.join(cache_dir, key)
+
+# Returns R, P, valid like build_model, from the cache if these parameters were built before
+#
+# The arrays (P as its csr data, indices and indptr) are saved as .npy files and memory mapped
+# on load, so nothing is read until it's used. They're read only. A new model is written to a
+# temporary directory and renamed into place, so a run that dies halfway never leaves a partial cache
+def load_model(cache_dir=CACHE_DIR):
+
+	if cache_dir is None:
+		return build_model()
+
+	path = get_cache_path(cache_dir)
+	names = ("R", "data", "indices", "indptr", "valid")
+
+	if os.path.isdir(path):
+		arrays = { name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names }
+		P = scipy.sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+			shape=(arrays["valid"].size, MAX_CARS*MAX_CARS), copy=False)
+		return arrays["R"], P, arrays["valid"]
+
+	R, P, valid = build_model()
+
+	os.makedirs(cache_dir, exist_ok=True)
+	tmp_path = tempfile.mkdtemp(dir=cache_dir)
+	for name, arr in zip(names, (R, P.data, P.indices, P.indptr, valid)):
+		np.save(os.path.join(tmp_path, f"{name}.npy"), arr)
+	with open(os.path.join(tmp_path, "params.json"), "w") as f:
+		json.dump(get_model_params(), f, indent=1)
+
+	try:
+		os.rename(tmp_path, path)
+	except OSError:		# another run cached it first
+		shutil.rmtree(tmp_path)
+
+	return R, P, valid
+
+# Returns the rewards R_pi and sparse transitions P_pi of following the policy (the action index per state)
+def get_policy_model(R, P, policy_idx):
+	states = np.arange(len(policy_idx))
+	return R[states, policy_idx], P[states*len(ACTIONS) + policy_idx]
+
+# Sweeps V = R_pi + DISCOUNT * P_pi V until V changes by at most thres, returns V and the number of sweeps
+def sweep_policy(R_pi, P_pi, value, thres=THRES):
+
+	sweep_count = 0
+	delta = thres+1
+	while delta > thres:
+		new_value = R_pi + DISCOUNT * (P_pi @ value)
+		delta = np.max(np.abs(new_value - value))
+		value = new_value
+		sweep_count += 1
+
+	return value, sweep_count
+
+# Returns V_pi for the policy and the number of sweeps it took (0 when solved directly)
+# DIRECT and ITERATIVE give V_pi to solver precision instead of stopping at THRES, large
+# state spaces and iterative solves that don't converge fall back to sweeps
+def evaluate_policy(R, P, policy_idx, value, mode=EVAL_MODE, thres=THRES):
+
+	if mode not in EVAL_MODES:
+		raise ValueError(f"mode must be one of {EVAL_MODES}, got {mode}")
+
+	R_pi, P_pi = get_policy_model(R, P, policy_idx)
+
+	if mode == DIRECT and len(R_pi) > DIRECT_MAX_STATES:
+		print(f"{len(R_pi)} states is too many to factorize, evaluating with sweeps")
+		mode = SWEEP
+
+	if mode == SWEEP:
+		return sweep_policy(R_pi, P_pi, value, thres)
+
+	A = (scipy.sparse.identity(len(R_pi), format="csc") - DISCOUNT * P_pi).tocsc()
+
+	if mode == DIRECT:
+		return scipy.sparse.linalg.spsolve(A, R_pi), 0
+
+	# Warm started from the last policy's values, which are usually close
+	try:
+		new_value, info = scipy.sparse.linalg.bicgstab(A, R_pi, x0=value, rtol=SOLVER_TOL, atol=0)
+	except TypeError:	# scipy < 1.12 calls rtol tol
+		new_value, info = scipy.sparse.linalg.bicgstab(A, R_pi, x0=value, tol=SOLVER_TOL, atol=0)
+
+	if info != 0:
+		print(f"BiCGSTAB didn't converge (info {info}), finishing with sweeps")
+		return sweep_policy(R_pi, P_pi, new_value, thres)
+
+	return new_value, 0
+
+# Times each evaluation mode on the policy, and how far its V is from satisfying V = R_pi + DISCOUNT * P_pi V
+def benchmark_evaluation(R, P, policy_idx, repeats=5):
+
+	R_pi, P_pi = get_policy_model(R, P, policy_idx)
+	value = np.zeros(len(R_pi))
+
+	runs = [ ("sweeps, THRES", SWEEP, THRES), ("sweeps, 1e-8", SWEEP, 1e-8), ("sparse LU", DIRECT, THRES), ("BiCGSTAB", ITERATIVE, THRES) ]
+	for name, mode, thres in runs:
+		start = time.perf_counter()
+		for _ in range(repeats):
+			result, sweep_count = evaluate_policy(R, P, policy_idx, value, mode=mode, thres=thres)
+		elapsed = (time.perf_counter() - start) / repeats
+
+		residual = np.max(np.abs(result - (R_pi + DISCOUNT * (P_pi @ result))))
+		print(f"{name:>14}: {1000*elapsed:8.2f} ms, {sweep_count:4} sweeps, max Bellman residual {residual:.2e}")
+
+# Returns the greedy action index for every state, the current action is kept if it ties the best
+def improve_policy(R, P, value, policy_idx, tol=1e-9):
+
+	Q = R + DISCOUNT * (P @ value).reshape(R.shape)
+	states = np.arange(len(policy_idx))
+
+	best = np.argmax(Q, axis=1)
+	keep = Q[states, policy_idx] >= Q[states, best] - tol
+	return np.where(keep, policy_idx, best)
+
+def main():
+
+	print("Loading the model")
+	start = time.time()
+	R, P, valid = load_model()
+	print(f"Model loaded in {time.time() - start:.2f}s, {P.nnz} nonzero transitions")
+
+	# Initialize the policy (move no cars) and state-value functions to 0s
+	policy_idx = np.full(MAX_CARS*MAX_CARS, MAX_MOVE)
+	value = np.zeros(MAX_CARS*MAX_CARS)
 
 	not_stable = True
 	unstable_count = 0
-	policy_change_count = 0
-	
-	# Continue to refine while our Value function is still updating
+
+	# Continue to refine while our policy is still changing
 	while not_stable:
 
-		print(f"\nPolicy still unstable, {policy_change_count} changes made, Running update number {unstable_count}\n")
-
-		sweep_count = 0
-		delta = THRES+1
-		
-		# Keep improving our estimate of V while its still changing
-		while delta > THRES:
-		
-			print(f"Value Func not yet converged, delta = {delta}, state sweep number: {sweep_count}")
-			print(f"{np.round(value)}")
-		
-			# Set our change to 0
-			delta = 0
-			
-			# For every state
-			for row in range(MAX_CARS):
-				for col in range(MAX_CARS):
-					
-					# print(f"Running state ({row, col}), action: {policy[row,col]}")
-					
-					# Get the action from our policy and the negative reward for moving cars
-					action = policy[row,col]
-					
-					V = get_state_value(row, col, action, value)
-					
-					# Find the delta between our calculated V and existing V, keep track of max delta so far
-					delta = np.maximum(delta, np.abs(value[row,col] - V))
-					
-					# Update our existing value function with the new V
-					value[row,col] = V
-		
-			sweep_count += 1
-
-		print(f"Value function has converged, updating policy")
-
-		not_stable = False
-		policy_change_count = 0
-
-		# Iterate through all possible states 
-		for row in range(MAX_CARS):
-			for col in range(MAX_CARS):
-			
-				print(f"Updating state {row}, {col}")
-			
-				curr_action = policy[row, col]
-				
-				best_action = 0
-				best_value = 0
-				
-				min_action, max_action = get_action_bounds(row, col)
-				
-				# Iterate through all possible actions from this state
-				for action in range(min_action, max_action+1):
-					
-					V = get_state_value(row, col, action, value)
-					
-					if V > best_value:
-						best_value = V
-						best_action = action
-				
-				if best_action != curr_action:
-					policy_change_count += 1
-					policy[row,col] = best_action
-					not_stable = True
-							
+		value, sweep_count = evaluate_policy(R, P, policy_idx, value)
+		if sweep_count > 0:
+			print(f"Value function converged after {sweep_count} sweeps, updating policy")
+		else:
+			print(f"Value function solved, updating policy")
+
+		new_policy_idx = improve_policy(R, P, value, policy_idx)
+		policy_change_count = np.count_nonzero(new_policy_idx != policy_idx)
+		policy_idx = new_policy_idx
+
+		not_stable = policy_change_count > 0
 		unstable_count += 1
-		
-		
+		print(f"Policy update number {unstable_count}, {policy_change_count} changes made")
+
+	print(f"Policy stable after {time.time() - start:.2f}s")
+
+	print("Benchmarking policy evaluation on the final policy")
+	benchmark_evaluation(R, P, policy_idx)
+
+	print("Backups to each residual, full sweeps against prioritized sweeping")
+	BenchmarkBackups(TabularMDP(P, R, s_dims=(MAX_CARS, MAX_CARS)), [10, 1e-1, 1e-3], discount_factor=DISCOUNT)
+
+	policy = ACTIONS[policy_idx].reshape(MAX_CARS, MAX_CARS)
+	print(f"{np.round(value.reshape(MAX_CARS, MAX_CARS))}")
+
 	fig, ax = plt.subplots()
 	cax = ax.imshow(policy)
 	cbar = fig.colorbar(cax)
 	plt.show()
-		
-	
-		
+
 if __name__=="__main__":
 	main()
@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+from cards import get_value
+
 # --- CONSTANTS ---
 
 # States
@@ -70,7 +72,20 @@ def cards_to_state(cards, is_dealer=False):
 		return p_state, a_state
 
 # Start a new game and deal 2 cards to player and dealer		
-def deal_cards(random_start=False):
+# With a shoe (cards.Shoe), the cards come from it instead of an infinite deck, and it can't random_start
+def deal_cards(random_start=False, shoe=None):
+
+	if shoe is not None:
+		if random_start:
+			raise ValueError("A shoe deals real hands, it can't random_start")
+
+		shoe.StartRound()
+		d_cards = get_value(shoe.DealCodes(2))
+		p_cards = get_value(shoe.DealCodes(2))
+
+		d_state = cards_to_state(d_cards, is_dealer=True)
+		p_state, a_state = cards_to_state(p_cards)
+		return d_cards, p_cards, d_state, p_state, a_state
 	
 	# If random start flag is set, choose a random state with equal prob
 	if random_start:
@@ -122,8 +137,11 @@ def deal_cards(random_start=False):
 	
 	return d_cards, p_cards, d_state, p_state, a_state
 
-# Deal a single new card (suit doesnt matter, only value)
-def deal_card():
+# Deal a single new card (suit doesnt matter, only value), from the shoe if given
+def deal_card(shoe=None):
+
+	if shoe is not None:
+		return get_value(shoe.DealCodes(1))[0]
 	
 	# generate a random number between 1-13; convert 11-13 to 10
 	return np.minimum(10, np.random.randint(1, 14))
@@ -160,10 +178,11 @@ def get_reward(D, P):
 		raise ValueError # This Should never happen
 	
 # Run a single episode, either on a policy or with a random policy	
-def run_episode(on_policy=False, policy=None, hard_policy=False):
+# With a shoe, the hand is dealt and played from it, instead of a random start from an infinite deck
+def run_episode(on_policy=False, policy=None, hard_policy=False, shoe=None):
 	
 	# Deal out cards to start the game
-	d_cards, p_cards, d_state, p_state, a_state = deal_cards(random_start=True)
+	d_cards, p_cards, d_state, p_state, a_state = deal_cards(random_start=shoe is None, shoe=shoe)
 	
 	# Store state and action in our episode
 	first_state = (d_state, p_state, a_state)
@@ -188,7 +207,7 @@ def run_episode(on_policy=False, policy=None, hard_policy=False):
 		# print(f"Cards P/D {p_cards} / {d_cards}, States: {state}, P HIT")
 		
 		# Draw new cards, update state, and get player score
-		p_cards = np.append(p_cards, deal_card())	# Draw a new card
+		p_cards = np.append(p_cards, deal_card(shoe))	# Draw a new card
 		p_state, a_state = cards_to_state(p_cards)	# Get the new state of the player
 		p_score = get_score(p_cards)	# Get the player score
 		
@@ -215,7 +234,7 @@ def run_episode(on_policy=False, policy=None, hard_policy=False):
 	# If the dealer's score is less than 17
 	while d_score < 17:
 		# print(f"Cards P/D {p_cards} / {d_cards}, States: {state}, D HIT")
-		d_cards = np.append(d_cards, deal_card())	# Draw a new card
+		d_cards = np.append(d_cards, deal_card(shoe))	# Draw a new card
 		d_score = get_score(d_cards, is_dealer=True)	# Update score
 		
 	# print(f"Cards P/D {p_cards} / {d_cards}")
@@ -226,7 +245,7 @@ def run_episode(on_policy=False, policy=None, hard_policy=False):
 
 # Run a bunch of episodes to check win-rate with provided policy
 # If no policy is provided, a random policy will be used as baseline
-def check_win_rate(on_policy=False, policy=None):
+def check_win_rate(on_policy=False, policy=None, shoe=None):
 
 	wins = 0
 	losses = 0
@@ -238,7 +257,7 @@ def check_win_rate(on_policy=False, policy=None):
 	for t in range(CHECK_COUNT):
 	
 		# Run an episode on hard policy
-		_,_,reward, outcome = run_episode(on_policy=on_policy, policy=policy, hard_policy=True)
+		_,_,reward, outcome = run_episode(on_policy=on_policy, policy=policy, hard_policy=True, shoe=shoe)
 		
 		# Keep running total of wins and losses
 		wins += 1 if reward == WIN else 0
@@ -248,6 +267,98 @@ def check_win_rate(on_policy=False, policy=None):
 	
 	return 100.0*wins/games, 100.0*losses/games, outcomes
 
+# Probability of drawing each card value from the infinite deck (index 0 unused), 10 covers the face cards
+CARD_PROBS = np.array([0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 4]) / 13
+
+DEALER_STANDS = 17
+FINAL_SCORES = 21 - DEALER_STANDS + 2	# the dealer ends on 17 to 21, or bust (the last entry)
+
+# Score of a hand given its hard total (aces count 1) and whether it holds an ace
+def get_hand_score(total, has_ace):
+	return total + 10 if (has_ace and total < 12) else total
+
+# Returns the distribution of the dealer's final score for every face up card, shape (DEALER_STATES, FINAL_SCORES)
+# Computed backwards from the largest hard totals, so every hand's next hands are already done
+def get_dealer_distribution():
+
+	final = np.zeros((22, 2, FINAL_SCORES))	# [total, has_ace]
+	for total in range(21, 0, -1):
+		for ace in (0, 1):
+			score = get_hand_score(total, ace)
+			if score >= DEALER_STANDS:
+				final[total, ace, score - DEALER_STANDS] = 1
+				continue
+
+			for card in range(1, 11):
+				if total + card > 21:
+					final[total, ace, -1] += CARD_PROBS[card]
+				else:
+					final[total, ace] += CARD_PROBS[card] * final[total + card, int(ace or card == 1)]
+
+	return np.array([ sum(CARD_PROBS[hole] * final[up + hole, int(up == 1 or hole == 1)] for hole in range(1, 11)) for up in range(1, 11) ])
+
+# Returns the exact (win, draw, loss) probabilities of following the policy (a table of actions over
+# (dealer, player, ace) states) in the infinite deck game, with the same rules as run_episode
+#
+#	V (DEALER_STATES, PLAYER_STATES, ACE_STATES): expected return from each state, reached mid hand (not dealt 21).
+#		Player state 0 lumps every sum up to 11, its value is averaged over the 2 card hands dealt into it
+#	state_probs: (win, draw, loss) probabilities from each state, V is win - loss
+#	game_probs: (win, draw, loss) probabilities of a whole game, dealt from the deck
+#
+# Each hand's probabilities come from the hands one card later, so they're filled from 21 down, like the dealer's
+def evaluate_policy(policy):
+
+	dealer = get_dealer_distribution()
+	bust = np.array([0, 0, 1])
+
+	# (win, draw, loss) of standing on each score against every dealer card
+	stay = np.zeros((DEALER_STATES, 22, 3))
+	for score in range(22):
+		beaten = np.arange(DEALER_STANDS, 22) < score
+		tied = np.arange(DEALER_STANDS, 22) == score
+		stay[:, score, 0] = dealer[:, -1] + dealer[:, :-1] @ beaten
+		stay[:, score, 1] = dealer[:, :-1] @ tied
+		stay[:, score, 2] = 1 - stay[:, score, 0] - stay[:, score, 1]
+
+	probs = np.zeros((DEALER_STATES, 22, 2, 3))	# [dealer, total, has_ace]
+	for total in range(21, 1, -1):
+		for ace in (0, 1):
+			score = get_hand_score(total, ace)
+			p_state, a_state = max(0, score - 11), int(score != total)
+
+			hit = np.zeros((DEALER_STATES, 3))
+			for card in range(1, 11):
+				hit += CARD_PROBS[card] * (bust if total + card > 21 else probs[:, total + card, int(ace or card == 1)])
+
+			hits = (policy[:, p_state, a_state] == HIT)[:, np.newaxis]
+			probs[:, total, ace] = np.where(hits, hit, stay[:, score])
+
+	# Every 2 card hand, and the probability of it being dealt
+	first, second = np.meshgrid(np.arange(1, 11), np.arange(1, 11), indexing="ij")
+	totals, aces = (first + second).ravel(), ((first == 1) | (second == 1)).ravel().astype(int)
+	deal = np.outer(CARD_PROBS[1:], CARD_PROBS[1:]).ravel()
+	natural = aces.astype(bool) & (totals == 11)
+
+	state_probs = np.zeros((DEALER_STATES, PLAYER_STATES, ACE_STATES, 3))
+	for p_state in range(1, PLAYER_STATES):
+		state_probs[:, p_state, 0] = probs[:, p_state + 11, 0]
+		state_probs[:, p_state, 1] = probs[:, p_state + 1, 1]
+
+	low = ~aces.astype(bool) & (totals <= 11)
+	state_probs[:, 0, 0] = np.tensordot(probs[:, totals[low], 0], deal[low], axes=([1], [0])) / np.sum(deal[low])
+	state_probs[:, 0, 1] = np.nan	# a hand with a usable ace is always at least 12
+
+	# A dealt 21 stays and only draws against the dealer's own 21 (an ace and a ten)
+	dealer_natural = np.zeros(DEALER_STATES)
+	dealer_natural[0], dealer_natural[9] = CARD_PROBS[10], CARD_PROBS[1]
+	natural_probs = np.stack([ 1 - dealer_natural, dealer_natural, np.zeros(DEALER_STATES) ], axis=1)
+
+	game_probs = CARD_PROBS[1:] @ (np.tensordot(probs[:, totals[~natural], aces[~natural]], deal[~natural], axes=([1], [0]))
+		+ np.sum(deal[natural]) * natural_probs)
+
+	V = state_probs[..., 0] - state_probs[..., 2]
+	return V, state_probs, game_probs
+
 # Plot the Q function and the current policy
 def plot_Q_policy(Q, policy):
 	
@@ -312,11 +423,11 @@ def main():
 		# Update the policy
 		policy[s1,s2,s3] = np.argmax( Q[s1,s2,s3,:] )
 		
-		# Every so often, check current win and lose rate
+		# Every so often, check current win and lose rate, exactly instead of sampling games
 		if episode_count % CHECK_EVERY == 0:
 			
-			win_rate, lose_rate, outcomes = check_win_rate(on_policy=True, policy=policy)
-			print(f"Ran {episode_count//1000}k eps, W/L: {win_rate:.1f} / {lose_rate:.1f}, O: {outcomes}")
+			_, _, (win, draw, loss) = evaluate_policy(policy)
+			print(f"Ran {episode_count//1000}k eps, W/D/L: {100*win:.2f} / {100*draw:.2f} / {100*loss:.2f}, return {win - loss:.4f}")
 
 		# Every so often, ask the user if they want to keep training
 		if episode_count % RUN_PERIOD == 0:
@@ -335,8 +446,8 @@ def main():
 		# input("Press a key to continue\n\n")
 	
 	# Print final w/l rates
-	win_rate, lose_rate = check_win_rate(on_policy=True, policy=policy)
-	print(f"\n\n-------------------------------\nRan {episode_count} episodes, FINAL W/L: {win_rate:.2f} / {lose_rate:.2f}\n-------------------------------\n")
+	_, _, (win, draw, loss) = evaluate_policy(policy)
+	print(f"\n\n-------------------------------\nRan {episode_count} episodes, FINAL W/L: {100*win:.2f} / {100*loss:.2f}\n-------------------------------\n")
 	plot_Q_policy(Q, policy)
 	
 if __name__=="__main__":
@@ -0,0 +1,212 @@
+import time
+import numpy as np
+
+from Blackjack import DEALER_STATES, PLAYER_STATES, ACE_STATES, ACTION_COUNT, STAY, HIT, WIN, DRAW, LOSS
+from Blackjack import OUTCOMES, LOW_SCORE, HIGH_SCORE, EQUAL_SCORE, PLAYER_BUST, DEALER_BUST
+from Blackjack import run_episode, evaluate_policy, plot_Q_policy
+
+# Plays many hands of Blackjack at once from an infinite deck, with the same states as Blackjack.py
+#
+# Every hand is a hard total (aces count 1) and whether it holds an ace, so drawing is an add.
+# Each round, every hand still drawing looks up its action in the policy table and draws together,
+# then the dealer plays out every hand that stood the same way
+
+BATCH_SIZE = 10000
+RUN_PERIOD = 200000
+CHECK_COUNT = 100000
+
+PAD = -1	# fills states and actions past the end of a hand
+
+# The states, actions and rewards of a batch of hands, padded to the longest hand
+# states (hands, steps, 3) are (dealer, player, usable_ace) indices, rewards (hands, steps)
+# are 0 until the last step of each hand, which gets its result
+class EpisodeBatch:
+	def __init__(self, states, actions, rewards, lengths, outcomes):
+		self.states = states
+		self.actions = actions
+		self.rewards = rewards
+		self.lengths = lengths
+		self.outcomes = outcomes
+
+	# Mask of the steps each hand actually took, (hands, steps)
+	def get_mask(self):
+		return np.arange(self.actions.shape[1]) < self.lengths[:, np.newaxis]
+
+# Draws n cards from an infinite deck, 11-13 count as 10
+def deal_cards(rng, n):
+	return np.minimum(10, rng.integers(1, 14, size=n))
+
+# Best score of each hand, an ace counts 11 if that doesn't bust it
+def get_scores(totals, has_ace):
+	return totals + 10 * (has_ace & (totals < 12))
+
+# State indices of each hand, as in Blackjack.cards_to_state
+def get_states(totals, has_ace):
+	usable = has_ace & (totals < 12)
+	p_state = np.clip(get_scores(totals, has_ace) - 11, 0, PLAYER_STATES-1)
+	return p_state, usable.astype(int)
+
+def get_rewards(d_scores, p_scores):
+
+	rewards = np.where(p_scores > d_scores, WIN, np.where(p_scores < d_scores, LOSS, DRAW))
+	outcomes = np.where(p_scores > d_scores, HIGH_SCORE, np.where(p_scores < d_scores, LOW_SCORE, EQUAL_SCORE))
+
+	dealer_bust = d_scores > 21
+	rewards[dealer_bust], outcomes[dealer_bust] = WIN, DEALER_BUST
+
+	player_bust = p_scores > 21
+	rewards[player_bust], outcomes[player_bust] = LOSS, PLAYER_BUST
+
+	return rewards, outcomes
+
+# Plays n hands, returns an EpisodeBatch
+#
+# policy is a (DEALER_STATES, PLAYER_STATES, ACE_STATES) table of actions. With probability epsilon
+# a hand takes a random action instead. With exploring_starts, every hand starts from a uniformly random
+# state (player sum 12 to 21) with a random first action, otherwise hands are dealt from the deck
+def play_hands(policy, n, rng=None, epsilon=0, exploring_starts=False):
+
+	rng = np.random.default_rng() if rng is None else rng
+	hands = np.arange(n)
+
+	if exploring_starts:
+		d_up = rng.integers(DEALER_STATES, size=n) + 1
+		usable = rng.integers(ACE_STATES, size=n).astype(bool)
+		p_scores = rng.integers(12, 22, size=n)
+		p_totals = p_scores - 10*usable
+		p_ace = usable
+	else:
+		d_up = deal_cards(rng, n)
+		first, second = deal_cards(rng, n), deal_cards(rng, n)
+		p_totals = first + second
+		p_ace = (first == 1) | (second == 1)
+
+	d_hole = deal_cards(rng, n)
+	d_totals = d_up + d_hole
+	d_ace = (d_up == 1) | (d_hole == 1)
+	d_state = d_up - 1
+
+	states, actions = [], []
+	lengths = np.zeros(n, dtype=int)
+
+	# Hands dealt 21 stay without asking the policy, and the dealer doesn't draw, like Blackjack.run_episode
+	natural = get_scores(p_totals, p_ace) == 21
+	drawing = ~natural
+	stayed = np.zeros(n, dtype=bool)
+
+	step = 0
+	while True:
+		# Hands dealt 21 record their one STAY at step 0, hands done drawing are padded
+		recorded = drawing | (natural & (step == 0))
+		if not np.any(recorded):
+			break
+
+		p_state, a_state = get_states(p_totals, p_ace)
+		step_states = np.stack([ d_state, p_state, a_state ], axis=1)
+
+		step_actions = np.where(drawing, policy[d_state, p_state, a_state], STAY)
+		explore = rng.random(n) < (1 if (exploring_starts and step == 0) else epsilon)
+		step_actions = np.where(drawing & explore, rng.integers(ACTION_COUNT, size=n), step_actions)
+
+		states.append(np.where(recorded[:, np.newaxis], step_states, PAD))
+		actions.append(np.where(recorded, step_actions, PAD))
+		lengths += recorded
+
+		hit = drawing & (step_actions == HIT)
+		stayed |= drawing & (step_actions == STAY)
+
+		cards = deal_cards(rng, np.count_nonzero(hit))
+		p_totals[hit] += cards
+		p_ace[hit] |= cards == 1
+
+		# Busted hands are done, the rest of the hands that hit draw again
+		drawing = hit & (p_totals <= 21)
+		step += 1
+
+	# The dealer draws to 17 for every hand that stood
+	drawing = stayed
+	while True:
+		drawing &= get_scores(d_totals, d_ace) < 17
+		if not np.any(drawing):
+			break
+		cards = deal_cards(rng, np.count_nonzero(drawing))
+		d_totals[drawing] += cards
+		d_ace[drawing] |= cards == 1
+
+	rewards, outcomes = get_rewards(get_scores(d_totals, d_ace), get_scores(p_totals, p_ace))
+
+	actions = np.stack(actions, axis=1)
+	step_rewards = np.zeros(actions.shape)
+	step_rewards[hands, lengths - 1] = rewards
+
+	return EpisodeBatch(np.stack(states, axis=1), actions, step_rewards, lengths, outcomes)
+
+# Returns the return from every step of every hand (undiscounted), 0 past the end of a hand
+def get_returns(batch):
+	return np.cumsum(batch.rewards[:, ::-1], axis=1)[:, ::-1]
+
+# Monte Carlo update of Q with every step of the batch, each (state, action) moves towards the mean of its returns
+# A hand never visits a state twice, so this is both first and every visit MC
+def mc_update(Q, N, batch):
+
+	mask = batch.get_mask()
+	d, p, a = batch.states[mask].T
+	action = batch.actions[mask]
+	G = get_returns(batch)[mask]
+
+	idx = np.ravel_multi_index((d, p, a, action), Q.shape)
+	counts = np.bincount(idx, minlength=Q.size).reshape(Q.shape)
+	sums = np.bincount(idx, weights=G, minlength=Q.size).reshape(Q.shape)
+
+	N += counts
+	visited = counts > 0
+	Q[visited] += (sums[visited] - counts[visited]*Q[visited]) / N[visited]
+
+# Returns the win rate, loss rate (in %) and outcome counts of the greedy policy
+def check_win_rate(policy, rng, hands=CHECK_COUNT):
+	batch = play_hands(policy, hands, rng)
+	rewards = batch.rewards[np.arange(hands), batch.lengths - 1]
+	return 100.0*np.mean(rewards == WIN), 100.0*np.mean(rewards == LOSS), np.bincount(batch.outcomes, minlength=OUTCOMES)
+
+# Hands per second of Blackjack.run_episode against play_hands
+def benchmark(policy, rng, hands=20000):
+
+	start = time.perf_counter()
+	for _ in range(hands):
+		run_episode(on_policy=True, policy=policy, hard_policy=True)
+	loop_rate = hands / (time.perf_counter() - start)
+
+	start = time.perf_counter()
+	play_hands(policy, hands, rng)
+	batch_rate = hands / (time.perf_counter() - start)
+
+	print(f"run_episode: {loop_rate:.0f} hands/s, play_hands: {batch_rate:.0f} hands/s")
+
+# Monte Carlo control with exploring starts, one batch of hands at a time
+def main():
+
+	rng = np.random.default_rng(0)
+
+	# Exploring starts never visit sums up to 11, so always hit there, like Blackjack.py
+	Q = np.zeros((DEALER_STATES, PLAYER_STATES, ACE_STATES, ACTION_COUNT))
+	Q[:,0,:,HIT] = 1
+	N = np.zeros_like(Q)
+	policy = np.full(Q.shape[:-1], HIT)
+	policy[:, -1, :] = STAY		# stay on 21
+
+	benchmark(policy, rng)
+
+	for episode_count in range(BATCH_SIZE, 50*RUN_PERIOD + 1, BATCH_SIZE):
+
+		batch = play_hands(policy, BATCH_SIZE, rng, exploring_starts=True)
+		mc_update(Q, N, batch)
+		policy = np.argmax(Q, axis=3)
+
+		if episode_count % RUN_PERIOD == 0:
+			_, _, (win, draw, loss) = evaluate_policy(policy)
+			print(f"Ran {episode_count//1000}k eps, W/D/L: {100*win:.2f} / {100*draw:.2f} / {100*loss:.2f}, return {win - loss:.4f}")
+
+	plot_Q_policy(Q, policy)
+
+if __name__=="__main__":
+	main()
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
-from cards import Card, Deck
+from cards import Card, Deck, Shoe
 from policy import Policy, QPolicy, DealerPolicy, StateSpace
 
 class Player(object):
@@ -128,8 +128,12 @@ class BlackJackGame(object):
 	DEALER_WIN_PLAYER_BUST = 4
 	TIE = 5
 
-	def __init__(self, player_policy = None, dealer_policy = None):
-		self.deck = Deck()
+	# deck is a cards.Deck (infinite) by default, or a cards.Shoe to play from a finite shoe
+	def __init__(self, player_policy = None, dealer_policy = None, deck = None):
+		self.deck = Deck() if deck == None else deck
+		if isinstance(self.deck, Shoe):
+			self.deck.StartRound()
+
 		self.player = Player(id=1, policy=player_policy)
 		self.player.AddCards(self.deck.DealCards(2))
 
@@ -147,8 +151,14 @@ class BlackJackGame(object):
 		self.player.DiscardHand()
 		self.dealer.DiscardHand()
 
-		self.player.AddCards(self.deck.DealCards(2, type=[Deck.ACE_50_50, Deck.ONLY_TEN]))
-		self.dealer.AddCards(self.deck.DealCards(2, type=[Deck.ONE_TO_TEN, Deck.ONE_TO_TEN]))
+		# A shoe deals real hands, reshuffling between rounds once past its cut card
+		if isinstance(self.deck, Shoe):
+			self.deck.StartRound()
+			self.player.AddCards(self.deck.DealCards(2))
+			self.dealer.AddCards(self.deck.DealCards(2))
+		else:
+			self.player.AddCards(self.deck.DealCards(2, type=[Deck.ACE_50_50, Deck.ONLY_TEN]))
+			self.dealer.AddCards(self.deck.DealCards(2, type=[Deck.ONE_TO_TEN, Deck.ONE_TO_TEN]))
 
 		self.outcome = self.IN_PROGRESS
 		self.player_stick = False
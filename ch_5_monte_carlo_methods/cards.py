@@ -1,24 +1,64 @@
+import itertools
 import numpy as np
 
+# A card is packed into a small int, (rank << 2) | suit, with rank 1-13 and suit 0-3
+SUITS = 4
+RANKS = 13
+
+def encode(suit, rank):
+	return (np.asarray(rank, dtype=np.uint8) << 2) | np.asarray(suit, dtype=np.uint8)
+
+def get_rank(codes):
+	return np.asarray(codes) >> 2
+
+def get_suit(codes):
+	return np.asarray(codes) & 3
+
+# Blackjack value of each card, face cards count 10 and aces 1, as ints so sums don't overflow a uint8
+def get_value(codes):
+	return np.minimum(get_rank(codes), 10).astype(int)
+
+# Every card gets a unique ID for RemoveCardByID, counting up is cheaper than drawing one
+_card_ids = itertools.count()
+
+# An object view of a packed card, for code that wants one
 class Card(object):
 
+	__slots__ = ("code", "ID")
+
 	def __init__(self, suit=None, value=None):
-		self.ID = np.random.randint(2**31)
-		
-		if not suit == None:
-			self.suit = suit
-		else:
-			self.suit = np.random.randint(4)
-		
+		self.ID = next(_card_ids)
+
+		if suit == None:
+			suit = np.random.randint(SUITS)
+
 		if not value == None:
 			if value < 1 or value > 13:
 				raise ValueError("Value of card must be between 1 and 13, inclusive")
-			self.number = value
 		else:
-			self.number = np.random.randint(low=1, high=13+1)
+			value = np.random.randint(low=1, high=RANKS+1)
+
+		self.code = int(encode(suit, value))
+
+	# Makes a Card from its code, without drawing anything
+	@classmethod
+	def FromCode(cls, code):
+		card = cls.__new__(cls)
+		card.code = int(code)
+		card.ID = next(_card_ids)
+		return card
+
+	@property
+	def number(self):
+		return self.code >> 2
+
+	@property
+	def suit(self):
+		return self.code & 3
 
-		# Set flag if number is 1
-		self.is_ace = (self.number == 1)
+	@property
+	def is_ace(self):
+		return self.number == 1
 
 	def __repr__(self):
 		return "{}".format(self.number)
@@ -29,44 +69,177 @@ class Deck():
 	ACE_50_50 = 1
 	ONE_TO_TEN = 2
 	ONLY_TEN = 3
+	TYPES = (RANDOM, ACE_50_50, ONE_TO_TEN, ONLY_TEN)
 
-	def __init__(self):
-		pass
+	# Cards are drawn block_size at a time for each type, and served from the blocks
+	def __init__(self, block_size=4096, seed=None):
+		self.block_size = block_size
+		self.rng = np.random if seed is None else np.random.RandomState(seed)
 
-	def DealCard(self, type = None):
-		# If the caller wants a 50/50 chance of ACE
+		self._blocks = dict( (type, np.zeros(0, dtype=np.uint8)) for type in Deck.TYPES )
+		self._pos = dict( (type, 0) for type in Deck.TYPES )
+
+	# Draws the next block of codes for the type
+	def _Sample(self, type, size):
+		suits = self.rng.randint(SUITS, size=size)
+
+		# 50/50 chance of an ace, otherwise equal chance of the 10 possible values
 		if type == Deck.ACE_50_50:
-			if np.random.rand() > 0.5:
-				return Card(value=1)
-			else:
-				return Card( value = np.random.randint(low=1, high=10+1) )
+			ranks = np.where(self.rng.rand(size) > 0.5, 1, self.rng.randint(low=1, high=10+1, size=size))
 
-		# If the caller wants equal chance of the 10 possible values
+		# Equal chance of the 10 possible values
 		elif type == Deck.ONE_TO_TEN:
-			return Card( value = np.random.randint(low=1, high=10+1) )
+			ranks = self.rng.randint(low=1, high=10+1, size=size)
 
-		# If the caller wants a guarenteed 10
+		# Guaranteed 10
 		elif type == Deck.ONLY_TEN:
-			return Card(value=10)
+			ranks = np.full(size, 10)
 
-		# If the caller wants a random card from Ace to King
+		# A random card from Ace to King
 		else:
-			return Card( value = np.random.randint(low=1, high=13+1) )
+			ranks = self.rng.randint(low=1, high=RANKS+1, size=size)
+
+		return encode(suits, ranks)
+
+	def DealCodes(self, num, type=None):
+		"""Returns the codes of the next num cards of the type, as a uint8 array"""
+		# None or any type that isn't one of Deck.TYPES deals RANDOM cards, as DealCard always has
+		type = type if type in Deck.TYPES else Deck.RANDOM
+		block, pos = self._blocks[type], self._pos[type]
+
+		if pos + num > len(block):
+			block = np.concatenate([ block[pos:], self._Sample(type, max(self.block_size, num)) ])
+			pos = 0
+
+		self._blocks[type], self._pos[type] = block, pos + num
+		return block[pos:pos + num]
+
+	def DealCard(self, type = None):
+		return Card.FromCode(self.DealCodes(1, type)[0])
 
 	def DealCards(self, num, type=None):
-		
-		cards = []
-		
+
 		# Check if type is given and is correct length
 		if not type == None:
 			if not len(type) == num:
 				raise ValueError("If not None, type must be a list of len num: {}".format(num))
 
-			for ii in range(num):
-				cards.append( self.DealCard(type=type[ii]) )
-		
+			codes = np.zeros(num, dtype=np.uint8)
+			type = np.asarray(type)
+			for this_type in np.unique(type):
+				dealt = type == this_type
+				codes[dealt] = self.DealCodes(np.count_nonzero(dealt), this_type)
+
 		else:
-			for ii in range(num):
-				cards.append( self.DealCard() )
-				
-		return cards
\ No newline at end of file
+			codes = self.DealCodes(num)
+
+		return [ Card.FromCode(code) for code in codes ]
+
+# Hi-Lo count of each rank (index 0 unused), 2-6 are +1, 7-9 are 0, tens and aces are -1
+HI_LO = np.array([0, -1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1])
+
+# A finite shoe of decks, dealt in order from a shuffled uint8 array of codes
+#
+# Dealing advances a cursor, so it's O(1) per card, and the running count is updated with every
+# card dealt (including ones a player wouldn't see yet, like the dealer's hole card).
+# Call StartRound before each round: once the cursor passes the cut card (penetration of the shoe),
+# it reshuffles every card back in. A round that runs out of cards only reshuffles the discards
+# and undealt cards, the cards in play this round stay out of the shoe
+class Shoe(object):
+
+	def __init__(self, decks=6, penetration=0.75, count_values=HI_LO, seed=None):
+
+		if decks < 1:
+			raise ValueError("Need at least 1 deck, got {}".format(decks))
+		if not 0 < penetration <= 1:
+			raise ValueError("penetration must be in (0, 1], got {}".format(penetration))
+
+		self.decks = decks
+		self.penetration = penetration
+		self.rng = np.random if seed is None else np.random.RandomState(seed)
+
+		suits, ranks = np.meshgrid(np.arange(SUITS), np.arange(1, RANKS+1))
+		self.cards = np.tile(encode(suits.ravel(), ranks.ravel()), decks)
+		self.cut = int(penetration * len(self.cards))
+
+		# Count value of every code, so counting is a lookup
+		self.count_values = np.asarray(count_values)[np.arange((RANKS+1) << 2) >> 2]
+
+		self.shuffles = 0
+		self.Shuffle()
+
+	def Shuffle(self):
+		"""Shuffles every card back into the shoe, in place, only call it between rounds"""
+		self.rng.shuffle(self.cards)
+		self.cursor = 0
+		self.round_start = 0	# cursor when this round started, cards from here on are in play
+		self.running_count = 0
+		self.shuffles += 1
+
+	def StartRound(self):
+		"""Reshuffles if the cut card has come out, returns True if it did"""
+		shuffled = self.cursor >= self.cut
+		if shuffled:
+			self.Shuffle()
+		self.round_start = self.cursor
+		return shuffled
+
+	# Shuffles the discards back in with the undealt cards, keeping the cards in play this round
+	# at the front of the shoe as already dealt, and restarts the count from them
+	def _ShuffleMidRound(self):
+		in_play = self.cards[self.round_start:self.cursor]
+		rest = np.concatenate([ self.cards[:self.round_start], self.cards[self.cursor:] ])
+		self.rng.shuffle(rest)
+
+		self.cards = np.concatenate([ in_play, rest ])
+		self.cursor = len(in_play)
+		self.round_start = 0
+		self.running_count = int(np.sum(self.count_values[in_play]))
+		self.shuffles += 1
+
+	@staticmethod
+	def _CheckType(type):
+		if not (type == None or type == Deck.RANDOM):
+			raise ValueError("A Shoe can only deal RANDOM cards, got type {}".format(type))
+
+	def DealCodes(self, num, type=None):
+		"""Returns the codes of the next num cards as a uint8 array, and counts them"""
+		Shoe._CheckType(type)
+
+		if self.cursor + num > len(self.cards):
+			if self.cursor - self.round_start + num > len(self.cards):
+				raise ValueError("Can't deal {} cards, {} of the {} in the shoe are in play this round".format(
+					num, self.cursor - self.round_start, len(self.cards)))
+			self._ShuffleMidRound()
+
+		# Copy, so a later shuffle can't change cards already dealt
+		codes = self.cards[self.cursor:self.cursor + num].copy()
+		self.cursor += num
+		self.running_count += int(np.sum(self.count_values[codes]))
+		return codes
+
+	def DealCard(self, type=None):
+		return Card.FromCode(self.DealCodes(1, type)[0])
+
+	def DealCards(self, num, type=None):
+		if not type == None:
+			if not len(type) == num:
+				raise ValueError("If not None, type must be a list of len num: {}".format(num))
+			for this_type in type:
+				Shoe._CheckType(this_type)
+
+		return [ Card.FromCode(code) for code in self.DealCodes(num) ]
+
+	def GetCardsLeft(self):
+		return len(self.cards) - self.cursor
+
+	def GetPenetration(self):
+		"""Fraction of the shoe dealt since the last shuffle"""
+		return float(self.cursor) / len(self.cards)
+
+	def GetRunningCount(self):
+		return self.running_count
+
+	def GetTrueCount(self):
+		"""Running count per deck left in the shoe"""
+		return self.running_count / max(self.GetCardsLeft() / 52.0, 1 / 52.0)
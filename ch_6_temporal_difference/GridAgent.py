@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from Gridworld import Gridworld
+from CurveAggregator import CurveAggregator
+from TabularRLUtils import CompileGreedyTable
 		
 class GridAgent:
 	
@@ -28,12 +30,23 @@ class GridAgent:
 		self.best_Q = self.Q
 		self.path = []
 		self.G_best = []
-		self.G_list = []
+		self.G_curve = CurveAggregator(horizon=kwargs.get("G_horizon", 10000), max_bins=kwargs.get("G_max_bins", 1000))	# return per training episode
+		self.episodes = 0
 		self.policy = np.zeros((H,W))
 		self.start = start_pos
 		
 		self.actions = kwargs.get("actions", [0, 1, 2, 3])
 		self.num_A = num_A
+		
+		self.frozen = None	# compiled greedy table (best, has_tie, tie_mask), None while Q can change
+	
+	# Compiles Q into a greedy decision table, so a static agent picks actions in O(1)
+	def freeze(self):
+		self.frozen = CompileGreedyTable(self.Q)
+	
+	# Drops the compiled table, needed whenever Q changes
+	def unfreeze(self):
+		self.frozen = None
 	
 	# eps-greedy policy based on current Q
 	def _get_action(self, S, train=True, all_best=False):
@@ -41,6 +54,13 @@ class GridAgent:
 		if (np.random.rand() < self.eps) and train: 	# occasionally select a random action	
 			selection = self.actions
 			
+		elif self.frozen is not None:	# look up the tied best actions in the compiled table
+			best, has_tie, tie_mask = self.frozen
+			if has_tie[S[0], S[1]]:
+				selection = list(np.flatnonzero(tie_mask[S[0], S[1], :]))
+			else:
+				selection = [best[S[0], S[1]]]
+			
 		else:	# get a set of actions tied for the max value for this state 
 			vals = self.Q[S[0], S[1], :]
 			selection = [a for a, v in enumerate(vals) if v == np.max(vals)]
@@ -175,11 +195,18 @@ class GridAgent:
 						[1, 1, 1, 1, 1, 1, 1, 1, 1, 0] 	]
 	
 		self.Q = Q
+		self.unfreeze()
 	
 	# Runs a single episode in the provided world
 	def run_episode(self, world, move_timeout=1000, train=True, print_moves=100, method=None):
 	
 		if method==None: method = GridAgent.SARSA
+		
+		# Q only changes while training, so compile it for greedy runs and drop it otherwise
+		if train:
+			self.unfreeze()
+		elif self.frozen is None:
+			self.freeze()
 	
 		moves = 1		# moves made this episode
 		G = 0			# total returns of episode
@@ -229,7 +256,8 @@ class GridAgent:
 			
 			G, path = self.run_episode(world, move_timeout=move_timeout, train=True, print_moves=print_moves, method=method)
 			
-			self.G_list.append(G)
+			self.G_curve.Add(self.episodes, G)
+			self.episodes += 1
 			
 			if G > best_G:
 				print(f"Best run improved to {-G} moves")
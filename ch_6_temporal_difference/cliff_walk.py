@@ -1,5 +1,11 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
+
+# GridAgent imports from tabular_rl
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+
 from Gridworld import Gridworld
 from GridAgent import GridAgent
 
@@ -105,7 +111,7 @@ def main():
 	
 	
 	
-	ax[1].plot(cliff_agent.G_list)
+	ax[1].plot(cliff_agent.G_curve.GetSteps(), cliff_agent.G_curve.GetMean())
 	plt.show()
 	
 	
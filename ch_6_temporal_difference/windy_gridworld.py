@@ -1,5 +1,11 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
+
+# GridAgent imports from tabular_rl
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+
 from Gridworld import Gridworld
 from GridAgent import GridAgent
 
@@ -76,7 +82,7 @@ def main():
 	fig, ax = plt.subplots(2,1)
 	ax[0].imshow( windy_world.get_image(), origin="upper" )
 	ax[0].plot(x,y)
-	ax[1].plot(windy_agent.G_list)
+	ax[1].plot(windy_agent.G_curve.GetSteps(), windy_agent.G_curve.GetMean())
 	plt.show()
 	
 if __name__=="__main__":
@@ -1,4 +1,6 @@
 import numpy as np
+from CurveAggregator import CurveAggregator
+from TabularRLUtils import CompileGreedyTable
 
 class LineAgent:
 	
@@ -33,13 +35,31 @@ class LineAgent:
 		self.path = []
 		
 		self.G_best = []
-		self.G_list = []
+		self.G_curve = CurveAggregator(horizon=kwargs.get("G_horizon", 10000), max_bins=kwargs.get("G_max_bins", 1000))	# return per training episode
+		self.episodes = 0
+		
+		self.frozen = None	# compiled greedy table (best, has_tie, tie_mask), None while Q can change
+		
+	# Compiles Q into a greedy decision table, so a static agent picks actions in O(1)
+	def freeze(self):
+		self.frozen = CompileGreedyTable(self.Q)
+	
+	# Drops the compiled table, needed whenever Q changes
+	def unfreeze(self):
+		self.frozen = None
 		
 	def _get_action(self, S, train=True, all_best=False):
 		
 		if (np.random.rand() < self.eps) and train: 	# occasionally select a random action	
 			selection = self.actions
 			
+		elif self.frozen is not None:	# look up the tied best actions in the compiled table
+			best, has_tie, tie_mask = self.frozen
+			if has_tie[S]:
+				selection = list(np.flatnonzero(tie_mask[S, :]))
+			else:
+				selection = [best[S]]
+			
 		else:	# get a set of actions tied for the max value for this state 
 			vals = self.Q[S, :]
 			selection = [a for a, v in enumerate(vals) if v == np.max(vals)]
@@ -99,6 +119,12 @@ class LineAgent:
 	def run_episode(self, world, move_timeout=1000, train=True, print_moves=100, method=None, n_step=1):
 	
 		if method==None: method = LineAgent.SARSA
+		
+		# Q only changes while training, so compile it for greedy runs and drop it otherwise
+		if train:
+			self.unfreeze()
+		elif self.frozen is None:
+			self.freeze()
 	
 		moves = 1		# moves made this episode
 		G = 0			# total returns of episode
@@ -146,7 +172,8 @@ class LineAgent:
 			
 			G, path = self.run_episode(world, move_timeout=move_timeout, train=True, print_moves=print_moves, method=method, n_step=n_step)
 			
-			self.G_list.append(G)
+			self.G_curve.Add(self.episodes, G)
+			self.episodes += 1
 			
 			if G > best_G:
 				print(f"Best run improved to {-G} moves")
@@ -1,5 +1,11 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
+
+# LineAgent imports from tabular_rl
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabular_rl"))
+
 from Lineworld import Lineworld
 from LineAgent import LineAgent
 
@@ -55,7 +61,7 @@ def main():
 	
 	# Plot the final path that agent took, and its rewards over course of training
 	fig, ax = plt.subplots()
-	ax.plot(line_agent.G_list)
+	ax.plot(line_agent.G_curve.GetSteps(), line_agent.G_curve.GetMean())
 	plt.show()
 	
 	
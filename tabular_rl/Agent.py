@@ -57,7 +57,7 @@ class Agent(object):
 			raise TypeError
 	
 		self._id = kwargs.get("ID", np.random.randint(2**31-1))
-		self._is_training = kwargs.get("is_training", True)
+		self.SetTrainable(kwargs.get("is_training", True))
 
 	def IsTrainable(self):
 		return self._is_training
@@ -68,6 +68,16 @@ class Agent(object):
 		else:
 			self._is_training = False
 
+		# A static agent's policy can't change, so compile it for fast actions
+		if self._CanFreeze():
+			if self._is_training:
+				self._policy.Unfreeze()
+			else:
+				self._policy.Freeze()
+
+	def _CanFreeze(self):
+		return isinstance(self._policy, TabularPolicy) and self._policy.type == Policy.ACTION_STATE_VALUES
+
 	def GetCurrState(self):
 		"""Returns the current state of the agent"""
 		return self.curr_state
@@ -161,6 +171,14 @@ if __name__=="__main__":
 			self.agent.ImprovePolicy(pkt)
 			self.assertFalse(self.agent.GetAction((0,0)) == 2)
 
+		def test_SetTrainable(self):
+			self.agent.SetTrainable(False)
+			self.assertTrue(self._policy.IsFrozen())
+			self.assertTrue(self.agent.GetAction((0,0)) in self._policy.GetFrozenActions((0,0)))
+
+			self.agent.SetTrainable(True)
+			self.assertFalse(self._policy.IsFrozen())
+
 		def test_GetAction(self):
 			self.assertTrue(self.agent.GetAction((0,0)) == self._policy.GetAction((0,0)))
 			self.assertTrue(self.agent.GetAction((3,5)) == self._policy.GetAction((3,5)))
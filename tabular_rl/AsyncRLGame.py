@@ -0,0 +1,253 @@
+# -*- coding: future_fstrings -*-
+import sys
+import asyncio
+import numpy as np
+
+import logging
+from logging import debug as DEBUG
+from logging import info as INFO
+from logging import warn as WARN
+from logging import error as ERROR
+from logging import critical as CRITICAL
+
+from RLGame import RLGame
+from AsyncWorld import AsyncWorld
+
+class AsyncRLGame(RLGame):
+
+	"""
+	An RLGame that runs each agent as an asyncio task.
+
+	World steps are awaited, so while one agent waits on a slow world
+	the requests of other agents stay in flight. If the world is not an
+	AsyncWorld, episodes run exactly like RLGame.RunEpisode.
+
+	Attributes:
+		max_concurrency (int): max number of world calls in flight at once (None for no limit)
+		deadline (float): default time (s) an agent gets to finish an episode (None for no limit)
+		agent_deadlines (dict): deadline (s) by agent ID, overrides deadline for those agents
+	"""
+
+	def __init__(self, world, agents, **kwargs):
+		"""
+		Initializes an AsyncRLGame object
+
+		Params:
+		- world: [World] the world that this game operates in (AsyncWorld for concurrent steps)
+		- agents: [list] all the agents (initialized) participating in this game (must be list of type Agent)
+		- kwargs:
+			max_concurrency: [int] max number of world calls in flight at once
+			deadline: [float] default time (s) given to each agent per episode
+			agent_deadlines: [dict] deadline (s) per agent ID
+		"""
+		RLGame.__init__(self, world, agents)
+
+		self.max_concurrency = kwargs.pop("max_concurrency", None)
+		self.deadline = kwargs.pop("deadline", None)
+		self.agent_deadlines = dict(kwargs.pop("agent_deadlines", {}))
+
+		if len(kwargs) > 0:
+			raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+		if self.max_concurrency is not None and self.max_concurrency < 1:
+			raise ValueError(f"max_concurrency must be at least 1, got {self.max_concurrency}")
+
+		self._steps_taken = {}
+		self._timed_out = []
+
+	def IsAsyncWorld(self):
+		return isinstance(self._world, AsyncWorld)
+
+	def GetDeadline(self, id):
+		return self.agent_deadlines.get(id, self.deadline)
+
+	def GetTimedOutAgents(self):
+		"""Returns the IDs of agents that hit their deadline in the latest episode"""
+		return list(self._timed_out)
+
+	def RunEpisode(self, max_steps = None):
+		"""Blocking wrapper around RunEpisodeAsync"""
+		return asyncio.run(self.RunEpisodeAsync(max_steps))
+
+	async def RunEpisodeAsync(self, max_steps = None):
+		"""
+		Runs a single episode, with every agent stepping as its own task
+
+		Returns: (steps, history) where steps is the most steps taken by any agent
+		"""
+
+		if max_steps == None:
+			max_steps = RLGame.DEFAULT_NUM_STEPS_PER_EP
+
+		# Sync worlds keep the sequential semantics of RLGame
+		if not self.IsAsyncWorld():
+			return RLGame.RunEpisode(self, max_steps)
+
+		self._ResetHistory()
+		self._steps_taken = { id: 0 for id in self._agents.keys() }
+		self._timed_out = []
+
+		# Limits how many world calls are in flight at once
+		if self.max_concurrency is None:
+			semaphore = None
+		else:
+			semaphore = asyncio.Semaphore(self.max_concurrency)
+
+		tasks = [ self._RunAgentWithDeadline(agent, max_steps, semaphore) for agent in self._agents.values() ]
+		await asyncio.gather(*tasks)
+
+		step = max(self._steps_taken.values()) if len(self._steps_taken) > 0 else 0
+		INFO(f"Async episode complete after {step} steps, {len(self._timed_out)} agents timed out")
+
+		self._episodes.append(self._history)
+		return (step, self.GetLatestEpisodeHistory())
+
+	async def _RunAgentWithDeadline(self, agent, max_steps, semaphore):
+
+		deadline = self.GetDeadline(agent.GetID())
+
+		try:
+			await asyncio.wait_for(self._RunAgent(agent, max_steps, semaphore), timeout=deadline)
+		except asyncio.TimeoutError:
+			WARN(f"Agent {agent.GetID()} hit its deadline of {deadline}s after {self._steps_taken[agent.GetID()]} steps")
+			self._timed_out.append(agent.GetID())
+
+	async def _RunAgent(self, agent, max_steps, semaphore):
+
+		id = agent.GetID()
+
+		while self._steps_taken[id] < max_steps:
+
+			# if the agent is terminal, record the final state and stop stepping it
+			if await self._IsTerminalAsync(agent, semaphore):
+				self._history[id].Push(agent.GetCurrState(), None, None)
+				return
+
+			await self._StepAgentAsync(agent, semaphore)
+			self._steps_taken[id] += 1
+
+	async def _StepAgentAsync(self, agent, semaphore):
+
+		# grab the current state and take an action
+		s_prev = agent.GetCurrState()
+		a_next = int(agent.GetAction(s_prev))	# numpy ints fail the world and policy checks
+
+		# Await the world, this is where other agents get to run
+		if semaphore is None:
+			s_next, r_next = await self._world.StepAsync(s_prev, a_next)
+		else:
+			async with semaphore:
+				s_next, r_next = await self._world.StepAsync(s_prev, a_next)
+
+		# Update the state of the agent and store the S A R triplet into the history
+		agent.UpdateCurrentState( s_next )
+		self._history[agent.GetID()].Push(s_prev, a_next, r_next)
+
+		# If this is a trainable agent, then attempt to train
+		self._TrainAgent(agent)
+
+	async def _IsTerminalAsync(self, agent, semaphore):
+
+		if semaphore is None:
+			return await self._world.IsTerminalAsync(agent.GetCurrState())
+
+		async with semaphore:
+			return await self._world.IsTerminalAsync(agent.GetCurrState())
+
+
+if __name__=="__main__":
+
+	import unittest
+	import time
+	from collections import OrderedDict
+	from WorldSpace import WorldSpace
+	from TabularAgent import TabularAgent
+	from SarsaPolicy import SarsaPolicy
+
+	class SlowLineWorld(AsyncWorld):
+
+		def __init__(self, world_space, delay, **kwargs):
+			AsyncWorld.__init__(self, world_space, **kwargs)
+			self.delay = delay
+			self.in_flight = 0
+			self.max_in_flight = 0
+
+		def GetNextState(self, S, A):
+			S_next = np.array(S) + self.world_space.ActionVal(index=A)
+			if not self.world_space.IsValidState(S_next):
+				return tuple(S)
+			return tuple(S_next)
+
+		def GetReward(self, S):
+			return -1
+
+		def IsTerminal(self, S):
+			return np.all(np.array(S) == self.world_space.LastState())
+
+		async def StepAsync(self, S, A):
+			self.in_flight += 1
+			self.max_in_flight = max(self.max_in_flight, self.in_flight)
+			await asyncio.sleep(self.delay)
+			self.in_flight -= 1
+			return self.Step(S, A)
+
+		async def IsTerminalAsync(self, S):
+			return self.IsTerminal(S)
+
+	class TestAsyncRLGame(unittest.TestCase):
+
+		def setUp(self):
+			self.a_map = OrderedDict()
+			self.a_map['R'] = (1,)
+			self.a_map['L'] = (-1,)
+
+			self.p_kw = {}
+			self.p_kw['discount_factor'] = 1
+			self.p_kw['exploration_factor'] = 1
+			self.p_kw['is_static'] = False
+			self.p_kw['init_variance'] = 0.01
+
+			self.ws = WorldSpace((50,), self.a_map)
+			self.world = SlowLineWorld(self.ws, 0.01)
+
+			self.agents = []
+			for id in range(8):
+				policy = SarsaPolicy(self.ws, **self.p_kw)
+				self.agents.append( TabularAgent(policy, (0,), ID=id, is_training=False) )
+
+		def test_Concurrent(self):
+			game = AsyncRLGame(self.world, self.agents)
+
+			start = time.time()
+			steps, hist = game.RunEpisode(10)
+			elapsed = time.time() - start
+
+			# All 8 agents step concurrently, so this takes ~10 delays rather than ~80
+			self.assertEqual(steps, 10)
+			self.assertTrue(elapsed < 8*10*self.world.delay)
+			self.assertEqual(self.world.max_in_flight, len(self.agents))
+			for id in range(8):
+				self.assertEqual(len(hist[id]), 10)
+
+		def test_MaxConcurrency(self):
+			game = AsyncRLGame(self.world, self.agents, max_concurrency=3)
+			game.RunEpisode(5)
+			self.assertTrue(self.world.max_in_flight <= 3)
+
+			with self.assertRaises(ValueError):
+				AsyncRLGame(self.world, self.agents, max_concurrency=0)
+
+		def test_Deadline(self):
+			game = AsyncRLGame(self.world, self.agents, agent_deadlines={ 0: 0.035 })
+			steps, hist = game.RunEpisode(10)
+
+			# Only agent 0 should have been cut short
+			self.assertEqual(game.GetTimedOutAgents(), [0])
+			self.assertTrue(len(hist[0]) < 10)
+			self.assertEqual(len(hist[1]), 10)
+
+		def test_UnexpectedKwargs(self):
+			with self.assertRaises(KeyError):
+				AsyncRLGame(self.world, self.agents, random_kwarg=42)
+
+	unittest.main()
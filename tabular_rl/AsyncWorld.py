@@ -0,0 +1,98 @@
+# -*- coding: future_fstrings -*-
+
+import sys
+import asyncio
+import threading
+import numpy as np
+
+from World import World
+
+"""
+A World whose steps can be awaited, used by AsyncRLGame
+StepAsync returns the (next state, reward) pair for a (S,A) pair in one call,
+so worlds that keep per-step flags (like DynamicNDWorld) stay consistent
+By default, the blocking World methods are run in the event loop's executor
+Worlds wrapping a real async simulator should override StepAsync and IsTerminalAsync
+"""
+class AsyncWorld(World):
+
+    def __init__(self, world_space, **kwargs):
+        World.__init__(self, world_space)
+
+        # If the sync methods of this world can't run concurrently, serialize them with a lock
+        self.concurrent_steps = kwargs.pop('concurrent_steps', False)
+        self._step_lock = threading.Lock()
+
+        if len(kwargs) > 0:
+            raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+    # Returns the next state and its reward, in one (blocking) call
+    def Step(self, S, A):
+        if self.concurrent_steps:
+            S_next = self.GetNextState(S, A)
+            return S_next, self.GetReward(S_next)
+
+        with self._step_lock:
+            S_next = self.GetNextState(S, A)
+            return S_next, self.GetReward(S_next)
+
+    # Awaitable version of Step, runs the blocking Step in the default executor
+    async def StepAsync(self, S, A):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.Step, S, A)
+
+    # Awaitable version of IsTerminal, runs the blocking call in the default executor
+    async def IsTerminalAsync(self, S):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.IsTerminal, S)
+
+if __name__=="__main__":
+
+    import unittest
+    from collections import OrderedDict
+    from WorldSpace import WorldSpace
+
+    class LineWorld(AsyncWorld):
+
+        def GetNextState(self, S, A):
+            return np.array(S) + self.world_space.ActionVal(index=A)
+
+        def GetReward(self, S):
+            return -1
+
+        def IsTerminal(self, S):
+            return np.all(np.array(S) == self.world_space.LastState())
+
+    class TestAsyncWorld(unittest.TestCase):
+
+        def setUp(self):
+            self.a_map = OrderedDict()
+            self.a_map['R'] = (1,)
+            self.a_map['L'] = (-1,)
+
+            self.ws = WorldSpace((5,), self.a_map)
+            self.world = LineWorld(self.ws)
+
+        def test_Step(self):
+            S_next, R = self.world.Step((2,), 0)
+            self.assertTrue( np.all(S_next == (3,)) )
+            self.assertEqual(R, -1)
+
+        def test_StepAsync(self):
+            S_next, R = asyncio.run(self.world.StepAsync((2,), 1))
+            self.assertTrue( np.all(S_next == (1,)) )
+            self.assertEqual(R, -1)
+
+            self.assertTrue( asyncio.run(self.world.IsTerminalAsync((4,))) )
+            self.assertFalse( asyncio.run(self.world.IsTerminalAsync((3,))) )
+
+        def test_UnexpectedKwargs(self):
+            with self.assertRaises(KeyError):
+                LineWorld(self.ws, random_kwarg=42)
+
+        def test_NotImplemented(self):
+            world = AsyncWorld(self.ws)
+            with self.assertRaises(NotImplementedError):
+                asyncio.run(world.StepAsync((2,), 0))
+
+    unittest.main()
@@ -0,0 +1,265 @@
+# -*- coding: future_fstrings -*-
+
+import sys
+import numpy as np
+
+import logging
+from logging import debug as DEBUG
+from logging import info as INFO
+from logging import warn as WARN
+from logging import error as ERROR
+from logging import critical as CRITICAL
+
+class CurveAggregator(object):
+
+	"""
+	Streams learning curves from many runs into per step stats, in a fixed amount of memory.
+
+	Each step keeps a count, mean and sum of squared deviations (M2), updated with
+	Welford's method (or Chan's merge for a batch of runs at once), so no run's curve is
+	kept. Steps before horizon each get their own slot. After that, steps share bins of
+	bin_width steps, and whenever max_bins isn't enough, the width doubles and neighbouring
+	bins are merged, so a curve of any length fits in horizon + max_bins slots. A bin's
+	stats pool every value that landed in it.
+
+	Attributes:
+		horizon (int): number of leading steps kept at full resolution
+		max_bins (int): max number of bins for steps past horizon
+		bin_width (int): steps per bin, doubles as the curve grows
+		z (float): z-score used for confidence intervals (1.96 for 95%)
+	"""
+
+	def __init__(self, **kwargs):
+
+		self.horizon = kwargs.pop("horizon", 10000)
+		self.max_bins = kwargs.pop("max_bins", 1000)
+		self.bin_width = kwargs.pop("bin_width", 1)
+		self.z = kwargs.pop("z", 1.96)
+
+		if len(kwargs) > 0:
+			raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+		if self.max_bins < 1 or self.bin_width < 1:
+			raise ValueError(f"max_bins and bin_width must be at least 1, got {self.max_bins} and {self.bin_width}")
+
+		size = self.horizon + self.max_bins
+		self._count = np.zeros(size)
+		self._mean = np.zeros(size)
+		self._M2 = np.zeros(size)
+		self._optimal = np.zeros(size)	# number of values flagged optimal per slot
+		self._used = 0					# slots up to the last one written
+
+	def _GetSlot(self, step):
+		if step < 0:
+			raise ValueError(f"step must be >= 0, got {step}")
+
+		if step < self.horizon:
+			return step
+
+		while (step - self.horizon) // self.bin_width >= self.max_bins:
+			self._Coarsen()
+
+		return self.horizon + (step - self.horizon) // self.bin_width
+
+	# Doubles the bin width, merging each pair of neighbouring bins
+	def _Coarsen(self):
+		bins = slice(self.horizon, None)
+		count, mean, M2 = self._count[bins], self._mean[bins], self._M2[bins]
+		optimal = self._optimal[bins]
+
+		# Pad to an even number of bins so they pair up
+		pad = len(count) % 2
+		count, mean, M2, optimal = [ np.append(x, np.zeros(pad)) for x in (count, mean, M2, optimal) ]
+
+		merged = CurveAggregator._Merge(count[0::2], mean[0::2], M2[0::2], count[1::2], mean[1::2], M2[1::2])
+		half = len(merged[0])
+
+		for arr, vals in zip((self._count, self._mean, self._M2), merged):
+			arr[bins] = 0
+			arr[self.horizon:self.horizon + half] = vals
+
+		self._optimal[bins] = 0
+		self._optimal[self.horizon:self.horizon + half] = optimal[0::2] + optimal[1::2]
+
+		self._used = min(self._used, self.horizon + (max(self._used - self.horizon, 0) + 1) // 2)
+		self.bin_width *= 2
+		DEBUG(f"Coarsened learning curve bins to width {self.bin_width}")
+
+	# Chan's parallel update, combines the (count, mean, M2) of two sets of values
+	@staticmethod
+	def _Merge(count_a, mean_a, M2_a, count_b, mean_b, M2_b):
+		count = count_a + count_b
+		delta = mean_b - mean_a
+		with np.errstate(divide="ignore", invalid="ignore"):
+			mean = np.where(count > 0, mean_a + delta * count_b / count, 0)
+			M2 = np.where(count > 0, M2_a + M2_b + delta**2 * count_a * count_b / count, 0)
+		return count, mean, M2
+
+	def Add(self, step, values, optimal=None):
+		"""
+		Adds the value (or array of values, one per run) each run got at step
+
+		Parameters:
+			step (int): time step (or episode) the values are from
+			values (float or array): value of each run at step
+			optimal (bool or array): optional, whether each run took the optimal action
+		"""
+		slot = self._GetSlot(step)
+		values = np.asarray(values, dtype=float)
+
+		if values.ndim == 0:
+			# Welford's update for a single value
+			self._count[slot] += 1
+			delta = values - self._mean[slot]
+			self._mean[slot] += delta / self._count[slot]
+			self._M2[slot] += delta * (values - self._mean[slot])
+		else:
+			count, mean, M2 = CurveAggregator._Merge(
+				self._count[slot], self._mean[slot], self._M2[slot],
+				values.size, np.mean(values), np.sum((values - np.mean(values))**2))
+			self._count[slot], self._mean[slot], self._M2[slot] = count, mean, M2
+
+		if optimal is not None:
+			self._optimal[slot] += np.sum(optimal)
+
+		self._used = max(self._used, slot + 1)
+
+	def AddCurve(self, values, optimal=None, start=0):
+		"""Adds a whole run's curve, one value per step from start"""
+		values = np.asarray(values, dtype=float)
+		if values.size == 0:
+			return
+
+		# Coarsen for the last step up front, then every step maps straight to its slot
+		self._GetSlot(start)
+		self._GetSlot(start + values.size - 1)
+
+		steps = np.arange(start, start + values.size)
+		slots = np.where(steps < self.horizon, steps, self.horizon + (steps - self.horizon) // self.bin_width)
+
+		# Steps are contiguous, so slots run from lo to hi with no gaps
+		lo, hi = slots[0], slots[-1] + 1
+		idx = slots - lo
+
+		count = np.bincount(idx, minlength=hi - lo).astype(float)
+		mean = np.bincount(idx, weights=values, minlength=hi - lo) / count
+		M2 = np.bincount(idx, weights=(values - mean[idx])**2, minlength=hi - lo)
+
+		merged = CurveAggregator._Merge(self._count[lo:hi], self._mean[lo:hi], self._M2[lo:hi], count, mean, M2)
+		self._count[lo:hi], self._mean[lo:hi], self._M2[lo:hi] = merged
+
+		if optimal is not None:
+			self._optimal[lo:hi] += np.bincount(idx, weights=np.asarray(optimal, dtype=float), minlength=hi - lo)
+
+		self._used = max(self._used, hi)
+
+	def GetSteps(self):
+		"""Returns the step of every slot (the center of each bin past horizon)"""
+		steps = np.arange(min(self._used, self.horizon), dtype=float)
+		bins = np.arange(max(self._used - self.horizon, 0))
+		return np.append(steps, self.horizon + (bins + 0.5) * self.bin_width - 0.5)
+
+	def GetCount(self):
+		return self._count[:self._used].copy()
+
+	def GetMean(self):
+		return self._mean[:self._used].copy()
+
+	def GetVariance(self):
+		"""Returns the sample variance per slot (0 where there's fewer than 2 values)"""
+		count = self._count[:self._used]
+		with np.errstate(divide="ignore", invalid="ignore"):
+			return np.where(count > 1, self._M2[:self._used] / (count - 1), 0)
+
+	def GetConfidenceInterval(self):
+		"""Returns (lower, upper) bounds on the mean per slot, mean -+ z * std error"""
+		count = np.maximum(self._count[:self._used], 1)
+		half_width = self.z * np.sqrt(self.GetVariance() / count)
+		mean = self.GetMean()
+		return mean - half_width, mean + half_width
+
+	def GetOptimalRate(self):
+		"""Returns the fraction of values flagged optimal per slot"""
+		count = self._count[:self._used]
+		with np.errstate(divide="ignore", invalid="ignore"):
+			return np.where(count > 0, self._optimal[:self._used] / count, 0)
+
+	def GetNumBytes(self):
+		return sum(arr.nbytes for arr in (self._count, self._mean, self._M2, self._optimal))
+
+if __name__=="__main__":
+
+	import unittest
+
+	class TestCurveAggregator(unittest.TestCase):
+
+		def setUp(self):
+			rng = np.random.default_rng(0)
+			self.curves = rng.normal(size=(20, 50))
+			self.optimal = rng.random((20, 50)) < 0.3
+
+		def test_MatchesDense(self):
+			agg = CurveAggregator(horizon=100)
+			for curve, optimal in zip(self.curves, self.optimal):
+				agg.AddCurve(curve, optimal)
+
+			self.assertTrue( np.allclose(agg.GetMean(), np.mean(self.curves, axis=0)) )
+			self.assertTrue( np.allclose(agg.GetVariance(), np.var(self.curves, axis=0, ddof=1)) )
+			self.assertTrue( np.allclose(agg.GetOptimalRate(), np.mean(self.optimal, axis=0)) )
+			self.assertTrue( np.all(agg.GetSteps() == np.arange(50)) )
+
+			lower, upper = agg.GetConfidenceInterval()
+			self.assertTrue( np.all(lower <= agg.GetMean()) and np.all(upper >= agg.GetMean()) )
+
+		def test_BatchMatchesSingle(self):
+			single = CurveAggregator(horizon=100)
+			batch = CurveAggregator(horizon=100)
+			for curve in self.curves:
+				single.AddCurve(curve)
+			for step in range(50):
+				batch.Add(step, self.curves[:, step])
+
+			self.assertTrue( np.allclose(single.GetMean(), batch.GetMean()) )
+			self.assertTrue( np.allclose(single.GetVariance(), batch.GetVariance()) )
+
+		def test_CurveMatchesSteps(self):
+			# AddCurve bins a whole curve at once, it should match adding it a step at a time
+			for kwargs in ({"horizon": 100}, {"horizon": 10, "max_bins": 4}):
+				curve = CurveAggregator(**kwargs)
+				steps = CurveAggregator(**kwargs)
+				for values, optimal in zip(self.curves, self.optimal):
+					curve.AddCurve(values[5:], optimal[5:], start=5)
+					for ii in range(5, 50):
+						steps.Add(ii, values[ii], optimal[ii])
+
+				self.assertEqual(curve.bin_width, steps.bin_width)
+				self.assertTrue( np.all(curve.GetCount() == steps.GetCount()) )
+				self.assertTrue( np.allclose(curve.GetMean(), steps.GetMean()) )
+				self.assertTrue( np.allclose(curve.GetVariance(), steps.GetVariance()) )
+				self.assertTrue( np.allclose(curve.GetOptimalRate(), steps.GetOptimalRate()) )
+
+		def test_Bins(self):
+			agg = CurveAggregator(horizon=10, max_bins=4)
+			for curve in self.curves:
+				agg.AddCurve(curve)
+
+			# 40 steps past the horizon have to fit in 4 bins, so they're 16 wide
+			self.assertEqual(agg.bin_width, 16)
+			self.assertEqual(len(agg.GetMean()), 13)
+			self.assertTrue( np.allclose(agg.GetMean()[:10], np.mean(self.curves[:, :10], axis=0)) )
+
+			# Each bin pools every value that landed in it
+			self.assertTrue( np.isclose(agg.GetMean()[10], np.mean(self.curves[:, 10:26])) )
+			self.assertTrue( np.isclose(agg.GetVariance()[11], np.var(self.curves[:, 26:42], ddof=1)) )
+			self.assertEqual(agg.GetCount()[12], 20 * 8)
+			self.assertTrue( np.allclose(agg.GetSteps()[10:], [17.5, 33.5, 49.5]) )
+
+		def test_FixedMemory(self):
+			agg = CurveAggregator(horizon=100, max_bins=100)
+			num_bytes = agg.GetNumBytes()
+			for step in range(0, 1000000, 7):
+				agg.Add(step, 1.0)
+			self.assertEqual(agg.GetNumBytes(), num_bytes)
+			self.assertTrue(len(agg.GetMean()) <= 200)
+
+	unittest.main()
@@ -2,6 +2,8 @@
 
 from World import World
 from WorldSpace import WorldSpace
+import sys
+import collections
 import numpy as np
 
 """
@@ -10,6 +12,8 @@ Defines an Ndim World (discrete) with a start state and goal state
 Optional dynamics, hazard and noise functions can also be defined
 State transitions occur by adding an action (from world_space) to state
 Additional motion is achieved via dynamics, hazard and noise functions
+Transitions can optionally be memoized in a bounded LRU cache (cache_size and/or cache_bytes),
+which is bypassed while a noise_func is set, since the world is then stochastic
 """
 class DynamicNDWorld(World):
 
@@ -18,6 +22,9 @@ class DynamicNDWorld(World):
     HAZARD_REWARD = -50
     GOAL_REWARD = -1
 
+    # Rough per entry cost of the cache (dict node, key and value tuple), on top of the state array
+    CACHE_ENTRY_OVERHEAD = 200
+
     def __init__(self, world_space, **kwargs):
         World.__init__(self, world_space)
 
@@ -29,13 +36,23 @@ class DynamicNDWorld(World):
         self.goal_state   =  kwargs.get( 'goal_state', self.world_space.LastState() )
 
         # Stores func handles if specified, otherwise store default lambdas
+        self._no_noise = lambda *_: self._no_move
         self.hazard_func  =  kwargs.get( 'hazard_func', lambda *_: False )
         self.dynamics_func =  kwargs.get( 'dynamics_func', lambda *_: self._no_move )
-        self.noise_func    =  kwargs.get( 'noise_func', lambda *_: self._no_move )
+        self.noise_func    =  kwargs.get( 'noise_func', self._no_noise )
 
         self.out_of_bounds = False
         self.hit_hazard = False
 
+        # LRU cache of transitions, keyed by encoded (S,A), None if caching is off
+        # hazard_func and dynamics_func must be deterministic, call ClearCache if they are replaced
+        self.cache_size = kwargs.get( 'cache_size', None )
+        self.cache_bytes = kwargs.get( 'cache_bytes', None )
+        self._cache = None if (self.cache_size is None and self.cache_bytes is None) else collections.OrderedDict()
+        self._cache_used_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
         # Make sure specified star and goal is valid
         if not self.world_space.IsValidState(self.start_state) or \
             not self.world_space.IsValidState(self.goal_state):
@@ -53,6 +70,36 @@ class DynamicNDWorld(World):
         if not self.world_space.IsValidState(S):
             raise ValueError("Starting state is not in state_space")
 
+        if not self.IsCaching():
+            return self._ComputeNextState(S, A)
+
+        # Policies hand back numpy ints, which IsValidAction rejects
+        if isinstance(A, np.integer):
+            A = int(A)
+
+        if not self.world_space.IsValidAction(A):
+            raise ValueError(f"Action [{A}] must be less than size of action_map in world_space")
+
+        key = self._EncodeStateAction(S, A)
+        entry = self._cache.get(key)
+
+        if entry is None:
+            self.cache_misses += 1
+            S_next = self._ComputeNextState(S, A)
+            self._CacheTransition(key, S_next)
+            return S_next
+
+        self.cache_hits += 1
+        self._cache.move_to_end(key)
+
+        S_next, self.out_of_bounds, self.hit_hazard = entry
+        if self.out_of_bounds or self.hit_hazard:
+            return self.start_state
+        return S_next.copy()
+
+    # Computes the next state of a valid S, setting the flags used by GetReward
+    def _ComputeNextState(self, S, A):
+
         # Grab the move for the given action from the move dict
         try:
             move = self.world_space.ActionVal(index=A)
@@ -81,6 +128,48 @@ class DynamicNDWorld(World):
 
         return S
 
+    # Returns True if transitions are currently being memoized
+    def IsCaching(self):
+        return self._cache is not None and self.noise_func is self._no_noise
+
+    # Encodes a valid (S,A) pair as a single int
+    def _EncodeStateAction(self, S, A):
+        return int(np.ravel_multi_index(tuple(S), self.world_space.GetSDims())) * self.world_space.GetNumA() + int(A)
+
+    # Stores the result of the last _ComputeNextState, evicting the least recently used entries to fit
+    def _CacheTransition(self, key, S_next):
+        S_next = None if (self.out_of_bounds or self.hit_hazard) else np.array(S_next)
+        entry_bytes = DynamicNDWorld.CACHE_ENTRY_OVERHEAD + sys.getsizeof(key) + (0 if S_next is None else S_next.nbytes)
+
+        self._cache[key] = (S_next, self.out_of_bounds, self.hit_hazard)
+        self._cache_used_bytes += entry_bytes
+
+        while len(self._cache) > 0 and self._IsCacheFull():
+            old_key, (S_old, _, _) = self._cache.popitem(last=False)
+            self._cache_used_bytes -= DynamicNDWorld.CACHE_ENTRY_OVERHEAD + sys.getsizeof(old_key) + (0 if S_old is None else S_old.nbytes)
+
+    def _IsCacheFull(self):
+        if self.cache_size is not None and len(self._cache) > self.cache_size:
+            return True
+        return self.cache_bytes is not None and self._cache_used_bytes > self.cache_bytes
+
+    def ClearCache(self):
+        if self._cache is not None:
+            self._cache.clear()
+        self._cache_used_bytes = 0
+
+    # Returns the cache counters and usage
+    def CacheInfo(self):
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'entries': 0 if self._cache is None else len(self._cache),
+            'bytes': self._cache_used_bytes,
+            'max_entries': self.cache_size,
+            'max_bytes': self.cache_bytes,
+            'active': self.IsCaching(),
+        }
+
     # Returns reward corresponding to latest (S,A) pair
     def GetReward(self, S):
         # return appropriate reward based on flags set during GetNextState
@@ -257,4 +346,77 @@ if __name__=="__main__":
             self.assertTrue( ALL( self.world.GetNextState( ARR((2,1)), 0) == ARR((2,1)) + ACT(0) + ARR((1,0)) ) )
             self.assertTrue( ALL( self.world.GetNextState( ARR((4,2)), 1) == ARR((4,2)) + ACT(1) + ARR((1,0)) ) )
 
-    unittest.main()
+    class TestDynamicNDWorldCache(unittest.TestCase):
+
+        def setUp(self):
+            self.a_map = OrderedDict()
+            self.a_map['U'] = (1,1)
+            self.a_map['D'] = (-1,-1)
+            self.a_map['R'] = (1,0)
+            self.a_map['L'] = (1,-2)
+
+            self.ws = WorldSpace((9,7), self.a_map)
+            self.w_kw = {'start_state':(3,4), 'goal_state':(8,3), 'hazard_func': lambda S: S[0] == 5}
+
+            self.world = DynamicNDWorld(self.ws, **self.w_kw)
+            self.cached = DynamicNDWorld(self.ws, cache_size=10, **self.w_kw)
+
+        def test_MatchesUncached(self):
+            for S, A in [ ((3,4),0), ((3,4),0), ((8,6),0), ((8,6),0), ((4,2),2), ((4,2),2), ((2,2),1), ((2,2),1) ]:
+                S_next = self.world.GetNextState(S, A)
+                S_cached = self.cached.GetNextState(S, A)
+                self.assertTrue( np.all(S_next == S_cached) )
+                self.assertEqual( self.world.GetReward(S_next), self.cached.GetReward(S_cached) )
+
+            info = self.cached.CacheInfo()
+            self.assertEqual(info['hits'], 4)
+            self.assertEqual(info['misses'], 4)
+            self.assertEqual(info['entries'], 4)
+
+        def test_NumpyIntAction(self):
+            for A in [ np.int64(2), np.int32(2), np.argmax([0, 0, 1, 0]) ]:
+                S_next = self.world.GetNextState( (4,2), A )
+                S_cached = self.cached.GetNextState( (4,2), A )
+                self.assertTrue( np.all(S_next == S_cached) )
+
+            self.assertEqual(self.cached.cache_hits, 2)
+            with self.assertRaises(ValueError):
+                self.cached.GetNextState( (3,4), np.int64(5) )
+
+        def test_InvalidStillRaises(self):
+            with self.assertRaises(ValueError):
+                self.cached.GetNextState( (3,4), 5 )
+            with self.assertRaises(ValueError):
+                self.cached.GetNextState( (3,4), -1 )
+            with self.assertRaises(ValueError):
+                self.cached.GetNextState( (9,9), 0 )
+
+        def test_Eviction(self):
+            for x in range(9):
+                for y in range(7):
+                    self.cached.GetNextState( (x,y), 0 )
+            self.assertEqual(self.cached.CacheInfo()['entries'], 10)
+
+            # The most recent transition should still be cached, the first one evicted
+            self.cached.GetNextState( (8,6), 0 )
+            self.assertEqual(self.cached.cache_hits, 1)
+            self.cached.GetNextState( (0,0), 0 )
+            self.assertEqual(self.cached.cache_hits, 1)
+
+            by_bytes = DynamicNDWorld(self.ws, cache_bytes=2000, **self.w_kw)
+            for x in range(9):
+                by_bytes.GetNextState( (x,0), 0 )
+            self.assertTrue(by_bytes.CacheInfo()['bytes'] <= 2000)
+            self.assertTrue(by_bytes.CacheInfo()['entries'] < 9)
+
+        def test_NoiseBypassesCache(self):
+            noisy = DynamicNDWorld(self.ws, cache_size=10, noise_func=lambda S: (0,0), **self.w_kw)
+            self.assertFalse(noisy.IsCaching())
+            noisy.GetNextState( (3,4), 0 )
+            noisy.GetNextState( (3,4), 0 )
+            self.assertEqual(noisy.cache_hits + noisy.cache_misses, 0)
+
+            self.assertFalse(self.world.IsCaching())
+            self.assertTrue(self.cached.IsCaching())
+
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,403 @@
+# -*- coding: future_fstrings -*-
+import os
+import sys
+import time
+import socket
+import struct
+import asyncio
+import threading
+import collections
+import numpy as np
+
+from Policy import Policy
+from TabularRLUtils import CompileGreedyTable
+
+import logging
+from logging import debug as DEBUG
+from logging import info as INFO
+from logging import warn as WARN
+from logging import error as ERROR
+from logging import critical as CRITICAL
+
+def ExportGreedyTable(policy, path):
+	"""
+	Saves the greedy action of every state of a trained policy as a .npy table
+
+	Parameters:
+		policy (TabularPolicy): policy with ACTION_STATE_VALUES
+		path (str): file to write, replaced atomically so a serving PolicyServer can reload it
+
+	Returns:
+		str: the path written
+	"""
+	if policy.type != Policy.ACTION_STATE_VALUES:
+		raise ValueError("Can only export greedy actions from a policy with ACTION_STATE_VALUES")
+
+	table, _, _ = CompileGreedyTable(policy.vals)
+
+	# np.save appends .npy if its missing, so write through a file handle
+	tmp_path = f"{path}.tmp"
+	with open(tmp_path, "wb") as f:
+		np.save(f, table)
+	os.replace(tmp_path, path)
+
+	return path
+
+def LoadGreedyTable(path):
+	"""Memory maps a table written by ExportGreedyTable"""
+	return np.load(path, mmap_mode="r")
+
+class PolicyServer(object):
+
+	"""
+	Serves greedy actions from an exported table over a local socket.
+
+	Each request is a state, sent as ndim little endian int32s, and each reply
+	is the action as one int32 (-1 if the state is out of bounds or its lookup
+	failed). Replies on a connection come back in the order requests were sent,
+	so clients can pipeline. Requests from all connections are gathered into micro-batches
+	and looked up in the table with one vectorized gather.
+
+	Attributes:
+		max_batch (int): max number of states looked up at once
+		batch_window (float): time (s) to wait for more requests after the first one of a batch
+		stats_window (int): number of recent requests used for latency and QPS stats
+	"""
+
+	INVALID_ACTION = -1
+
+	def __init__(self, table_path, **kwargs):
+
+		self.max_batch = kwargs.pop("max_batch", 256)
+		self.batch_window = kwargs.pop("batch_window", 0)
+		self.stats_window = kwargs.pop("stats_window", 10000)
+
+		if len(kwargs) > 0:
+			raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+		self.table_path = table_path
+		self._table = LoadGreedyTable(table_path)
+		self._table_mtime = os.stat(table_path).st_mtime
+		self._ndim = self._table.ndim
+
+		self._req_size = 4 * self._ndim
+		self._queue = None
+		self._server = None
+		self._tasks = []
+
+		self._latencies = collections.deque(maxlen=self.stats_window)
+		self._done_times = collections.deque(maxlen=self.stats_window)
+		self.served = 0
+		self.batches = 0
+		self.reloads = 0
+
+	def GetTable(self):
+		return self._table
+
+	def Reload(self, path=None):
+		"""
+		Swaps in a newly exported table, batches already being looked up keep the old one
+
+		Returns: (Bool) True if the table was swapped, False if it was rejected
+		"""
+		if path is None:
+			path = self.table_path
+
+		table = LoadGreedyTable(path)
+		if table.ndim != self._ndim:
+			ERROR(f"Rejected reload of {path}, table has {table.ndim} dims but server expects {self._ndim}")
+			return False
+
+		self._table = table
+		self._table_mtime = os.stat(path).st_mtime
+		self.table_path = path
+		self.reloads += 1
+		INFO(f"Reloaded greedy table from {path}, shape {table.shape}")
+		return True
+
+	def GetStats(self):
+		"""Returns p50 and p99 latency (ms) and QPS over the last stats_window requests"""
+		stats = { "served": self.served, "batches": self.batches, "reloads": self.reloads }
+
+		if len(self._latencies) == 0:
+			stats.update({ "p50_ms": None, "p99_ms": None, "qps": None })
+			return stats
+
+		latencies = 1000 * np.array(self._latencies)
+		stats["p50_ms"] = np.percentile(latencies, 50)
+		stats["p99_ms"] = np.percentile(latencies, 99)
+
+		elapsed = self._done_times[-1] - self._done_times[0]
+		stats["qps"] = (len(self._done_times) - 1) / elapsed if elapsed > 0 else None
+		return stats
+
+	async def Start(self, host="127.0.0.1", port=0, reload_every=None):
+		"""
+		Starts serving, and polls the table file for changes every reload_every seconds if set
+
+		Returns: (int) the port the server is bound to
+		"""
+		self._queue = asyncio.Queue()
+		self._server = await asyncio.start_server(self._HandleClient, host, port)
+		self._tasks.append(asyncio.ensure_future(self._RunBatches()))
+
+		if reload_every is not None:
+			self._tasks.append(asyncio.ensure_future(self._WatchTable(reload_every)))
+
+		port = self._server.sockets[0].getsockname()[1]
+		INFO(f"PolicyServer listening on {host}:{port}")
+		return port
+
+	async def Stop(self):
+		self._server.close()
+		await self._server.wait_closed()
+		for task in self._tasks:
+			task.cancel()
+		self._tasks = []
+
+	def RunInThread(self, host="127.0.0.1", port=0, reload_every=None):
+		"""Serves from a daemon thread with its own event loop, returns the bound port"""
+		started = threading.Event()
+		result = {}
+
+		def Run():
+			loop = asyncio.new_event_loop()
+			asyncio.set_event_loop(loop)
+			result["port"] = loop.run_until_complete(self.Start(host, port, reload_every))
+			result["loop"] = loop
+			started.set()
+			loop.run_forever()
+			loop.close()
+
+		thread = threading.Thread(target=Run)
+		thread.daemon = True
+		thread.start()
+		started.wait()
+
+		self._loop = result["loop"]
+		return result["port"]
+
+	def StopThread(self):
+		asyncio.run_coroutine_threadsafe(self.Stop(), self._loop).result()
+		self._loop.call_soon_threadsafe(self._loop.stop)
+
+	async def _HandleClient(self, reader, writer):
+
+		# Replies are written by a separate task, in request order, so reading never waits on lookups
+		pending = asyncio.Queue()
+		reply_task = asyncio.ensure_future(self._WriteReplies(pending, writer))
+
+		try:
+			while True:
+				data = await reader.readexactly(self._req_size)
+				fut = asyncio.get_event_loop().create_future()
+				state = struct.unpack(f"<{self._ndim}i", data)
+				await self._queue.put( (state, fut, time.perf_counter()) )
+				await pending.put(fut)
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+
+		await pending.put(None)
+		await reply_task
+
+	async def _WriteReplies(self, pending, writer):
+		while True:
+			fut = await pending.get()
+			if fut is None:
+				break
+			try:
+				action = await fut
+			except Exception:
+				action = PolicyServer.INVALID_ACTION
+			writer.write(struct.pack("<i", action))
+			if pending.empty():
+				await writer.drain()
+
+		writer.close()
+
+	async def _RunBatches(self):
+		while True:
+			batch = [ await self._queue.get() ]
+
+			# Give other requests a chance to join this batch
+			if self.batch_window > 0:
+				await asyncio.sleep(self.batch_window)
+
+			while len(batch) < self.max_batch and not self._queue.empty():
+				batch.append(self._queue.get_nowait())
+
+			# A failed lookup only fails its own batch, the server keeps going
+			try:
+				self._LookupBatch(batch)
+			except Exception as e:
+				ERROR(f"Lookup of a batch of {len(batch)} states failed: {e!r}")
+				for _, fut, _ in batch:
+					if not fut.done():
+						fut.set_exception(e)
+
+	def _LookupBatch(self, batch):
+
+		# Grab the table once, so a reload mid batch can't mix tables
+		table = self._table
+
+		states = np.array([ state for state, _, _ in batch ], dtype=np.int64).reshape(len(batch), self._ndim)
+		valid = np.all( (states >= 0) & (states < table.shape), axis=1 )
+
+		actions = np.full(len(batch), PolicyServer.INVALID_ACTION, dtype=np.int64)
+		actions[valid] = table[tuple(states[valid].T)]
+
+		now = time.perf_counter()
+		for (_, fut, t0), action in zip(batch, actions):
+			if not fut.done():
+				fut.set_result(int(action))
+			self._latencies.append(now - t0)
+			self._done_times.append(now)
+
+		self.served += len(batch)
+		self.batches += 1
+
+	async def _WatchTable(self, interval):
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				mtime = os.stat(self.table_path).st_mtime
+			except OSError:
+				continue
+			if mtime == self._table_mtime:
+				continue
+
+			# Record the mtime first, so a file that fails or is rejected is only reported once
+			self._table_mtime = mtime
+			try:
+				self.Reload()
+			except Exception as e:
+				ERROR(f"Failed to reload greedy table from {self.table_path}: {e!r}")
+
+class PolicyClient(object):
+
+	"""Blocking client for a PolicyServer, GetActions pipelines all of its states"""
+
+	def __init__(self, address, ndim):
+		self._sock = socket.create_connection(address)
+		self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self._ndim = ndim
+
+	def GetAction(self, S):
+		return self.GetActions([S])[0]
+
+	def GetActions(self, S_list):
+		request = b"".join( struct.pack(f"<{self._ndim}i", *S) for S in S_list )
+		self._sock.sendall(request)
+
+		expected = 4 * len(S_list)
+		reply = b""
+		while len(reply) < expected:
+			chunk = self._sock.recv(expected - len(reply))
+			if not chunk:
+				raise ConnectionError("PolicyServer closed the connection")
+			reply += chunk
+
+		return list(struct.unpack(f"<{len(S_list)}i", reply))
+
+	def Close(self):
+		self._sock.close()
+
+if __name__=="__main__":
+
+	import unittest
+	import tempfile
+	from collections import OrderedDict
+	from WorldSpace import WorldSpace
+	from SarsaPolicy import SarsaPolicy
+
+	class TestPolicyServer(unittest.TestCase):
+
+		def setUp(self):
+			self.ss = (7,9)
+
+			self.a_map = OrderedDict()
+			self.a_map['U'] = (0,1)
+			self.a_map['D'] = (0,-1)
+			self.a_map['R'] = (1,0)
+			self.a_map['L'] = (-1,0)
+
+			self.ws = WorldSpace(self.ss, self.a_map)
+			self.policy = SarsaPolicy(self.ws, init_variance=1)
+
+			self.dir = tempfile.mkdtemp()
+			self.path = os.path.join(self.dir, "greedy.npy")
+			ExportGreedyTable(self.policy, self.path)
+
+			self.server = PolicyServer(self.path, batch_window=0.001)
+			port = self.server.RunInThread()
+			self.client = PolicyClient(("127.0.0.1", port), len(self.ss))
+
+		def tearDown(self):
+			self.client.Close()
+			self.server.StopThread()
+
+		def test_Export(self):
+			table = LoadGreedyTable(self.path)
+			self.assertEqual(table.dtype, np.uint8)
+			self.assertTrue( np.all(table == np.argmax(self.policy.vals, axis=-1)) )
+
+		def test_GetActions(self):
+			S_list = [ (ii % 7, ii % 9) for ii in range(500) ]
+			actions = self.client.GetActions(S_list)
+			expected = [ np.argmax(self.policy.vals[S]) for S in S_list ]
+			self.assertEqual(actions, expected)
+
+			# Pipelined requests should have been batched
+			self.assertTrue(self.server.batches < 500)
+
+			stats = self.server.GetStats()
+			self.assertEqual(stats["served"], 500)
+			self.assertTrue(stats["p99_ms"] >= stats["p50_ms"])
+
+		def test_InvalidState(self):
+			self.assertEqual(self.client.GetAction((7,0)), PolicyServer.INVALID_ACTION)
+			self.assertEqual(self.client.GetAction((-1,3)), PolicyServer.INVALID_ACTION)
+
+		def test_FailedBatch(self):
+			# Break the table so the next lookup raises, its requests get INVALID_ACTION
+			table = self.server.GetTable()
+			self.server._table = None
+			self.assertEqual(self.client.GetAction((3,3)), PolicyServer.INVALID_ACTION)
+
+			# The server should still be serving after the failed batch
+			self.server._table = table
+			self.assertEqual(self.client.GetAction((3,3)), np.argmax(self.policy.vals[3,3]))
+
+		def test_Reload(self):
+			self.policy.UpdateState((3,3), 2, 1000)
+			ExportGreedyTable(self.policy, self.path)
+			self.assertTrue(self.server.Reload())
+			self.assertEqual(self.client.GetAction((3,3)), 2)
+
+			# Tables with the wrong number of dims are rejected
+			bad_path = os.path.join(self.dir, "bad.npy")
+			np.save(bad_path, np.zeros((3,3,3), dtype=np.uint8))
+			self.assertFalse(self.server.Reload(bad_path))
+			self.assertEqual(self.client.GetAction((3,3)), 2)
+
+		def test_WatchBadFile(self):
+			server = PolicyServer(self.path)
+			server.RunInThread(reload_every=0.01)
+
+			# A truncated file fails to load, it's logged once and the watcher keeps going
+			with self.assertLogs(level=logging.ERROR) as logs:
+				with open(self.path, "wb") as f:
+					f.write(b"not a table")
+				time.sleep(0.2)
+			self.assertEqual(len(logs.records), 1)
+			self.assertEqual(server.reloads, 0)
+
+			self.policy.UpdateState((3,3), 2, 1000)
+			ExportGreedyTable(self.policy, self.path)
+			time.sleep(0.2)
+			self.assertEqual(server.reloads, 1)
+			self.assertEqual(server.GetTable()[3,3], 2)
+
+			server.StopThread()
+
+	unittest.main()
@@ -34,10 +34,7 @@ class RLGame(object):
 			self._agents[agent.GetID()] = agent
 
 		self._history = {}
-		
-		# Build dictionary for history
-		for id, _ in self._agents.items():
-			self._history[id] = ExpPacket()
+		self._ResetHistory()
 
 		self._episodes = []
 
@@ -102,7 +99,7 @@ class RLGame(object):
 		if max_steps == None:
 			max_steps = RLGame.DEFAULT_NUM_STEPS_PER_EP
 
-		self._history.clear()
+		self._ResetHistory()
 
 		# create flag to keep track of whether all agents are terminal
 		all_agents_terminal = True
@@ -150,7 +147,8 @@ class RLGame(object):
 		s_prev = agent.GetCurrState()
 
 		# Take action and get next state and reward
-		a_next = agent.GetAction(s_prev)
+		# Policies return numpy ints, the world and policy checks only take a python int
+		a_next = int(agent.GetAction(s_prev))
 		s_next = self._world.GetNextState(s_prev, a_next)
 		r_next = self._world.GetReward(s_next)
 
@@ -159,16 +157,25 @@ class RLGame(object):
 		self._history[agent.GetID()].Push(s_prev, a_next, r_next)
 
 		# If this is a trainable agent, then attempt to train
-		if agent.IsTrainable():
-			DEBUG(f"Training agent {agent.GetID()}")
-			s_req, a_req, r_req = agent.PacketSizeReq()
-			packet = self._history[agent.GetID()].GetLatestAsPacket(s_req, a_req, r_req)
-			if packet != None:
-				if not agent.ImprovePolicy(packet):
-					WARN("Failed to train agent with ExpPacket {packet}")
+		self._TrainAgent(agent)
+
+	def _TrainAgent(self, agent):
+
+		if not agent.IsTrainable():
+			return
 
-		# Delete the packet which we don't need anymore
-		del packet
+		DEBUG(f"Training agent {agent.GetID()}")
+		s_req, a_req, r_req = agent.PacketSizeReq()
+		packet = self._history[agent.GetID()].GetLatestAsPacket(s_req, a_req, r_req)
+		if packet != None:
+			if not agent.ImprovePolicy(packet):
+				WARN(f"Failed to train agent with ExpPacket {packet}")
+
+	def _ResetHistory(self):
+		# Each episode gets its own packets, so histories stored in _episodes aren't overwritten
+		self._history = {}
+		for id in self._agents.keys():
+			self._history[id] = ExpPacket()
 
 	def _IsTerminal(self, agent):
 		return self._world.IsTerminal(agent.GetCurrState())
@@ -246,7 +253,7 @@ if __name__=="__main__":
 			
 			# check that the history is updating properly	
 			hist = self.rl_game.GetCurrentAgentHistory(id)
-			print hist
+			print(hist)
 			self.assertTrue(len(hist) == 300)
 
 	unittest.main()
\ No newline at end of file
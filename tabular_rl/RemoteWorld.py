@@ -0,0 +1,274 @@
+# -*- coding: future_fstrings -*-
+
+import sys
+import time
+import asyncio
+import threading
+import collections
+from concurrent.futures import Future
+from multiprocessing.connection import Client
+
+from AsyncWorld import AsyncWorld
+from WorldServer import WorldServer
+
+import logging
+from logging import debug as DEBUG
+from logging import info as INFO
+from logging import warn as WARN
+from logging import error as ERROR
+from logging import critical as CRITICAL
+
+"""
+Client side of a WorldServer, implements the World interface over one persistent connection
+Calls are queued into a batch and sent as a single message, and a reader thread resolves
+replies as they arrive, so many batches can be in flight at once (pipelining)
+The blocking World methods send their call right away and wait on it
+StepAsync/IsTerminalAsync queue their call and flush once per event loop iteration,
+so all the agents stepping in an AsyncRLGame share one message (micro-batching)
+"""
+class RemoteWorld(AsyncWorld):
+
+    DEFAULT_MAX_BATCH = 64
+
+    def __init__(self, world_space, address, **kwargs):
+        AsyncWorld.__init__(self, world_space)
+
+        self.max_batch = kwargs.pop('max_batch', RemoteWorld.DEFAULT_MAX_BATCH)
+        authkey = kwargs.pop('authkey', None)
+
+        if len(kwargs) > 0:
+            raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+        self._conn = Client(address, authkey=authkey)
+
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # keeps batches in _in_flight in the order they're sent
+        self._batch = []            # (op, args) calls waiting to be sent
+        self._batch_futures = []    # futures for calls in _batch
+        self._in_flight = collections.deque()  # lists of futures for batches already sent
+        self._flush_scheduled = False
+
+        self.batches_sent = 0
+        self.calls_sent = 0
+
+        self._reader = threading.Thread(target=self._ReadReplies)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.Close()
+
+    # Queues a call and returns a Future for its result, sends the batch if it is full
+    def Submit(self, op, *args):
+        fut = Future()
+        with self._lock:
+            self._batch.append( (op, args) )
+            self._batch_futures.append(fut)
+            full = len(self._batch) >= self.max_batch
+        if full:
+            self._SendBatch()
+        return fut
+
+    # Sends any queued calls
+    def Flush(self):
+        with self._lock:
+            self._flush_scheduled = False
+        self._SendBatch()
+
+    # Swaps the queued batch out under _lock, then sends it without _lock held, since the reader
+    # thread needs _lock to resolve replies, and a big send can block until the server's replies are read
+    def _SendBatch(self):
+        with self._send_lock:
+            with self._lock:
+                if len(self._batch) == 0:
+                    return
+                batch, futures = self._batch, self._batch_futures
+                self._batch, self._batch_futures = [], []
+
+                self._in_flight.append(futures)
+                self.batches_sent += 1
+                self.calls_sent += len(batch)
+
+            self._conn.send(batch)
+
+    def _Call(self, op, *args):
+        fut = self.Submit(op, *args)
+        self.Flush()
+        return fut.result()
+
+    # Resolves the futures of each sent batch, replies come back in the order batches were sent
+    def _ReadReplies(self):
+        while True:
+            try:
+                results = self._conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                futures = self._in_flight.popleft()
+
+            for fut, (status, val) in zip(futures, results):
+                if status == WorldServer.OK:
+                    fut.set_result(val)
+                else:
+                    fut.set_exception(val)
+
+        # Fail anything still waiting on a reply
+        with self._lock:
+            while len(self._in_flight) > 0:
+                for fut in self._in_flight.popleft():
+                    fut.set_exception(ConnectionError("Connection to WorldServer was closed"))
+
+    def GetNextState(self, S, A):
+        return self._Call('GetNextState', S, A)
+
+    def GetReward(self, S):
+        return self._Call('GetReward', S)
+
+    def IsTerminal(self, S):
+        return self._Call('IsTerminal', S)
+
+    def Step(self, S, A):
+        return self._Call('Step', S, A)
+
+    # Steps every (S,A) pair, pipelined in batches of max_batch, returns a list of (S_next, R)
+    def StepMany(self, S_list, A_list):
+        futures = [ self.Submit('Step', S, A) for S, A in zip(S_list, A_list) ]
+        self.Flush()
+        return [ fut.result() for fut in futures ]
+
+    async def StepAsync(self, S, A):
+        return await self._SubmitAsync('Step', S, A)
+
+    async def IsTerminalAsync(self, S):
+        return await self._SubmitAsync('IsTerminal', S)
+
+    # Queues the call and flushes at the end of this loop iteration, batching concurrent callers
+    def _SubmitAsync(self, op, *args):
+        fut = self.Submit(op, *args)
+
+        with self._lock:
+            schedule = not self._flush_scheduled
+            self._flush_scheduled = True
+
+        if schedule:
+            asyncio.get_event_loop().call_soon(self.Flush)
+
+        return asyncio.wrap_future(fut)
+
+    def Close(self):
+        self.Flush()
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._conn.close()
+        self._reader.join()
+
+# Returns the number of steps per second the world manages for the given (S,A) pairs
+# Uses pipelined StepMany if the world has one, otherwise steps one pair at a time
+def MeasureStepThroughput(world, S_list, A_list):
+    start = time.time()
+
+    if hasattr(world, 'StepMany'):
+        world.StepMany(S_list, A_list)
+    else:
+        for S, A in zip(S_list, A_list):
+            S_next = world.GetNextState(S, A)
+            world.GetReward(S_next)
+
+    return len(S_list) / (time.time() - start)
+
+if __name__=="__main__":
+
+    import unittest
+    import numpy as np
+    from collections import OrderedDict
+    from WorldSpace import WorldSpace
+    from DynamicNDWorld import DynamicNDWorld
+    from WorldServer import StartWorldServer
+
+    class TestRemoteWorld(unittest.TestCase):
+
+        def setUp(self):
+            self.a_map = OrderedDict()
+            self.a_map['U'] = (0,1)
+            self.a_map['D'] = (0,-1)
+            self.a_map['R'] = (1,0)
+            self.a_map['L'] = (-1,0)
+
+            self.ws = WorldSpace((7,9), self.a_map)
+            self.w_kw = {'start_state':(0,0), 'goal_state':(4,4)}
+            self.local = DynamicNDWorld(self.ws, **self.w_kw)
+
+            self.proc, address = StartWorldServer(DynamicNDWorld(self.ws, **self.w_kw))
+            self.world = RemoteWorld(self.ws, address, max_batch=16)
+
+        def tearDown(self):
+            self.world.Close()
+            self.proc.join(timeout=5)
+
+        def test_MatchesLocal(self):
+            for S, A in [ ((3,4),0), ((0,0),1), ((6,8),2), ((3,3),2) ]:
+                S_local = self.local.GetNextState(S, A)
+                R_local = self.local.GetReward(S_local)
+
+                S_remote = self.world.GetNextState(S, A)
+                R_remote = self.world.GetReward(S_remote)
+
+                self.assertTrue( np.all(S_local == S_remote) )
+                self.assertEqual(R_local, R_remote)
+
+        def test_RemoteErrors(self):
+            with self.assertRaises(ValueError):
+                self.world.GetNextState((3,4), 7)
+
+            # The connection should still work after an error
+            self.assertTrue( np.all(self.world.GetNextState((3,4), 0) == (3,5)) )
+
+        def test_StepManyIsBatched(self):
+            S_list = [ (ii % 7, ii % 9) for ii in range(100) ]
+            A_list = [ ii % 4 for ii in range(100) ]
+
+            results = self.world.StepMany(S_list, A_list)
+            for (S, A), (S_next, R) in zip(zip(S_list, A_list), results):
+                S_local = self.local.GetNextState(S, A)
+                self.assertTrue( np.all(S_local == S_next) )
+                self.assertEqual(self.local.GetReward(S_local), R)
+
+            self.assertEqual(self.world.calls_sent, 100)
+            self.assertEqual(self.world.batches_sent, 7)
+
+        def test_LargeBatches(self):
+            # Big batches back to back fill the pipe both ways, sending can't hold up the reader thread
+            self.world.max_batch = 5000
+
+            S_list = [ (ii % 7, ii % 9) for ii in range(50000) ]
+            A_list = [ ii % 4 for ii in range(50000) ]
+
+            results = self.world.StepMany(S_list, A_list)
+            self.assertEqual(len(results), 50000)
+            self.assertTrue( np.all(results[-1][0] == self.local.GetNextState(S_list[-1], A_list[-1])) )
+            self.assertEqual(self.world.batches_sent, 10)
+
+        def test_StepAsyncIsBatched(self):
+            async def StepAll():
+                return await asyncio.gather(*[ self.world.StepAsync((3,3), ii % 4) for ii in range(10) ])
+
+            results = asyncio.run(StepAll())
+            self.assertEqual(len(results), 10)
+            self.assertEqual(self.world.batches_sent, 1)
+
+        def test_Throughput(self):
+            S_list = [ (ii % 7, ii % 9) for ii in range(2000) ]
+            A_list = [ ii % 4 for ii in range(2000) ]
+
+            local_rate = MeasureStepThroughput(self.local, S_list, A_list)
+            remote_rate = MeasureStepThroughput(self.world, S_list, A_list)
+            INFO(f"In-process: {local_rate:.0f} steps/s, remote: {remote_rate:.0f} steps/s")
+            self.assertTrue(remote_rate > 0)
+
+    unittest.main()
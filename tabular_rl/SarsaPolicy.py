@@ -49,6 +49,10 @@ class SarsaPolicy(TabularPolicy):
 			selection = range(self._num_a)
 			DEBUG(f"Got selection {selection}")
 
+		# use the compiled table if the policy is frozen
+		elif self.IsFrozen():
+			selection = self.GetFrozenActions(S)
+
 		# get a set of actions tied for the max value for this state
 		else:
 			vals = self.vals[ToTuple(S)]
@@ -235,6 +239,25 @@ if __name__=="__main__":
 			self.assertAlmostEqual( self.policy.GetProbabilityOfAction((0,0), 0), (1-eps)/4)
 			self.assertAlmostEqual( self.policy.GetProbabilityOfAction((0,0), 3), (1-eps)/4)
 
+		def test_GetActionFrozen(self):
+			self.policy.epsilon = 1 # guarentee exploitation
+
+			self.policy.UpdateState( (0,0), 0, 100 )
+			self.policy.UpdateState( (0,0), 2, 100 )
+			self.policy.Freeze()
+
+			actions = np.array([self.policy.GetAction((0,0)) for _ in range(100)])
+			self.assertTrue( np.any(actions == 0) and np.any(actions == 2) ) # Ties are still broken randomly
+			self.assertFalse( np.any(actions == 1) or np.any(actions == 3) )
+
+			# Improving the policy should unfreeze it, (1,1) is pinned so the update always raises action 0
+			self.policy.UpdateState( (1,1), 0, 0 )
+			self.policy.Freeze()
+			pkt = ExpPacket([(0,0),(1,1)],[0, 0],[200])
+			self.policy.ImprovePolicy(pkt)
+			self.assertFalse( self.policy.IsFrozen() )
+			self.assertTrue( np.all([self.policy.GetAction((0,0)) == 0 for _ in range(100)]) )
+
 		def test_Packets(self):
 			self.assertTrue( (self.policy._req_S, self.policy._req_A, self.policy._req_R) == self.policy.PacketSizeReq() )
 
@@ -0,0 +1,691 @@
+# -*- coding: future_fstrings -*-
+
+import sys
+import time
+import heapq
+import warnings
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+from Policy import Policy
+
+import logging
+from logging import debug as DEBUG
+from logging import info as INFO
+from logging import warn as WARN
+from logging import error as ERROR
+from logging import critical as CRITICAL
+
+class TabularMDP(object):
+
+	"""
+	Holds a finite MDP as arrays, states are the raveled indices of the world_space.
+
+	Attributes:
+		P (csr_matrix): (states*actions, states) transition probabilities, row s*num_a + a holds P[s, a, :]
+		R (ndarray): (states, actions) expected reward of taking a in s
+		terminal (ndarray): (states,) True for terminal states, they have no transitions and value 0
+		s_dims (tuple): dims of the state space, for reshaping tables back into it
+	"""
+
+	def __init__(self, P, R, terminal=None, s_dims=None):
+		self.P = scipy.sparse.csr_matrix(P)
+		self.R = np.asarray(R, dtype=float)
+		self.num_s, self.num_a = self.R.shape
+		self.terminal = np.zeros(self.num_s, dtype=bool) if terminal is None else np.asarray(terminal, dtype=bool)
+		self.s_dims = (self.num_s,) if s_dims is None else tuple(int(d) for d in s_dims)
+
+		if self.P.shape != (self.num_s * self.num_a, self.num_s):
+			raise ValueError(f"P must have shape {(self.num_s * self.num_a, self.num_s)}, got {self.P.shape}")
+
+	# Returns the (states, states) transitions of taking the given action index in every state
+	def GetPolicyTransitions(self, policy):
+		return self.P[np.arange(self.num_s) * self.num_a + policy]
+
+	def GetPolicyRewards(self, policy):
+		return self.R[np.arange(self.num_s), policy]
+
+	# Returns P as a csc matrix, column s' lists every (s, a) row that can land in s'
+	def GetReverseIndex(self):
+		if not hasattr(self, "_P_rev"):
+			self._P_rev = self.P.tocsc()
+		return self._P_rev
+
+def BuildMDP(world, samples=1):
+	"""
+	Derives the MDP of a World by stepping every (state, action) pair
+
+	The reward of a step is world.GetReward of the state it lands in, like RLGame.
+	Stochastic worlds (eg. a DynamicNDWorld with a noise_func) are stepped samples times per
+	pair, and the empirical frequencies are used as the transition probabilities
+
+	Parameters:
+		world (World): any World, its world_space defines the states and actions
+		samples (int): number of times each (state, action) pair is stepped
+
+	Returns:
+		TabularMDP
+	"""
+	ws = world.world_space
+	s_dims = tuple(int(d) for d in ws.GetSDims())
+	num_s, num_a = int(np.prod(s_dims)), ws.GetNumA()
+
+	R = np.zeros((num_s, num_a))
+	terminal = np.zeros(num_s, dtype=bool)
+	rows, cols, probs = [], [], []
+
+	for s, S in enumerate(np.ndindex(*s_dims)):
+
+		if np.all(world.IsTerminal(np.array(S))):
+			terminal[s] = True
+			continue
+
+		for A in range(num_a):
+			for _ in range(samples):
+				S_next = world.GetNextState(np.array(S), A)
+				R[s, A] += world.GetReward(S_next) / samples
+
+				rows.append(s * num_a + A)
+				cols.append(int(np.ravel_multi_index(tuple(S_next), s_dims)))
+				probs.append(1 / samples)
+
+	# Duplicate (row, col) entries are summed, which merges repeated samples
+	P = scipy.sparse.csr_matrix((probs, (rows, cols)), shape=(num_s * num_a, num_s))
+	P.sum_duplicates()
+
+	DEBUG(f"Built MDP with {num_s} states, {num_a} actions and {P.nnz} transitions")
+	return TabularMDP(P, R, terminal, s_dims)
+
+class TabularDP(object):
+
+	"""
+	Plans over a TabularMDP with value iteration, policy iteration or modified policy iteration.
+
+	Jacobi sweeps update every state from the last sweep's values. Gauss-Seidel sweeps go through
+	the states in blocks of block_size, each block reading the values the earlier blocks just wrote
+	(block_size 1 is plain Gauss-Seidel). Prioritized sweeping backs up one state at a time,
+	always the one with the largest Bellman error. Every sweep appends its residual (max change
+	in V), wall time and the total backups so far to the telemetry.
+
+	Attributes:
+		gamma (float): discount factor
+		sweep_order (int): JACOBI or GAUSS_SEIDEL
+		block_size (int): states updated at once by a Gauss-Seidel sweep
+		thres (float): sweeps stop once V changes by at most thres
+		max_sweeps (int): max sweeps per call to ValueIteration or a policy evaluation
+	"""
+
+	JACOBI = 0
+	GAUSS_SEIDEL = 1
+	SWEEP_ORDERS = (JACOBI, GAUSS_SEIDEL)
+
+	def __init__(self, mdp, **kwargs):
+
+		self.mdp = mdp
+		self.gamma = kwargs.pop("discount_factor", 1)
+		self.sweep_order = kwargs.pop("sweep_order", TabularDP.JACOBI)
+		self.block_size = kwargs.pop("block_size", 256)
+		self.thres = kwargs.pop("thres", 1e-9)
+		self.max_sweeps = kwargs.pop("max_sweeps", 100000)
+
+		if len(kwargs) > 0:
+			raise KeyError(f"Received Unexpected keys in kwargs, {kwargs}")
+
+		if self.sweep_order not in TabularDP.SWEEP_ORDERS:
+			raise ValueError(f"sweep_order must be one of {TabularDP.SWEEP_ORDERS}, got {self.sweep_order}")
+
+		# Policy iteration starts from the greedy policy of V = 0, which never picks an action masked with -inf reward
+		self.V = np.zeros(mdp.num_s)
+		self.policy = self.GetGreedyPolicy()
+		self.backups = 0		# single state backups so far, a full sweep is one per non terminal state
+		self.telemetry = []		# (residual, seconds, backups) per sweep
+
+	def GetQ(self, V=None):
+		"""Returns the (states, actions) action values of V (terminal states are 0)"""
+		V = self.V if V is None else V
+		Q = self.mdp.R + self.gamma * (self.mdp.P @ V).reshape(self.mdp.num_s, self.mdp.num_a)
+		Q[self.mdp.terminal] = 0
+		return Q
+
+	def GetGreedyPolicy(self, V=None, policy=None, tol=1e-9):
+		"""Returns the greedy action per state, keeping the action in policy (if given) when it ties the best"""
+		Q = self.GetQ(V)
+		best = np.argmax(Q, axis=1)
+		if policy is None:
+			return best
+
+		states = np.arange(self.mdp.num_s)
+		return np.where(Q[states, policy] >= Q[states, best] - tol, policy, best)
+
+	def GetTelemetry(self):
+		"""Returns the residual, wall time and total backups of every sweep so far, as arrays"""
+		if len(self.telemetry) == 0:
+			return np.zeros(0), np.zeros(0), np.zeros(0, dtype=int)
+		residuals, seconds, backups = zip(*self.telemetry)
+		return np.array(residuals), np.array(seconds), np.array(backups)
+
+	def GetBackupsToResidual(self, residual):
+		"""Returns the backups it took to first get to the residual, None if it never did"""
+		residuals, _, backups = self.GetTelemetry()
+		reached = np.flatnonzero(residuals <= residual)
+		return int(backups[reached[0]]) if len(reached) > 0 else None
+
+	# Runs a single sweep, with the max over actions (policy None) or following the policy, returns the max change in V
+	def Sweep(self, policy=None):
+
+		start = time.perf_counter()
+		mdp = self.mdp
+
+		if self.sweep_order == TabularDP.JACOBI:
+			blocks = [ (0, mdp.num_s) ]
+		else:
+			blocks = [ (lo, min(lo + self.block_size, mdp.num_s)) for lo in range(0, mdp.num_s, self.block_size) ]
+
+		delta = 0
+		for lo, hi in blocks:
+			if policy is None:
+				rows = slice(lo * mdp.num_a, hi * mdp.num_a)
+				Q = mdp.R[lo:hi] + self.gamma * (mdp.P[rows] @ self.V).reshape(hi - lo, mdp.num_a)
+				v_new = np.max(Q, axis=1)
+			else:
+				rows = np.arange(lo, hi) * mdp.num_a + policy[lo:hi]
+				v_new = mdp.R[np.arange(lo, hi), policy[lo:hi]] + self.gamma * (mdp.P[rows] @ self.V)
+
+			v_new[mdp.terminal[lo:hi]] = 0
+			delta = max(delta, np.max(np.abs(v_new - self.V[lo:hi])))
+			self.V[lo:hi] = v_new
+
+		self.backups += np.count_nonzero(~mdp.terminal)
+		self.telemetry.append( (delta, time.perf_counter() - start, self.backups) )
+		return delta
+
+	def ValueIteration(self):
+		"""Sweeps until V changes by at most thres, returns V and the greedy policy"""
+		for _ in range(self.max_sweeps):
+			if self.Sweep() <= self.thres:
+				break
+		else:
+			WARN(f"Value iteration stopped after {self.max_sweeps} sweeps without converging")
+
+		self.policy = self.GetGreedyPolicy()
+		return self.V, self.policy
+
+	def ParallelValueIteration(self, workers=None, start_method=None):
+		"""
+		Value iteration with each sweep split across worker processes
+
+		The states are cut into one contiguous block per worker, balanced by their transitions.
+		V is double buffered in shared memory: every sweep, each worker reads one buffer and writes
+		its block of the other, then sends back its largest change. The parent waits for every
+		worker (the barrier), takes the max as the residual, and swaps the buffers. It's a Jacobi
+		sweep, so it gives the same V as ValueIteration with sweep_order JACOBI.
+
+		P and R are copied into shared memory once, workers map them instead of pickling them.
+
+		Parameters:
+			workers (int): number of worker processes, the cpu count by default
+			start_method (str): multiprocessing start method, the platform's default if None
+
+		Returns:
+			V, policy
+		"""
+		mdp = self.mdp
+		workers = min(workers or multiprocessing.cpu_count(), mdp.num_s)
+		ctx = multiprocessing.get_context(start_method)
+
+		P = mdp.P
+		arrays = dict(V=np.stack([ self.V, self.V ]), R=mdp.R, terminal=mdp.terminal,
+			data=P.data, indices=P.indices, indptr=P.indptr)
+
+		# Block boundaries, so each worker gets about the same number of nonzero transitions
+		state_nnz = np.append(P.indptr[np.arange(mdp.num_s) * mdp.num_a], P.nnz)	# nonzeros before each state's rows
+		bounds = np.searchsorted(state_nnz, np.linspace(0, P.nnz, workers + 1))
+		bounds[0], bounds[-1] = 0, mdp.num_s
+		bounds = np.unique(bounds)
+
+		shms, specs = [], {}
+		procs, conns = [], []
+		try:
+			for name, arr in arrays.items():
+				shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+				shms.append(shm)
+				np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+				specs[name] = (shm.name, arr.shape, arr.dtype.str)
+
+			for lo, hi in zip(bounds[:-1], bounds[1:]):
+				parent_conn, child_conn = ctx.Pipe()
+				proc = ctx.Process(target=_ParallelSweepWorker, args=(child_conn, specs, int(lo), int(hi), mdp.num_a, self.gamma), daemon=True)
+				proc.start()
+				procs.append(proc)
+				conns.append(parent_conn)
+
+			V = np.ndarray(arrays["V"].shape, dtype=float, buffer=shms[0].buf)
+			src = 0
+			for _ in range(self.max_sweeps):
+				start = time.perf_counter()
+				for conn in conns:
+					conn.send(src)
+				delta = max(conn.recv() for conn in conns)
+				src = 1 - src
+
+				self.backups += np.count_nonzero(~mdp.terminal)
+				self.telemetry.append( (delta, time.perf_counter() - start, self.backups) )
+				if delta <= self.thres:
+					break
+			else:
+				WARN(f"Parallel value iteration stopped after {self.max_sweeps} sweeps without converging")
+
+			self.V = V[src].copy()
+			del V
+
+		finally:
+			for conn in conns:
+				try:
+					conn.send(None)
+				except (BrokenPipeError, OSError):	# the worker already died
+					pass
+			for proc in procs:
+				proc.join()
+			for shm in shms:
+				shm.close()
+				shm.unlink()
+
+		self.policy = self.GetGreedyPolicy()
+		return self.V, self.policy
+
+	def PrioritizedSweeping(self, max_backups=None, report_every=None):
+		"""
+		Asynchronous value iteration, always backing up the state with the largest Bellman error
+
+		Q is kept for every (s, a), so backing up s is a max over its row. The change in V[s] is
+		pushed into the Q of every (s, a) that can land in s, read from the reverse index (column s
+		of P), which gives those predecessors' new Bellman errors exactly. States are popped from a
+		heap keyed by Bellman error, where an entry can overstate the state's error (it's re-keyed
+		when popped) but never understate it, so only errors that grow need a push.
+
+		Stops once every Bellman error is at most thres, or after max_backups backups. Appends the
+		max Bellman error to the telemetry every report_every backups (a full sweep's worth by default)
+
+		Returns:
+			V, policy
+		"""
+		mdp = self.mdp
+		P_rev = mdp.GetReverseIndex()
+		report_every = np.count_nonzero(~mdp.terminal) if report_every is None else report_every
+		start = time.perf_counter()
+
+		Q = self.GetQ()
+		Q_flat = Q.reshape(-1)	# view, row s*num_a + a of P is Q_flat[s*num_a + a]
+
+		def GetErrors(states):
+			errors = np.abs(np.max(Q[states], axis=1) - self.V[states])
+			errors[mdp.terminal[states]] = 0
+			return errors
+
+		# Returns the largest heap key held for each state, and a heap with an entry per state above thres
+		def BuildHeap(priority):
+			key = np.where(priority > self.thres, priority, 0)
+			heap = [ (-priority[s], s) for s in np.flatnonzero(key) ]
+			heapq.heapify(heap)
+			return key, heap
+
+		priority = GetErrors(np.arange(mdp.num_s))
+		key, heap = BuildHeap(priority)
+
+		backups = 0
+		while max_backups is None or backups < max_backups:
+
+			if len(heap) == 0:
+				# Resync Q, the incremental updates drift by rounding
+				Q[:] = self.GetQ()
+				priority = GetErrors(np.arange(mdp.num_s))
+				key, heap = BuildHeap(priority)
+				if len(heap) == 0:
+					break
+			elif len(heap) > 4 * mdp.num_s:
+				# Drop the stale entries, densely connected states push far more than they pop
+				key, heap = BuildHeap(priority)
+
+			k, s = heapq.heappop(heap)
+			k = -k
+
+			if priority[s] <= self.thres:
+				continue
+			if priority[s] < k:
+				# Stale, the error has dropped since the entry was pushed
+				key[s] = priority[s]
+				heapq.heappush(heap, (-priority[s], s))
+				continue
+
+			v_new = np.max(Q[s])
+			dV = v_new - self.V[s]
+			self.V[s] = v_new
+			priority[s] = 0
+			key[s] = 0
+
+			rows = P_rev.indices[P_rev.indptr[s]:P_rev.indptr[s+1]]
+			Q_flat[rows] += self.gamma * dV * P_rev.data[P_rev.indptr[s]:P_rev.indptr[s+1]]
+
+			preds = np.unique(rows // mdp.num_a)
+			priority[preds] = GetErrors(preds)
+			grown = preds[priority[preds] > np.maximum(key[preds], self.thres)]
+			key[grown] = priority[grown]
+			for p in grown:
+				heapq.heappush(heap, (-priority[p], p))
+
+			backups += 1
+			self.backups += 1
+			if backups % report_every == 0:
+				self.telemetry.append( (np.max(priority), time.perf_counter() - start, self.backups) )
+				start = time.perf_counter()
+
+		self.telemetry.append( (np.max(priority), time.perf_counter() - start, self.backups) )
+		self.policy = self.GetGreedyPolicy()
+		return self.V, self.policy
+
+	def EvaluatePolicy(self, policy, sweeps=None):
+		"""
+		Evaluates the policy in place of V
+
+		With sweeps None, solves (I - gamma P_pi) V = R_pi directly, falling back to sweeping until
+		thres if the system is singular (a policy that never terminates when gamma is 1).
+		Otherwise runs exactly that many sweeps (truncated evaluation)
+		"""
+		if sweeps is not None:
+			for _ in range(sweeps):
+				self.Sweep(policy)
+			return self.V
+
+		start = time.perf_counter()
+		P_pi = self.mdp.GetPolicyTransitions(policy)
+		R_pi = self.mdp.GetPolicyRewards(policy)
+		R_pi[self.mdp.terminal] = 0
+
+		A = (scipy.sparse.identity(self.mdp.num_s, format="csr") - self.gamma * P_pi).tocsc()
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore", scipy.sparse.linalg.MatrixRankWarning)
+			V = scipy.sparse.linalg.spsolve(A, R_pi)
+
+		if np.all(np.isfinite(V)):
+			residual = np.max(np.abs(V - self.V))
+			self.V = V
+			self.telemetry.append( (residual, time.perf_counter() - start, self.backups) )
+			return self.V
+
+		DEBUG("Policy evaluation system is singular, evaluating with sweeps")
+		for _ in range(self.max_sweeps):
+			if self.Sweep(policy) <= self.thres:
+				break
+
+		return self.V
+
+	def PolicyIteration(self, eval_sweeps=None, max_iterations=1000):
+		"""
+		Alternates policy evaluation and greedy improvement until the policy is stable
+
+		Parameters:
+			eval_sweeps (int): sweeps per evaluation for modified policy iteration, None to evaluate exactly
+
+		Returns:
+			V, policy
+		"""
+		for iteration in range(max_iterations):
+			self.EvaluatePolicy(self.policy, sweeps=eval_sweeps)
+			policy = self.GetGreedyPolicy(policy=self.policy)
+
+			# Truncated evaluation can leave a stable policy with unconverged values
+			stable = np.all(policy == self.policy)
+			self.policy = policy
+
+			if stable and (eval_sweeps is None or self.telemetry[-1][0] <= self.thres):
+				DEBUG(f"Policy stable after {iteration + 1} iterations")
+				break
+		else:
+			WARN(f"Policy iteration stopped after {max_iterations} iterations without a stable policy")
+
+		return self.V, self.policy
+
+	def ModifiedPolicyIteration(self, eval_sweeps=5, max_iterations=100000):
+		"""Policy iteration that evaluates each policy with only eval_sweeps sweeps"""
+		return self.PolicyIteration(eval_sweeps=eval_sweeps, max_iterations=max_iterations)
+
+	def GetStateValues(self):
+		"""Returns V shaped like the world_space"""
+		return self.V.reshape(self.mdp.s_dims)
+
+	def GetActionValues(self):
+		"""Returns Q shaped like the world_space plus an actions axis, as in a TabularPolicy with ACTION_STATE_VALUES"""
+		return self.GetQ().reshape(self.mdp.s_dims + (self.mdp.num_a,))
+
+	def LoadIntoPolicy(self, policy):
+		"""Copies the planned values into a TabularPolicy, V or Q depending on its value_type"""
+		if policy.type == Policy.ACTION_STATE_VALUES:
+			vals = self.GetActionValues()
+		else:
+			vals = self.GetStateValues()
+
+		if policy.vals.shape != vals.shape:
+			raise ValueError(f"Policy vals have shape {policy.vals.shape}, planned values have shape {vals.shape}")
+
+		policy.vals = vals.copy()
+		if hasattr(policy, "Unfreeze"):
+			policy.Unfreeze()
+
+		return policy
+
+# Runs in a worker process of ParallelValueIteration, sweeping the states [lo, hi) each time the parent sends
+# the V buffer to read, and sending back the largest change. None tells it to stop
+def _ParallelSweepWorker(conn, specs, lo, hi, num_a, gamma):
+
+	shms = { name: shared_memory.SharedMemory(name=spec[0]) for name, spec in specs.items() }
+	arr = { name: np.ndarray(spec[1], dtype=np.dtype(spec[2]), buffer=shms[name].buf) for name, spec in specs.items() }
+
+	# This block's rows of P, as views of the shared arrays
+	indptr = arr["indptr"][lo*num_a : hi*num_a + 1]
+	P = scipy.sparse.csr_matrix(
+		(arr["data"][indptr[0]:indptr[-1]], arr["indices"][indptr[0]:indptr[-1]], indptr - indptr[0]),
+		shape=((hi - lo) * num_a, arr["V"].shape[1]), copy=False)
+	R = arr["R"][lo:hi]
+	terminal = arr["terminal"][lo:hi]
+	V = arr["V"]
+
+	while True:
+		src = conn.recv()
+		if src is None:
+			break
+
+		Q = R + gamma * (P @ V[src]).reshape(hi - lo, num_a)
+		v_new = np.max(Q, axis=1)
+		v_new[terminal] = 0
+
+		# Written before replying, the parent's next sweep can't start until every block is in
+		V[1 - src, lo:hi] = v_new
+		conn.send(float(np.max(np.abs(v_new - V[src, lo:hi]))))
+
+	del P, R, terminal, V, arr
+	for shm in shms.values():
+		shm.close()
+	conn.close()
+
+def BenchmarkBackups(mdp, residuals, **kwargs):
+	"""
+	Prints how many backups Jacobi sweeps, Gauss-Seidel sweeps and prioritized sweeping take to
+	get to each residual, and their wall time to the smallest. kwargs are passed to TabularDP
+
+	A sweep's residual is the largest change it made, prioritized sweeping's is the largest Bellman error left
+	"""
+	thres = min(residuals)
+	runs = [
+		("Jacobi sweeps", dict(sweep_order=TabularDP.JACOBI), TabularDP.ValueIteration),
+		("Gauss-Seidel sweeps", dict(sweep_order=TabularDP.GAUSS_SEIDEL, block_size=1), TabularDP.ValueIteration),
+		("Prioritized sweeping", dict(), TabularDP.PrioritizedSweeping),
+	]
+
+	results = {}
+	for name, run_kwargs, method in runs:
+		dp = TabularDP(mdp, thres=thres, **run_kwargs, **kwargs)
+		start = time.perf_counter()
+		method(dp)
+		elapsed = time.perf_counter() - start
+
+		backups = [ dp.GetBackupsToResidual(residual) for residual in residuals ]
+		print(f"{name:>20}: {elapsed:7.2f}s, backups to residual " + ", ".join(f"{r:.0e}: {b}" for r, b in zip(residuals, backups)))
+		results[name] = backups
+
+	return results
+
+if __name__=="__main__":
+
+	import unittest
+	from collections import OrderedDict
+	from WorldSpace import WorldSpace
+	from DynamicNDWorld import DynamicNDWorld
+	from SarsaPolicy import SarsaPolicy
+
+	logging.getLogger().setLevel(logging.INFO)
+
+	class TestTabularDP(unittest.TestCase):
+
+		def setUp(self):
+			self.a_map = OrderedDict()
+			self.a_map['U'] = (0,1)
+			self.a_map['D'] = (0,-1)
+			self.a_map['R'] = (1,0)
+			self.a_map['L'] = (-1,0)
+
+			self.ws = WorldSpace((5,6), self.a_map)
+			self.world = DynamicNDWorld(self.ws, start_state=(0,0), goal_state=(4,5))
+			self.mdp = BuildMDP(self.world)
+
+		def test_BuildMDP(self):
+			self.assertEqual(self.mdp.P.shape, (30*4, 30))
+			self.assertTrue(self.mdp.terminal[np.ravel_multi_index((4,5), (5,6))])
+
+			# Every non terminal (s, a) lands somewhere with probability 1
+			row_sums = np.asarray(self.mdp.P.sum(axis=1)).ravel().reshape(30, 4)
+			self.assertTrue( np.allclose(row_sums[~self.mdp.terminal], 1) )
+
+			# Moving out of bounds costs OUT_OF_BOUND_REWARD and returns to start
+			s = np.ravel_multi_index((0,0), (5,6))
+			self.assertEqual(self.mdp.R[s, 1], DynamicNDWorld.OUT_OF_BOUND_REWARD)
+
+		def test_ValueIteration(self):
+			dp = TabularDP(self.mdp)
+			V, policy = dp.ValueIteration()
+
+			# Each step costs 1, so every state's value is minus its distance to the goal
+			S = np.array(list(np.ndindex(5,6)))
+			dist = np.abs(S - (4,5)).sum(axis=1)
+			self.assertTrue( np.allclose(V, -dist) )
+
+			residuals, seconds, backups = dp.GetTelemetry()
+			self.assertEqual(len(residuals), len(seconds))
+			self.assertEqual(backups[-1], len(residuals) * 29)
+			self.assertTrue(residuals[-1] <= dp.thres)
+
+		def test_SweepOrders(self):
+			jacobi = TabularDP(self.mdp, discount_factor=0.9)
+			gauss_seidel = TabularDP(self.mdp, discount_factor=0.9, sweep_order=TabularDP.GAUSS_SEIDEL, block_size=1)
+			jacobi.ValueIteration()
+			gauss_seidel.ValueIteration()
+
+			self.assertTrue( np.allclose(jacobi.V, gauss_seidel.V) )
+			self.assertTrue( len(gauss_seidel.telemetry) <= len(jacobi.telemetry) )
+
+			with self.assertRaises(ValueError):
+				TabularDP(self.mdp, sweep_order=5)
+			with self.assertRaises(KeyError):
+				TabularDP(self.mdp, bad_key=1)
+
+		def test_PolicyIteration(self):
+			vi = TabularDP(self.mdp, discount_factor=0.9)
+			pi = TabularDP(self.mdp, discount_factor=0.9)
+			mpi = TabularDP(self.mdp, discount_factor=0.9)
+
+			vi.ValueIteration()
+			pi.PolicyIteration()
+			mpi.ModifiedPolicyIteration(eval_sweeps=3)
+
+			self.assertTrue( np.allclose(vi.V, pi.V, atol=1e-6) )
+			self.assertTrue( np.allclose(vi.V, mpi.V, atol=1e-6) )
+
+			# Policy iteration needs far fewer evaluations than value iteration needs sweeps
+			self.assertTrue( len(pi.telemetry) < len(vi.telemetry) )
+
+		def test_PrioritizedSweeping(self):
+			vi = TabularDP(self.mdp, discount_factor=0.9)
+			ps = TabularDP(self.mdp, discount_factor=0.9)
+			vi.ValueIteration()
+			ps.PrioritizedSweeping()
+
+			self.assertTrue( np.allclose(vi.V, ps.V, atol=1e-8) )
+			self.assertTrue( np.all(ps.policy == vi.policy) )
+			self.assertTrue( ps.backups < vi.backups )
+			self.assertTrue( ps.GetBackupsToResidual(1e-6) <= vi.GetBackupsToResidual(1e-6) )
+
+			# Stopping early leaves the largest error in the telemetry
+			early = TabularDP(self.mdp, discount_factor=0.9)
+			early.PrioritizedSweeping(max_backups=10)
+			self.assertEqual(early.backups, 10)
+			self.assertTrue( early.telemetry[-1][0] > early.thres )
+
+		def test_ParallelValueIteration(self):
+			serial = TabularDP(self.mdp, discount_factor=0.9)
+			parallel = TabularDP(self.mdp, discount_factor=0.9)
+			serial.ValueIteration()
+			parallel.ParallelValueIteration(workers=3)
+
+			self.assertTrue( np.allclose(serial.V, parallel.V) )
+			self.assertTrue( np.all(serial.policy == parallel.policy) )
+			self.assertEqual( len(serial.telemetry), len(parallel.telemetry) )
+
+		def test_SingularEvaluation(self):
+			# Undiscounted, the first policy (mostly U) never reaches the goal, so it's evaluated with sweeps
+			vi = TabularDP(self.mdp)
+			dp = TabularDP(self.mdp, max_sweeps=50)
+			vi.ValueIteration()
+			dp.PolicyIteration(max_iterations=100)
+
+			self.assertTrue( np.allclose(dp.V, vi.V, atol=1e-6) )
+
+			# Ties between shortest paths can go either way, but every action picked has to be optimal
+			Q = vi.GetQ()
+			states = np.arange(self.mdp.num_s)
+			self.assertTrue( np.allclose(Q[states, dp.policy], np.max(Q, axis=1), atol=1e-6) )
+
+		def test_MaskedActions(self):
+			# Models mask invalid actions with -inf reward, here moving out of bounds
+			R = self.mdp.R.copy()
+			R[R == DynamicNDWorld.OUT_OF_BOUND_REWARD] = -np.inf
+			masked = TabularMDP(self.mdp.P, R, self.mdp.terminal, self.mdp.s_dims)
+
+			vi = TabularDP(masked, discount_factor=0.9)
+			vi.ValueIteration()
+			self.assertTrue( np.all(np.isfinite(vi.V)) )
+
+			for eval_sweeps in (None, 3):
+				pi = TabularDP(masked, discount_factor=0.9)
+				self.assertTrue( np.all(np.isfinite(masked.GetPolicyRewards(pi.policy))) )
+
+				with warnings.catch_warnings():
+					warnings.simplefilter("error")
+					pi.PolicyIteration(eval_sweeps=eval_sweeps)
+
+				self.assertTrue( np.allclose(pi.V, vi.V, atol=1e-6) )
+				self.assertTrue( np.all(np.isfinite(masked.GetPolicyRewards(pi.policy))) )
+
+		def test_LoadIntoPolicy(self):
+			dp = TabularDP(self.mdp)
+			dp.ValueIteration()
+
+			policy = SarsaPolicy(self.ws)
+			dp.LoadIntoPolicy(policy)
+			self.assertEqual(policy.vals.shape, (5,6,4))
+
+			# Greedy actions from the loaded values step towards the goal
+			self.assertIn( np.argmax(policy.vals[(2,2)]), (0,2) )
+
+	unittest.main()
@@ -3,7 +3,14 @@
 import sys
 import numpy as np
 
+# Python 3 has no separate long type
+try:
+	long
+except NameError:
+	long = int
+
 from Policy import Policy
+from TabularRLUtils import CompileGreedyTable, ToTuple
 
 import logging
 from logging import debug as DEBUG
@@ -25,6 +32,8 @@ class TabularPolicy(Policy):
 		else:
 			raise ValueError("kwarg value_type is invalid")
 
+		self._frozen = None
+
 	# Returns true if state is valid (enforces int/long for each dim in S)
 	def IsValidState(self, S):
 
@@ -47,8 +56,40 @@ class TabularPolicy(Policy):
 
 	# Updates the value at specified indices with val given
 	def UpdateStateVal(self, indices, val):
+		self.Unfreeze()
 		self.vals[tuple(indices)] = val
 
+	# Compiles the current action values into a greedy decision table, for policies that stop learning
+	def Freeze(self):
+		if self.type != Policy.ACTION_STATE_VALUES:
+			raise ValueError("Only policies with ACTION_STATE_VALUES can be frozen")
+
+		self._frozen = CompileGreedyTable(self.vals)
+		DEBUG("Froze greedy decision table")
+
+	# Drops the compiled table, must be called if vals changes outside of UpdateStateVal
+	def Unfreeze(self):
+		self._frozen = None
+
+	def IsFrozen(self):
+		return self._frozen is not None
+
+	# Returns the greedy action table (first tied action per state), None if not frozen
+	def GetFrozenTable(self):
+		if self._frozen is None:
+			return None
+		return self._frozen[0]
+
+	# Returns the actions tied for the max value in state S, from the frozen table
+	def GetFrozenActions(self, S):
+		best, has_tie, tie_mask = self._frozen
+		S = ToTuple(S)
+
+		if has_tie[S]:
+			return list(np.flatnonzero(tie_mask[S]))
+
+		return [best[S]]
+
 if __name__=="__main__":
 
 	import unittest
@@ -102,4 +143,29 @@ if __name__=="__main__":
 			self.tab_pol = TabularPolicy(self.ws, **self.p_kw)
 			self.assertTrue( np.all(self.tab_pol.vals.shape == np.append(self.ss, len(self.a_map)) ) )
 
+		# Test that freezing compiles the greedy actions, and updates invalidate it
+		def test_Freeze(self):
+
+			# Policies with only state values have nothing to freeze
+			with self.assertRaises(ValueError):
+				self.tab_pol.Freeze()
+
+			self.p_kw['value_type'] = Policy.ACTION_STATE_VALUES
+			self.tab_pol = TabularPolicy(self.ws, **self.p_kw)
+
+			self.tab_pol.Freeze()
+			self.assertTrue( self.tab_pol.IsFrozen() )
+			self.assertEqual( self.tab_pol.GetFrozenTable().dtype, np.uint8 )
+			self.assertTrue( np.all(self.tab_pol.GetFrozenTable() == np.argmax(self.tab_pol.vals, axis=-1)) )
+
+			# Updating a value should drop the frozen table
+			self.tab_pol.UpdateStateVal((2,3,1), 100)
+			self.assertFalse( self.tab_pol.IsFrozen() )
+
+			self.tab_pol.UpdateStateVal((2,3,3), 100)
+			self.tab_pol.Freeze()
+			self.assertEqual( self.tab_pol.GetFrozenActions((2,3)), [1,3] )
+			self.assertEqual( self.tab_pol.GetFrozenActions((2,3)), [1,3] )
+			self.assertEqual( len(self.tab_pol.GetFrozenActions((0,0))), 1 )
+
 	unittest.main()
@@ -30,4 +30,22 @@ def ToTuple(input_list):
 
     # If we get type error, just return the val without conversion
     except TypeError:
-        return input_list
\ No newline at end of file
+        return input_list
+
+def CompileGreedyTable(vals):
+    """
+    Compiles action values (last axis is actions) into a greedy decision table
+
+    Returns:
+        best (ndarray): first action tied for the max value per state (uint8, or uint16 for > 256 actions)
+        has_tie (ndarray): bool per state, True if more than one action is tied for the max
+        tie_mask (ndarray): bool per (state, action), True for every action tied for the max
+    """
+    vals = np.asarray(vals)
+    dtype = np.uint8 if vals.shape[-1] <= 2**8 else np.uint16
+
+    tie_mask = vals == np.max(vals, axis=-1, keepdims=True)
+    best = np.argmax(tie_mask, axis=-1).astype(dtype)
+    has_tie = np.count_nonzero(tie_mask, axis=-1) > 1
+
+    return best, has_tie, tie_mask
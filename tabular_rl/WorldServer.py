@@ -0,0 +1,101 @@
+# -*- coding: future_fstrings -*-
+
+import sys
+import multiprocessing
+from multiprocessing.connection import Listener
+
+import logging
+from logging import debug as DEBUG
+from logging import info as INFO
+from logging import warn as WARN
+from logging import error as ERROR
+from logging import critical as CRITICAL
+
+"""
+Serves any World over a persistent multiprocessing connection (pipe or socket)
+Each message from the client is a batch of (op, args) calls, which are run in order
+on the wrapped world, and answered with one batch of (status, value) results
+Running the calls in order keeps worlds with per-step flags (DynamicNDWorld) consistent
+"""
+class WorldServer(object):
+
+    OPS = ('GetNextState', 'GetReward', 'IsTerminal', 'Step')
+
+    OK = 0
+    ERR = 1
+
+    def __init__(self, world):
+        self.world = world
+        self.batches_served = 0
+        self.calls_served = 0
+
+    # Returns the next state and its reward in a single call
+    def Step(self, S, A):
+        S_next = self.world.GetNextState(S, A)
+        return S_next, self.world.GetReward(S_next)
+
+    # Runs every call in the batch, in order, and returns a list of (status, value)
+    def HandleBatch(self, batch):
+        results = []
+        for op, args in batch:
+            try:
+                if op not in WorldServer.OPS:
+                    raise ValueError(f"Unknown op [{op}], must be one of {WorldServer.OPS}")
+                elif op == 'Step':
+                    results.append( (WorldServer.OK, self.Step(*args)) )
+                else:
+                    results.append( (WorldServer.OK, getattr(self.world, op)(*args)) )
+            except Exception as e:
+                results.append( (WorldServer.ERR, e) )
+
+        self.batches_served += 1
+        self.calls_served += len(batch)
+        return results
+
+    # Serves a single connection until the client closes it (or sends None)
+    def ServeConnection(self, conn):
+        while True:
+            try:
+                batch = conn.recv()
+            except EOFError:
+                break
+
+            if batch is None:
+                break
+
+            conn.send(self.HandleBatch(batch))
+
+        conn.close()
+        INFO(f"Client disconnected after {self.batches_served} batches, {self.calls_served} calls")
+
+    # Accepts clients on the listener one after another, forever (or until max_clients)
+    def ServeListener(self, listener, max_clients=None):
+        clients = 0
+        while max_clients is None or clients < max_clients:
+            conn = listener.accept()
+            self.ServeConnection(conn)
+            clients += 1
+
+        listener.close()
+
+# Starts a WorldServer for the world in a new process, returns (process, address)
+# Uses the fork start method so worlds holding lambdas don't need to be pickled
+def StartWorldServer(world, address=None, authkey=None, max_clients=1):
+    ctx = multiprocessing.get_context('fork')
+    addr_recv, addr_send = ctx.Pipe(duplex=False)
+
+    proc = ctx.Process(target=_RunWorldServer, args=(world, address, authkey, max_clients, addr_send))
+    proc.daemon = True
+    proc.start()
+
+    # The listener is created in the child (closing it in the parent would unlink unix sockets)
+    address = addr_recv.recv()
+    addr_recv.close()
+    return proc, address
+
+def _RunWorldServer(world, address, authkey, max_clients, addr_send):
+    listener = Listener(address, authkey=authkey)
+    addr_send.send(listener.address)
+    addr_send.close()
+
+    WorldServer(world).ServeListener(listener, max_clients)
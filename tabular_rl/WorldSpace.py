@@ -1,6 +1,12 @@
 # -*- coding: future_fstrings -*-
 import numpy as np
 
+# Python 3 has no separate long type
+try:
+    long
+except NameError:
+    long = int
+
 import logging
 from logging import debug as DEBUG
 from logging import info as INFO